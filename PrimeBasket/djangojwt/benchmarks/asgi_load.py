@@ -0,0 +1,180 @@
+"""
+Throughput and tail latency of the shop API under WSGI and ASGI.
+
+Each mode runs in its own process against the same catalog and drives the
+project's application object in-process with ``--concurrency`` requests
+in flight: a thread pool calling the WSGI app, or asyncio tasks calling
+the ASGI app. There is no socket in between, so the numbers compare the
+request handling itself; a real server adds roughly the same overhead to
+both. Modes:
+
+    wsgi        WSGI handler, sync DRF views (shop.urls)
+    asgi-sync   ASGI handler, sync DRF views run through sync_to_async
+    asgi        ASGI handler, async views (shop.async_urls)
+
+The catalog response cache is disabled so every request reaches the
+database. SQLite allows one writer at a time, so cart writes at high
+concurrency can time out on the database lock; those show up as 5xx:
+
+    python -m benchmarks.asgi_load --products 100000 --concurrency 100 --db /tmp/bench-100k.sqlite3
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import WORDS, percentile, populate_catalog, request_headers, setup_django, wsgi_request
+
+MODES = ('wsgi', 'asgi-sync', 'asgi')
+SORTS = ('', 'price_asc', 'price_desc', 'rating_desc')
+USERNAME = 'bench-load'
+
+
+def build_requests(count, max_product_id, cart_ratio, token, seed=0):
+    """A reproducible mix of listing, detail, search and cart requests."""
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < cart_ratio:
+            body = json.dumps({'product_id': rng.randint(1, max_product_id)}).encode()
+            requests.append(('POST', '/api/shop/cart/add/', '', body, token))
+        elif roll < 0.55:
+            query = f'sort={rng.choice(SORTS)}&page_size=50'
+            if rng.random() < 0.5:
+                query += '&category=beverages'
+            requests.append(('GET', '/api/shop/products/', query, b'', None))
+        elif roll < 0.95:
+            requests.append(('GET', f'/api/shop/products/{rng.randint(1, max_product_id)}/', '', b'', None))
+        else:
+            # Full-text queries over the synthetic vocabulary match most of
+            # the catalog and are far slower than the rest, so keep them rare.
+            requests.append(('GET', '/api/shop/search/', f'q={rng.choice(WORDS)}', b'', None))
+    return requests
+
+
+def run_wsgi(requests, concurrency):
+    from django.core.wsgi import get_wsgi_application
+
+    application = get_wsgi_application()
+
+    def call(request):
+        return wsgi_request(application, *request)
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        started = time.perf_counter()
+        results = list(pool.map(call, requests))
+    return results, time.perf_counter() - started
+
+
+def run_asgi(requests, concurrency):
+    from django.core.asgi import get_asgi_application
+
+    application = get_asgi_application()
+
+    async def call(request, semaphore):
+        method, path, query, body, token = request
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'headers': request_headers(body, token), 'client': ('127.0.0.1', 0), 'server': ('bench', 80),
+        }
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        status = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # Never disconnect; Django cancels this wait once it has responded.
+            return await asyncio.Future()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        async with semaphore:
+            started = time.perf_counter()
+            await application(scope, receive, send)
+            return (time.perf_counter() - started) * 1000, status[0]
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+        started = time.perf_counter()
+        results = await asyncio.gather(*(call(request, semaphore) for request in requests))
+        return results, time.perf_counter() - started
+
+    return asyncio.run(main())
+
+
+def worker(args):
+    setup_django(
+        args.db,
+        SHOP_ASYNC_VIEWS=args.worker == 'asgi',
+        CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'catalog': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+        },
+    )
+    from django.contrib.auth.models import User
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from shop.models import Product
+
+    user = User.objects.get(username=USERNAME)
+    token = str(AccessToken.for_user(user))
+    max_product_id = Product.objects.order_by('-id').values_list('id', flat=True).first()
+    requests = build_requests(args.requests, max_product_id, args.cart_ratio, token)
+    run = run_wsgi if args.worker == 'wsgi' else run_asgi
+
+    run(requests[:args.concurrency], args.concurrency)  # warm up
+    results, elapsed = run(requests, args.concurrency)
+    latencies = [latency for latency, _ in results]
+    errors = sum(1 for _, status in results if status >= 500)
+    print(json.dumps({
+        'mode': args.worker, 'rps': len(results) / elapsed, 'errors': errors,
+        'p50': percentile(latencies, 0.5), 'p99': percentile(latencies, 0.99),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--cart-ratio', type=float, default=0.05, help='share of requests that add to the cart')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--db', help='SQLite file to use (kept between runs)')
+    parser.add_argument('--worker', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return worker(args)
+
+    db_path = setup_django(args.db)
+    populate_catalog(args.products)
+
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+
+    call_command('rebuild_search_index', verbosity=0)
+    User.objects.get_or_create(username=USERNAME)
+
+    print(f'{args.requests} requests, {args.concurrency} in flight, {args.cart_ratio:.0%} cart writes')
+    print(f'{"mode":<10} {"req/s":>8} {"p50":>10} {"p99":>10} {"5xx":>5}')
+    for mode in args.modes:
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.asgi_load', '--worker', mode, '--db', str(db_path),
+             '--requests', str(args.requests), '--concurrency', str(args.concurrency),
+             '--cart-ratio', str(args.cart_ratio)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f'{mode:<10} {result["rps"]:>8.0f} {result["p50"]:>7.1f} ms {result["p99"]:>7.1f} ms {result["errors"]:>5}')
+
+
+if __name__ == '__main__':
+    main()
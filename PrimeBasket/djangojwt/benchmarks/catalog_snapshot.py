@@ -0,0 +1,90 @@
+"""
+/api/shop/products/ served from the ORM and from the catalog snapshot.
+
+Exports the snapshot of a synthetic catalog, then times every listing
+case of ``benchmarks.product_listing`` on its first page and on a page
+``--depth`` rows in (reached through a cursor), with ``SHOP_SNAPSHOT_READS``
+off and on. The catalog response cache is disabled:
+
+    python -m benchmarks.catalog_snapshot --products 1000000 --db /tmp/bench-1m.sqlite3
+"""
+import argparse
+import tempfile
+from pathlib import Path
+
+from benchmarks.common import percentile, populate_catalog, setup_django, timed
+from benchmarks.product_listing import CASES
+
+
+def deep_cursor(params, depth):
+    """A cursor starting ``depth`` rows into the listing described by ``params``."""
+    from django.db.models import Value
+    from django.db.models.functions import Lower
+
+    from shop.models import Product
+    from shop.pagination import encode_cursor
+    from shop.views import PRODUCT_SORTS
+
+    sort = params.get('sort', '')
+    field, descending, nullable = PRODUCT_SORTS[sort]
+    products = Product.objects.all()
+    if params.get('category'):
+        products = products.filter(category_lower=Lower(Value(params['category'])))
+    if params.get('brand'):
+        products = products.filter(brand_lower=Lower(Value(params['brand'])))
+    if nullable:
+        products = products.filter(**{f'{field}__isnull': False})
+    prefix = '-' if descending else ''
+    row = products.order_by(*dict.fromkeys((f'{prefix}{field}', f'{prefix}id'))).values(field, 'id')[depth:depth + 1]
+    row = next(iter(row), None)
+    return encode_cursor(sort or 'id', row[field], row['id']) if row else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=200_000)
+    parser.add_argument('--db', default=None, help="SQLite file to (re)use; a temporary file by default")
+    parser.add_argument('--depth', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args(argv)
+
+    snapshot_dir = Path(tempfile.mkdtemp(prefix='primebasket-snapshot-')) / 'catalog'
+    setup_django(
+        args.db, SHOP_SNAPSHOT_DIR=snapshot_dir,
+        CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'catalog': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+        },
+    )
+    populate_catalog(args.products)
+
+    from django.test import Client, override_settings
+
+    from shop.snapshot import export_catalog_snapshot
+
+    exported = timed(lambda: export_catalog_snapshot(), 1)[0]
+    size = sum(path.stat().st_size for path in snapshot_dir.iterdir())
+    print(f"Exported {args.products} products in {exported:.0f} ms, {size / 2**20:.1f} MiB on disk")
+
+    client = Client()
+    print(f"{'case':<62} {'page':>5} {'orm p50':>8} {'p95':>7} {'snap p50':>9} {'p95':>7}")
+    for params in CASES:
+        label = '&'.join(f'{key}={value}' for key, value in params.items()) or '(no parameters)'
+        for page, cursor in (('first', None), ('deep', deep_cursor(params, args.depth))):
+            if page == 'deep' and cursor is None:
+                continue
+            query = dict(params, page_size=50, **({'cursor': cursor} if cursor else {}))
+            results = []
+            for enabled in (False, True):
+                with override_settings(SHOP_SNAPSHOT_READS=enabled):
+                    results.append(timed(lambda: client.get('/api/shop/products/', query), args.repeat))
+            orm, snapshot = results
+            print(
+                f"{label:<62} {page:>5} {percentile(orm, .5):8.2f} {percentile(orm, .95):7.2f} "
+                f"{percentile(snapshot, .5):9.2f} {percentile(snapshot, .95):7.2f}"
+            )
+    print("All times in milliseconds.")
+
+
+if __name__ == '__main__':
+    main()
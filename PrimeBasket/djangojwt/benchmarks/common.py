@@ -0,0 +1,159 @@
+"""
+Helpers shared by the benchmark scripts: Django set-up against a scratch
+SQLite database and a synthetic catalog generator.
+"""
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+CATEGORIES = (
+    'Beauty & Hygiene', 'Beverages', 'Bakery, Cakes & Dairy', 'Cleaning & Household',
+    'Eggs, Meat & Fish', 'Foodgrains, Oil & Masala', 'Fruits & Vegetables', 'Gourmet & World Food',
+    'Kitchen, Garden & Pets', 'Snacks & Branded Foods', 'Baby Care', 'Health & Wellness',
+)
+WORDS = (
+    'organic', 'fresh', 'premium', 'classic', 'natural', 'instant', 'roasted', 'herbal', 'spicy', 'sweet',
+    'green', 'tea', 'coffee', 'rice', 'flour', 'oil', 'soap', 'shampoo', 'juice', 'honey', 'biscuits',
+    'chocolate', 'masala', 'ghee', 'butter', 'cheese', 'paneer', 'noodles', 'detergent', 'cream',
+)
+
+
+def setup_django(db_path=None, settings_module='djangojwt.settings', **overrides):
+    """
+    Configure Django against ``db_path`` (a new temporary file by default)
+    and apply migrations. ``overrides`` replace settings before Django is
+    set up (``CACHES`` only replaces the aliases it names). Returns the
+    database path.
+    """
+    if str(PROJECT_DIR) not in sys.path:
+        sys.path.insert(0, str(PROJECT_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    if db_path is None:
+        handle, db_path = tempfile.mkstemp(prefix='primebasket-bench-', suffix='.sqlite3')
+        os.close(handle)
+
+    import importlib
+    settings_module = importlib.import_module(os.environ['DJANGO_SETTINGS_MODULE'])
+    settings_module.DATABASES['default']['NAME'] = str(db_path)
+    settings_module.ALLOWED_HOSTS = ['*']
+    settings_module.DEBUG = False
+    for name, value in overrides.items():
+        if name == 'CACHES':
+            # Aliases left out keep the project's caches (e.g. 'hashing').
+            value = {**settings_module.CACHES, **value}
+        setattr(settings_module, name, value)
+
+    import django
+    from django.core.management import call_command
+    django.setup()
+    call_command('migrate', verbosity=0)
+    return db_path
+
+
+def populate_catalog(count, seed=0, batch_size=20000, brands=400, stdout=sys.stdout):
+    """
+    Top the Product table up to ``count`` synthetic rows with raw batched
+    INSERTs. Existing rows are kept, so a database file can be reused
+    between runs. The search index is not populated; call
+    ``rebuild_search_index`` when a benchmark needs it.
+    """
+    from django.db import connection, transaction
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) FROM shop_product')
+        existing = cursor.fetchone()[0]
+    if existing >= count:
+        return existing
+
+    rng = random.Random(seed + existing)
+    brand_names = [f'Brand {index:04d}' for index in range(brands)]
+    sql = (
+        'INSERT INTO shop_product (product, category, sub_category, brand, type, description, '
+        'market_price, sale_price, rating) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)'
+    )
+    started = time.perf_counter()
+    remaining = count - existing
+    while remaining:
+        size = min(batch_size, remaining)
+        rows = []
+        for _ in range(size):
+            name = ' '.join(rng.sample(WORDS, 3)).title()
+            market_price = round(rng.uniform(10, 2000), 2)
+            sale_price = round(market_price * rng.uniform(0.5, 1.0), 2)
+            rating = round(rng.uniform(1, 5), 1) if rng.random() > 0.1 else None
+            rows.append((
+                name, rng.choice(CATEGORIES), None, rng.choice(brand_names), None,
+                f'{name} - ' + ' '.join(rng.choices(WORDS, k=12)),
+                market_price, sale_price, rating,
+            ))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+        remaining -= size
+        if stdout is not None:
+            done = count - remaining
+            stdout.write(f'\r  generated {done:,}/{count:,} products ({(done - existing) / (time.perf_counter() - started):,.0f}/s)')
+            stdout.flush()
+    if stdout is not None:
+        stdout.write('\n')
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return count
+
+
+def timed(function, repeat):
+    """Run ``function`` ``repeat`` times and return the timings in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def request_headers(body=b'', token=None):
+    """ASGI-style header pairs for a benchmark request."""
+    headers = [(b'host', b'bench'), (b'accept', b'application/json')]
+    if body:
+        headers += [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    if token:
+        headers.append((b'authorization', f'Bearer {token}'.encode()))
+    return headers
+
+
+def wsgi_request(application, method, path, query='', body=b'', token=None):
+    """
+    Call a WSGI ``application`` in-process; returns ``(milliseconds,
+    status code)``.
+    """
+    environ = {
+        'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'bench', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.input': io.BytesIO(body), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+    for name, value in request_headers(body, token):
+        name = name.decode().upper().replace('-', '_')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+        environ[key] = value.decode()
+    status = []
+    started = time.perf_counter()
+    chunks = application(environ, lambda code, headers, exc_info=None: status.append(code))
+    b''.join(chunks)
+    if hasattr(chunks, 'close'):
+        chunks.close()
+    return (time.perf_counter() - started) * 1000, int(status[0].split()[0])
+
@@ -0,0 +1,75 @@
+"""
+Overhead of the request instrumentation (djangojwt/instrumentation.py).
+
+Times a few endpoints through the Django test client with
+``InstrumentationMiddleware`` in and out of MIDDLEWARE, alternating
+between the two so both see the same machine state. The catalog response
+cache is disabled so every request runs its queries:
+
+    python -m benchmarks.instrumentation --products 50000 --repeat 500
+"""
+import argparse
+
+from benchmarks.common import percentile, populate_catalog, setup_django, timed
+
+MIDDLEWARE_PATH = 'djangojwt.instrumentation.InstrumentationMiddleware'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=50_000)
+    parser.add_argument('--db', default=None, help="SQLite file to (re)use; a temporary file by default")
+    parser.add_argument('--repeat', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    setup_django(
+        args.db, INSTRUMENTATION_SLOW_REQUEST_SECONDS=None,
+        CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'catalog': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+        },
+    )
+    populate_catalog(args.products)
+
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.test import Client, override_settings
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from shop.models import CartItem, Product
+
+    user, _ = User.objects.get_or_create(username='bench-instrumentation')
+    product_ids = list(Product.objects.order_by('id').values_list('id', flat=True)[:20])
+    CartItem.objects.filter(user=user).delete()
+    CartItem.objects.bulk_create(CartItem(user=user, product_id=pk, quantity=1) for pk in product_ids)
+    token = f'Bearer {AccessToken.for_user(user)}'
+
+    cases = [
+        ('GET /api/shop/products/', lambda client: client.get('/api/shop/products/', {'page_size': 50})),
+        ('GET /api/shop/products/<id>/', lambda client: client.get(f'/api/shop/products/{product_ids[0]}/')),
+        ('POST /api/shop/cart/update/ (20 items)', lambda client: client.post(
+            '/api/shop/cart/update/', {'product_id': product_ids[0], 'quantity': 1},
+            content_type='application/json', HTTP_AUTHORIZATION=token,
+        )),
+    ]
+    without = [path for path in settings.MIDDLEWARE if path != MIDDLEWARE_PATH]
+    clients = {}
+    for enabled, middleware in ((True, [MIDDLEWARE_PATH, *without]), (False, without)):
+        with override_settings(MIDDLEWARE=middleware):
+            client = clients[enabled] = Client()
+            client.get('/api/shop/products/')  # loads the middleware chain
+
+    print(f"{'case':<42} {'off p50':>8} {'on p50':>8} {'overhead':>9}")
+    for label, request in cases:
+        timings = {True: [], False: []}
+        for _ in range(args.rounds):
+            for enabled in (False, True):
+                timings[enabled] += timed(lambda: request(clients[enabled]), args.repeat // args.rounds)
+        off, on = percentile(timings[False], .5), percentile(timings[True], .5)
+        print(f"{label:<42} {off:8.3f} {on:8.3f} {(on - off) * 1000:7.0f}us")
+    print("Times in milliseconds; overhead is the difference of the medians.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Catalog latency during a login storm.
+
+Catalog threads request product listings and details while storm threads
+post valid credentials to /api/auth/login/ as fast as they can, all
+against the project's WSGI application in-process. Each scenario runs in
+its own process:
+
+    idle      catalog traffic only
+    inline    storm, no limit on hashing (PASSWORD_HASHING_CONCURRENCY = 0)
+    limited   storm, hashing within the global limit (project settings)
+
+Login throttles are disabled so the storm is not simply turned away:
+
+    python -m benchmarks.login_storm --storm-threads 16 --seconds 15
+"""
+import argparse
+import json
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+from benchmarks.common import percentile, populate_catalog, setup_django, wsgi_request
+
+SCENARIOS = ('idle', 'inline', 'limited')
+USERNAME = 'bench-storm'
+PASSWORD = 'storm-password-1'
+
+
+def worker(args):
+    overrides = {
+        'REST_FRAMEWORK': {
+            'DEFAULT_AUTHENTICATION_CLASSES': ('myapp.authentication.JWTAuthentication',),
+            'DEFAULT_THROTTLE_RATES': {'login_ip': None, 'login_username': None},
+        },
+        'CACHES': {
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'catalog': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+        },
+    }
+    if args.worker == 'inline':
+        overrides['PASSWORD_HASHING_CONCURRENCY'] = 0
+    setup_django(args.db, **overrides)
+
+    from django.core.wsgi import get_wsgi_application
+
+    from shop.models import Product
+
+    application = get_wsgi_application()
+    max_product_id = Product.objects.order_by('-id').values_list('id', flat=True).first()
+    stop = threading.Event()
+    latencies = []
+    logins = Counter()
+    body = json.dumps({'username': USERNAME, 'password': PASSWORD}).encode()
+
+    def catalog(seed):
+        rng = random.Random(seed)
+        while not stop.is_set():
+            if rng.random() < 0.5:
+                request = ('GET', '/api/shop/products/', 'sort=price_asc&page_size=50')
+            else:
+                request = ('GET', f'/api/shop/products/{rng.randint(1, max_product_id)}/', '')
+            latencies.append(wsgi_request(application, *request)[0])
+
+    def storm():
+        while not stop.is_set():
+            logins[wsgi_request(application, 'POST', '/api/auth/login/', '', body)[1]] += 1
+
+    threads = [threading.Thread(target=catalog, args=(seed,)) for seed in range(args.catalog_threads)]
+    if args.worker != 'idle':
+        threads += [threading.Thread(target=storm) for _ in range(args.storm_threads)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    print(json.dumps({
+        'scenario': args.worker, 'catalog_rps': len(latencies) / args.seconds,
+        'p50': percentile(latencies, 0.5), 'p99': percentile(latencies, 0.99),
+        'logins': {str(status): count for status, count in sorted(logins.items())},
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--catalog-threads', type=int, default=4)
+    parser.add_argument('--storm-threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=15)
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--db', help='SQLite file to use (kept between runs)')
+    parser.add_argument('--worker', choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return worker(args)
+
+    db_path = setup_django(args.db)
+    populate_catalog(args.products)
+
+    from django.contrib.auth.models import User
+
+    user, _ = User.objects.get_or_create(username=USERNAME)
+    user.set_password(PASSWORD)
+    user.save()
+
+    print(f'{args.catalog_threads} catalog threads, {args.storm_threads} login threads, {args.seconds:g}s each')
+    print(f'{"scenario":<9} {"catalog req/s":>13} {"p50":>9} {"p99":>10}  logins by status')
+    for scenario in args.scenarios:
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.login_storm', '--worker', scenario, '--db', str(db_path),
+             '--catalog-threads', str(args.catalog_threads), '--storm-threads', str(args.storm_threads),
+             '--seconds', str(args.seconds)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        logins = ', '.join(f'{status}: {count}' for status, count in result['logins'].items()) or '-'
+        print(f'{scenario:<9} {result["catalog_rps"]:>13.0f} {result["p50"]:>6.1f} ms {result["p99"]:>7.1f} ms  {logins}')
+
+
+if __name__ == '__main__':
+    main()
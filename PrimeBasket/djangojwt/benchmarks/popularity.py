@@ -0,0 +1,85 @@
+"""
+Overhead of the trending counters (shop/popularity.py).
+
+Times the endpoints that count (product detail, served from the catalog
+cache and from the database, and add to cart) through the Django test
+client with ``SHOP_TRENDING`` on and off, alternating between the two so
+both see the same machine state. The background flush is not running
+during the timings. It is timed separately, writing counts for
+``--flush-products`` products in one go:
+
+    python -m benchmarks.popularity --products 50000 --repeat 1000
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import percentile, populate_catalog, setup_django, timed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=50_000)
+    parser.add_argument('--db', default=None, help="SQLite file to (re)use; a temporary file by default")
+    parser.add_argument('--repeat', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--flush-products', type=int, default=10_000)
+    args = parser.parse_args(argv)
+
+    setup_django(
+        args.db, INSTRUMENTATION_SLOW_REQUEST_SECONDS=None,
+        # Long enough that the flush thread never runs during the timings.
+        SHOP_TRENDING_FLUSH_INTERVAL=3600, SHOP_TRENDING_MAX_PENDING=10**9,
+        CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'catalog': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench-popularity'},
+        },
+    )
+    populate_catalog(args.products)
+
+    from django.contrib.auth.models import User
+    from django.test import Client, override_settings
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from shop.models import CartItem, Product
+    from shop.popularity import get_counter, write_counts
+
+    user, _ = User.objects.get_or_create(username='bench-popularity')
+    product_ids = list(Product.objects.order_by('id').values_list('id', flat=True)[:args.products])
+    CartItem.objects.filter(user=user).delete()
+    token = f'Bearer {AccessToken.for_user(user)}'
+    rng = random.Random(0)
+    client = Client()
+    cached_id = product_ids[0]
+
+    cases = [
+        ('GET /api/shop/products/<id>/ (cached)', lambda: client.get(f'/api/shop/products/{cached_id}/')),
+        ('GET /api/shop/products/<id>/', lambda: client.get(f'/api/shop/products/{rng.choice(product_ids)}/')),
+        ('POST /api/shop/cart/add/', lambda: client.post(
+            '/api/shop/cart/add/', {'product_id': rng.choice(product_ids[:20])},
+            content_type='application/json', HTTP_AUTHORIZATION=token,
+        )),
+    ]
+    client.get(f'/api/shop/products/{cached_id}/')
+
+    print(f"{'case':<40} {'off req/s':>10} {'on req/s':>10} {'overhead':>9}")
+    for label, request in cases:
+        timings = {True: [], False: []}
+        for _ in range(args.rounds):
+            for enabled in (False, True):
+                with override_settings(SHOP_TRENDING=enabled):
+                    timings[enabled] += timed(request, args.repeat // args.rounds)
+        off, on = 1000 / percentile(timings[False], .5), 1000 / percentile(timings[True], .5)
+        print(f"{label:<40} {off:10.0f} {on:10.0f} {(off - on) / off:8.1%}")
+    print("Requests/s from the median time of one request; overhead is the lost throughput.")
+    get_counter().drain()
+
+    counts = {pk: float(rng.randint(1, 20)) for pk in rng.sample(product_ids, min(args.flush_products, len(product_ids)))}
+    started = time.perf_counter()
+    written = write_counts(counts)
+    elapsed = time.perf_counter() - started
+    print(f"Flush of {written:,} products: {elapsed * 1000:.0f}ms ({written / elapsed:,.0f} products/s)")
+
+
+if __name__ == '__main__':
+    main()
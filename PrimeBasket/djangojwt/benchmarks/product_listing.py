@@ -0,0 +1,105 @@
+"""
+Query plans and latency of /api/shop/products/ on a large catalog.
+
+For every filter + sort combination the endpoint supports, prints the
+SQLite query plan and the median/p95 latency of the old ``iexact`` query
+next to the indexed ``*_lower`` query, plus the latency of the whole
+request:
+
+    python -m benchmarks.product_listing --products 1000000 --db /tmp/bench-1m.sqlite3
+
+Reusing ``--db`` keeps the generated catalog between runs.
+"""
+import argparse
+
+from benchmarks.common import percentile, populate_catalog, setup_django, timed
+
+CASES = [
+    {},
+    {'sort': 'price_asc'},
+    {'sort': 'rating_desc'},
+    {'category': 'beverages'},
+    {'category': 'beverages', 'sort': 'price_desc'},
+    {'category': 'beverages', 'sort': 'rating_desc'},
+    {'brand': 'brand 0042', 'sort': 'price_asc'},
+    {'brand': 'brand 0042', 'sort': 'rating_desc'},
+    {'category': 'beverages', 'brand': 'brand 0042'},
+    {'category': 'beverages', 'brand': 'brand 0042', 'sort': 'price_asc'},
+    {'category': 'beverages', 'brand': 'brand 0042', 'sort': 'rating_desc'},
+]
+
+LEGACY_ORDERINGS = {'price_asc': ('sale_price',), 'price_desc': ('-sale_price',), 'rating_desc': ('-rating',)}
+
+
+def legacy_queryset(params):
+    """The query get_products issued before the *_lower columns existed."""
+    from shop.models import Product
+
+    products = Product.objects.all()
+    if params.get('category'):
+        products = products.filter(category__iexact=params['category'])
+    if params.get('brand'):
+        products = products.filter(brand__iexact=params['brand'])
+    if params.get('sort') in LEGACY_ORDERINGS:
+        products = products.order_by(*LEGACY_ORDERINGS[params['sort']])
+    return products[:50]
+
+
+def indexed_queryset(params):
+    from django.db.models import Value
+    from django.db.models.functions import Lower
+
+    from shop.models import Product
+    from shop.views import PRODUCT_SORTS
+
+    products = Product.objects.all()
+    if params.get('category'):
+        products = products.filter(category_lower=Lower(Value(params['category'])))
+    if params.get('brand'):
+        products = products.filter(brand_lower=Lower(Value(params['brand'])))
+    field, descending, _ = PRODUCT_SORTS.get(params.get('sort', ''), PRODUCT_SORTS[''])
+    prefix = '-' if descending else ''
+    return products.order_by(*dict.fromkeys((f'{prefix}{field}', f'{prefix}id')))[:50]
+
+
+def query_plan(queryset):
+    from django.db import connection
+
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=1_000_000)
+    parser.add_argument('--db', default=None, help="SQLite file to (re)use; a temporary file by default")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    setup_django(args.db)
+    populate_catalog(args.products)
+
+    from urllib.parse import urlencode
+
+    from django.test import Client
+
+    client = Client()
+    print(f"{'case':<62} {'legacy p50':>10} {'p95':>8} {'indexed p50':>11} {'p95':>8} {'request p50':>11}")
+    for params in CASES:
+        label = urlencode(params) or '(no parameters)'
+        legacy = timed(lambda: list(legacy_queryset(params)), args.repeat)
+        indexed = timed(lambda: list(indexed_queryset(params)), args.repeat)
+        request = timed(lambda: client.get('/api/shop/products/', params), args.repeat)
+        print(
+            f"{label:<62} {percentile(legacy, .5):10.2f} {percentile(legacy, .95):8.2f} "
+            f"{percentile(indexed, .5):11.2f} {percentile(indexed, .95):8.2f} {percentile(request, .5):11.2f}"
+        )
+        print(f"    legacy plan:  {' / '.join(query_plan(legacy_queryset(params)))}")
+        print(f"    indexed plan: {' / '.join(query_plan(indexed_queryset(params)))}")
+    print("All times in milliseconds.")
+
+
+if __name__ == '__main__':
+    main()
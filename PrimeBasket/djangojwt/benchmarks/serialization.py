@@ -0,0 +1,60 @@
+"""
+CPU cost of serialising product lists: ``ProductSerializer`` +
+``JSONRenderer`` on model instances against the ``.values()`` row plan of
+``shop.fast_serializers``. Both paths include the query, and their output
+is checked to be byte-identical before timing:
+
+    python -m benchmarks.serialization --rows 50 500 5000
+"""
+import argparse
+
+from benchmarks.common import percentile, populate_catalog, setup_django, timed
+
+
+def standard_path(count):
+    from rest_framework.renderers import JSONRenderer
+
+    from shop.models import Product
+    from shop.serializers import ProductSerializer
+
+    products = Product.objects.order_by('id')[:count]
+    return JSONRenderer().render(ProductSerializer(products, many=True).data)
+
+
+def fast_path(count):
+    from shop.fast_serializers import get_product_plan, render_json
+    from shop.models import Product
+
+    plan = get_product_plan()
+    rows = Product.objects.order_by('id').values(*plan.columns)[:count]
+    return render_json(plan.convert_many(rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[50, 500, 5000])
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--db', help='SQLite file to use (kept between runs)')
+    args = parser.parse_args()
+
+    setup_django(args.db)
+    populate_catalog(max(args.rows))
+
+    from shop import fast_serializers
+
+    print(f'orjson: {"yes" if fast_serializers.orjson is not None else "no (json fallback)"}')
+    print(f'{"rows":>6}  {"serializer p50":>15}  {"fast p50":>9}  {"p95":>9}  {"speed-up":>8}')
+    for count in args.rows:
+        expected = standard_path(count)
+        if fast_path(count) != expected:
+            raise SystemExit(f'fast path output differs from ProductSerializer at {count} rows')
+        standard = timed(lambda: standard_path(count), args.repeat)
+        fast = timed(lambda: fast_path(count), args.repeat)
+        print(
+            f'{count:>6}  {percentile(standard, 0.5):>12.2f} ms  {percentile(fast, 0.5):>6.2f} ms  '
+            f'{percentile(fast, 0.95):>6.2f} ms  {percentile(standard, 0.5) / percentile(fast, 0.5):>7.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Cold-start benchmark for the URLconf.
+
+Starts fresh interpreters with ``-X importtime``, sets Django up and
+resolves the root URLconf (which is what every worker does on boot), then
+reports wall time, peak RSS and the most expensive imports. It exits with
+status 1 when a heavy module is pulled in or a budget is exceeded, so it
+can guard against regressions in CI:
+
+    python -m benchmarks.startup --max-ms 400
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+# Modules that must never be imported just to serve requests.
+FORBIDDEN = ('pandas', 'numpy', 'scipy', 'sklearn')
+
+CHILD = """
+import json, resource, time
+started = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+elapsed = time.perf_counter() - started
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'elapsed_ms': elapsed * 1000, 'max_rss_kb': rss_kb}))
+"""
+
+
+def parse_importtime(stderr):
+    """Return ``{module: (self_us, cumulative_us)}`` from ``-X importtime`` output."""
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def run_once(settings_module):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD],
+        cwd=PROJECT_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    summary = json.loads(result.stdout.strip().splitlines()[-1])
+    summary['imports'] = parse_importtime(result.stderr)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--settings', default='djangojwt.settings')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help="Number of slowest imports to list")
+    parser.add_argument('--max-ms', type=float, default=None, help="Fail if the median start-up exceeds this")
+    parser.add_argument('--max-rss-mb', type=float, default=None, help="Fail if peak RSS exceeds this")
+    parser.add_argument('--json', action='store_true', help="Print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    runs = [run_once(args.settings) for _ in range(args.repeat)]
+    elapsed = statistics.median(run['elapsed_ms'] for run in runs)
+    rss_mb = max(run['max_rss_kb'] for run in runs) / 1024
+    imports = runs[-1]['imports']
+    forbidden = sorted({name.split('.')[0] for name in imports} & set(FORBIDDEN))
+    slowest = sorted(imports.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+
+    failures = []
+    if forbidden:
+        failures.append(f"heavy modules imported at start-up: {', '.join(forbidden)}")
+    if args.max_ms is not None and elapsed > args.max_ms:
+        failures.append(f"median start-up {elapsed:.1f}ms exceeds budget of {args.max_ms:.1f}ms")
+    if args.max_rss_mb is not None and rss_mb > args.max_rss_mb:
+        failures.append(f"peak RSS {rss_mb:.1f}MB exceeds budget of {args.max_rss_mb:.1f}MB")
+
+    if args.json:
+        print(json.dumps({
+            'median_ms': round(elapsed, 2),
+            'max_rss_mb': round(rss_mb, 1),
+            'modules': len(imports),
+            'forbidden': forbidden,
+            'failures': failures,
+        }, indent=2))
+    else:
+        print(f"URLconf cold start: median {elapsed:.1f}ms over {args.repeat} runs, peak RSS {rss_mb:.1f}MB, "
+              f"{len(imports)} modules imported")
+        print(f"{'cumulative ms':>14}  {'self ms':>8}  module")
+        for name, (self_us, cumulative_us) in slowest:
+            print(f"{cumulative_us / 1000:14.1f}  {self_us / 1000:8.1f}  {name}")
+        for failure in failures:
+            print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
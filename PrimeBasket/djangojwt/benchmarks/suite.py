@@ -0,0 +1,347 @@
+"""
+Benchmark suite for the whole API, with saved baselines.
+
+Generates a synthetic catalog of ``--products`` rows (``10k``, ``100k``,
+``1m`` or a plain number) and drives every endpoint in-process at a fixed
+``--concurrency`` through the application objects of each mode (see
+``benchmarks.asgi_load`` for ``wsgi``, ``asgi-sync`` and ``asgi``):
+
+* product listings, once per sort/filter case of ``benchmarks.product_listing``
+* product detail, search, suggestions and facets
+* cart summary, add, update, remove and batch, for several users
+* login and token refresh
+
+For each mode and scenario it reports requests/s, p50/p95/p99 latency,
+database queries per request (from the request instrumentation, see
+djangojwt/instrumentation.py) and non-2xx responses. Requests are drawn
+from a seeded generator and carts are reset before each cart scenario, so
+two runs send the same requests; each scenario is timed ``--rounds``
+times and the fastest round is kept. Login requests are fewer and no more
+concurrent than the password hashing limit accepts, since each one hashes
+a password. SQLite allows one writer at a time, so cart writes can fail
+on the database lock at high concurrency; those count as non-2xx.
+
+``--save`` writes the results to JSON; ``--compare`` reads such a file,
+prints the differences and exits with status 1 when a scenario lost more
+throughput or p99 latency than ``--tolerance`` allows, runs more queries
+or fails more requests:
+
+    python -m benchmarks.suite --products 100k --db /tmp/bench-100k.sqlite3 --save baseline.json
+    python -m benchmarks.suite --products 100k --db /tmp/bench-100k.sqlite3 --compare baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from benchmarks.asgi_load import MODES, run_asgi, run_wsgi
+from benchmarks.common import PROJECT_DIR, WORDS, percentile, populate_catalog, setup_django
+from benchmarks.product_listing import CASES
+
+USERNAME = 'bench-suite'
+PASSWORD = 'suite-password-1'
+CART_USERS = 8
+CART_SIZE = 10
+CATEGORIES = ('beverages', 'snacks & branded foods', 'baby care', 'bakery, cakes & dairy')
+
+
+def parse_count(value):
+    """``10k``, ``1m`` or ``250000``."""
+    value = value.strip().lower()
+    scale = {'k': 1_000, 'm': 1_000_000}.get(value[-1:], 1)
+    try:
+        return int(float(value.rstrip('km')) * scale)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid product count: {value!r}')
+
+
+def listing_scenarios():
+    scenarios = {}
+    for params in CASES:
+        label = '&'.join(f'{key}={value}' for key, value in params.items())
+        query = '&'.join(f'{key}={value}' for key, value in {**params, 'page_size': 50}.items())
+        scenarios[f'products?{label}' if label else 'products'] = lambda rng, ctx, query=query: (
+            'GET', '/api/shop/products/', query, b'', None,
+        )
+    return scenarios
+
+
+def _json(data):
+    return json.dumps(data).encode()
+
+
+def _cart_user(rng, ctx):
+    return rng.choice(ctx['cart_users'])
+
+
+SCENARIOS = {
+    **listing_scenarios(),
+    # Not in product_listing.CASES: the snapshot and legacy comparisons there have no trending order.
+    'products?sort=trending': lambda rng, ctx: ('GET', '/api/shop/products/', 'sort=trending&page_size=50', b'', None),
+    'product': lambda rng, ctx: ('GET', f'/api/shop/products/{rng.randint(1, ctx["max_product_id"])}/', '', b'', None),
+    'search': lambda rng, ctx: ('GET', '/api/shop/search/', f'q={rng.choice(WORDS)}&page_size=20', b'', None),
+    'suggest': lambda rng, ctx: ('GET', '/api/shop/suggest/', f'q={rng.choice(WORDS)[:3]}', b'', None),
+    'facets': lambda rng, ctx: ('GET', '/api/shop/facets/', f'category={rng.choice(CATEGORIES)}', b'', None),
+    'cart-summary': lambda rng, ctx: ('GET', '/api/shop/cart/summary/', '', b'', _cart_user(rng, ctx)[0]),
+    'cart-add': lambda rng, ctx: (
+        'POST', '/api/shop/cart/add/', '', _json({'product_id': rng.randint(1, ctx['max_product_id'])}),
+        _cart_user(rng, ctx)[0],
+    ),
+    'cart-update': lambda rng, ctx: (
+        'POST', '/api/shop/cart/update/', '',
+        _json({'product_id': rng.choice(ctx['cart_products']), 'quantity': rng.randint(1, 5)}), _cart_user(rng, ctx)[0],
+    ),
+    'cart-remove': lambda rng, ctx: (
+        'POST', '/api/shop/cart/remove/', '', _json({'product_id': rng.choice(ctx['cart_products'])}),
+        _cart_user(rng, ctx)[0],
+    ),
+    'cart-batch': lambda rng, ctx: (
+        'POST', '/api/shop/cart/batch/', '', _json({'operations': [
+            {'op': 'set', 'product_id': rng.choice(ctx['cart_products']), 'quantity': rng.randint(1, 5)},
+            {'op': 'add', 'product_id': rng.randint(1, ctx['max_product_id'])},
+            {'op': 'remove', 'product_id': rng.choice(ctx['cart_products'])},
+        ]}),
+        _cart_user(rng, ctx)[0],
+    ),
+    'login': lambda rng, ctx: ('POST', '/api/auth/login/', '', _json({'username': USERNAME, 'password': PASSWORD}), None),
+    'token-refresh': lambda rng, ctx: (
+        'POST', '/api/token/refresh/', '', _json({'refresh': _cart_user(rng, ctx)[1]}), None,
+    ),
+}
+
+
+def reset_carts(ctx):
+    from shop.models import CartItem
+
+    CartItem.objects.filter(user_id__in=ctx['cart_user_ids']).delete()
+    CartItem.objects.bulk_create(
+        CartItem(user_id=user_id, product_id=product_id, quantity=1)
+        for user_id in ctx['cart_user_ids'] for product_id in ctx['cart_products']
+    )
+
+
+def queries_per_request():
+    from djangojwt import metrics
+
+    count = total = 0
+    for (name, _), (_, counts, value) in metrics.histograms().items():
+        if name == 'http_request_db_queries':
+            count += sum(counts)
+            total += value
+    return total / count if count else None
+
+
+def worker(args):
+    setup_django(
+        args.db,
+        SHOP_ASYNC_VIEWS=args.worker == 'asgi',
+        INSTRUMENTATION_SLOW_REQUEST_SECONDS=None,
+        REST_FRAMEWORK={
+            'DEFAULT_AUTHENTICATION_CLASSES': ('myapp.authentication.JWTAuthentication',),
+            'DEFAULT_THROTTLE_RATES': {'login_ip': None, 'login_username': None},
+        },
+        CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'catalog': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+        },
+    )
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    from djangojwt import metrics
+    from shop.models import Product
+
+    users = User.objects.filter(username__startswith=f'{USERNAME}-cart-').order_by('username')
+    tokens = [RefreshToken.for_user(user) for user in users]
+    product_ids = Product.objects.order_by('id').values_list('id', flat=True)
+    ctx = {
+        'max_product_id': product_ids.last(),
+        'cart_products': list(product_ids[:CART_SIZE]),
+        'cart_user_ids': [user.pk for user in users],
+        'cart_users': [(str(token.access_token), str(token)) for token in tokens],
+    }
+    run = run_wsgi if args.worker == 'wsgi' else run_asgi
+    login_concurrency = max(1, settings.PASSWORD_HASHING_CONCURRENCY)
+
+    results = {}
+    for name in args.scenarios:
+        count, concurrency = args.requests, args.concurrency
+        if name == 'login':
+            count, concurrency = max(10, count // 25), min(concurrency, login_concurrency)
+        rng = random.Random(f'{args.seed}:{name}')
+        requests = [SCENARIOS[name](rng, ctx) for _ in range(count)]
+        if name.startswith('cart-'):
+            reset_carts(ctx)
+        run(requests[:concurrency], concurrency)  # warm up
+        rounds = []
+        for _ in range(args.rounds):
+            if name.startswith('cart-'):
+                reset_carts(ctx)
+            metrics.reset()
+            responses, elapsed = run(requests, concurrency)
+            latencies = [latency for latency, _ in responses]
+            rounds.append({
+                'requests': len(responses),
+                'concurrency': concurrency,
+                'rps': len(responses) / elapsed,
+                'p50': percentile(latencies, 0.5),
+                'p95': percentile(latencies, 0.95),
+                'p99': percentile(latencies, 0.99),
+                'queries': queries_per_request(),
+                'errors': sum(1 for _, status in responses if not 200 <= status < 300),
+            })
+        # The fastest round is the least disturbed by the rest of the machine.
+        results[name] = max(rounds, key=lambda result: result['rps'])
+    print(json.dumps(results))
+
+
+def prepare(args):
+    """Create the catalog, indexes and users the scenarios need; returns the database path."""
+    db_path = setup_django(args.db)
+    started = time.perf_counter()
+    populate_catalog(args.products)
+
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+
+    from shop.facets import rebuild_facets
+    from shop.models import FacetedProduct, Product
+
+    call_command('rebuild_search_index', verbosity=0)
+    if FacetedProduct.objects.count() != Product.objects.count():
+        rebuild_facets()
+    user, _ = User.objects.get_or_create(username=USERNAME)
+    if not user.check_password(PASSWORD):
+        user.set_password(PASSWORD)
+        user.save()
+    for index in range(CART_USERS):
+        User.objects.get_or_create(username=f'{USERNAME}-cart-{index}')
+    print(f'Catalog of {args.products:,} products ready in {time.perf_counter() - started:.1f}s')
+    return db_path
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR, check=True, capture_output=True, text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(mode, results):
+    width = max(map(len, results))
+    print(f'\n{mode}')
+    print(f'{"scenario":<{width}} {"req/s":>7} {"p50":>8} {"p95":>8} {"p99":>8} {"queries":>7} {"non-2xx":>7}')
+    for name, result in results.items():
+        queries = '-' if result['queries'] is None else f'{result["queries"]:.1f}'
+        print(
+            f'{name:<{width}} {result["rps"]:>7.0f} {result["p50"]:>8.2f} {result["p95"]:>8.2f} '
+            f'{result["p99"]:>8.2f} {queries:>7} {result["errors"]:>7}'
+        )
+
+
+def compare(baseline, current, tolerance):
+    """Print the changes from ``baseline`` and return the regressions found."""
+    regressions = []
+    width = max(len(name) for results in current['results'].values() for name in results)
+    print(f'\nCompared with {baseline["meta"].get("revision") or "baseline"} ({baseline["meta"]["created"]}):')
+    print(f'{"mode":<10} {"scenario":<{width}} {"req/s":>8} {"p50":>8} {"p99":>8} {"queries":>9}')
+    for mode, results in current['results'].items():
+        for name, result in results.items():
+            before = baseline['results'].get(mode, {}).get(name)
+            if before is None:
+                continue
+            change = {key: result[key] / before[key] - 1 if before[key] else 0.0 for key in ('rps', 'p50', 'p99')}
+            queries = f'{before["queries"] or 0:.1f}->{result["queries"] or 0:.1f}'
+            problems = []
+            if change['rps'] < -tolerance:
+                problems.append('throughput')
+            if change['p99'] > tolerance:
+                problems.append('p99')
+            # Fractions come from periodic reads such as the catalog version.
+            if (result['queries'] or 0) >= (before['queries'] or 0) + 0.5:
+                problems.append('queries')
+            if result['errors'] > before['errors'] * (1 + tolerance):
+                problems.append('errors')
+            if problems:
+                regressions.append((mode, name, problems))
+            print(
+                f'{mode:<10} {name:<{width}} {change["rps"]:>+8.0%} {change["p50"]:>+8.0%} {change["p99"]:>+8.0%} '
+                f'{queries:>9}{"  REGRESSION: " + ", ".join(problems) if problems else ""}'
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=parse_count, default=parse_count('10k'))
+    parser.add_argument('--requests', type=int, default=300, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=['wsgi', 'asgi'])
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS), metavar='SCENARIO')
+    parser.add_argument('--rounds', type=int, default=3, help='timed runs per scenario; the fastest is kept')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db', help='SQLite file to use (kept between runs)')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='compare with the results saved in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='relative throughput or p99 change allowed by --compare (default 0.25)')
+    parser.add_argument('--worker', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        return worker(args)
+
+    db_path = prepare(args)
+    report = {
+        'meta': {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'products': args.products,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'rounds': args.rounds,
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'results': {},
+    }
+    print(f'{args.requests} requests per scenario, {args.concurrency} in flight; latencies in ms')
+    for mode in args.modes:
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.suite', '--worker', mode, '--db', str(db_path),
+             '--requests', str(args.requests), '--concurrency', str(args.concurrency), '--rounds', str(args.rounds),
+             '--seed', str(args.seed),
+             '--scenarios', *args.scenarios],
+            cwd=PROJECT_DIR, check=True, capture_output=True, text=True,
+        ).stdout
+        report['results'][mode] = json.loads(output.strip().splitlines()[-1])
+        print_results(mode, report['results'][mode])
+
+    if args.save:
+        with open(args.save, 'w') as handle:
+            json.dump(report, handle, indent=2)
+        print(f'\nSaved to {args.save}')
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)
+        if baseline['meta'].get('products') != args.products:
+            print(f'\nWarning: the baseline was taken on {baseline["meta"].get("products"):,} products')
+        regressions = compare(baseline, report, args.tolerance)
+        if regressions:
+            print(f'\n{len(regressions)} regression(s)')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Database profiles used by settings.DATABASES: tuned SQLite, pooled
+PostgreSQL, and ``from_url`` to build either from a URL.
+"""
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 2**20,
+    # Negative values are in KiB: 32 MiB per connection.
+    'cache_size': -32 * 1024,
+    'temp_store': 'MEMORY',
+}
+# Pragmas that write to the database file.
+_WRITING_PRAGMAS = ('journal_mode',)
+
+
+def sqlite(path, read_only=False, replica=False, busy_timeout=20, conn_max_age=600, pragmas=None):
+    """
+    A SQLite ``DATABASES`` entry for the file at ``path``. ``busy_timeout``
+    is in seconds; ``pragmas`` override ``SQLITE_PRAGMAS``. Pass
+    ``replica`` for an alias that only serves reads.
+    """
+    pragmas = {**SQLITE_PRAGMAS, **(pragmas or {})}
+    if read_only:
+        pragmas = {name: value for name, value in pragmas.items() if name not in _WRITING_PRAGMAS}
+    options = {
+        'timeout': busy_timeout,
+        'init_command': '; '.join(f'PRAGMA {name} = {value}' for name, value in pragmas.items()),
+    }
+    if not (read_only or replica):
+        # A deferred transaction that reads before it writes fails at once
+        # with "database is locked" while another connection writes.
+        options['transaction_mode'] = 'IMMEDIATE'
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'{Path(path).resolve().as_uri()}?mode=ro' if read_only else path,
+        'CONN_MAX_AGE': conn_max_age,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': options,
+    }
+
+
+def postgresql(name, user='', password='', host='', port='', pool_min_size=2, pool_max_size=10,
+               pool_timeout=10, server_side_cursors=True):
+    """
+    A PostgreSQL ``DATABASES`` entry with a connection pool per worker
+    process. Set ``server_side_cursors`` to False behind PgBouncer in
+    transaction mode: ``QuerySet.iterator()``, which exports use to stream
+    large tables, then fetches in chunks on the client instead.
+    """
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': name,
+        'USER': user,
+        'PASSWORD': password,
+        'HOST': host,
+        'PORT': port,
+        # The pool keeps connections open; Django's own persistence is off.
+        'CONN_MAX_AGE': 0,
+        'DISABLE_SERVER_SIDE_CURSORS': not server_side_cursors,
+        'OPTIONS': {
+            'pool': {'min_size': pool_min_size, 'max_size': pool_max_size, 'timeout': pool_timeout},
+        },
+    }
+
+
+def from_url(url, conn_max_age=600, replica=False):
+    """
+    A ``DATABASES`` entry for a ``sqlite:///`` or ``postgres://`` URL.
+    ``conn_max_age`` applies to SQLite; PostgreSQL connections are pooled.
+    ``replica`` is passed on to ``sqlite``.
+    """
+    parts = urlsplit(url)
+    query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+    if parts.scheme == 'sqlite':
+        # The first slash ends the (empty) host; a second one starts an absolute path.
+        path = unquote(parts.path[1:])
+        return sqlite(path, read_only=query.get('mode') == 'ro', replica=replica, conn_max_age=conn_max_age)
+    if parts.scheme in ('postgres', 'postgresql'):
+        options = {
+            name: int(query[key]) for name, key in (
+                ('pool_min_size', 'pool_min'), ('pool_max_size', 'pool_max'), ('pool_timeout', 'pool_timeout'),
+            ) if key in query
+        }
+        if 'server_side_cursors' in query:
+            options['server_side_cursors'] = query['server_side_cursors'] not in ('0', 'false', 'off')
+        return postgresql(
+            unquote(parts.path.lstrip('/')), user=unquote(parts.username or ''), password=unquote(parts.password or ''),
+            host=parts.hostname or '', port=str(parts.port or ''), **options,
+        )
+    raise ValueError(f'Unsupported database URL scheme {parts.scheme!r}')
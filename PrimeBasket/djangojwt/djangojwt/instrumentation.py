@@ -0,0 +1,225 @@
+"""
+Per-request timing, query counts and N+1 detection, reported as metrics
+and in the ``Server-Timing`` header.
+"""
+import functools
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+
+from djangojwt import metrics
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+DUPLICATE_REPORTS_REMEMBERED = 1000
+
+_current = ContextVar('request_stats', default=None)
+_reported = OrderedDict()
+_reported_lock = threading.Lock()
+
+
+class RequestStats:
+    __slots__ = ('started', 'queries', 'query_seconds', 'statements', 'phases')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.statements = Counter()
+        self.phases = {}
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def timed(phase):
+    """Add the time spent in the block to ``phase`` of the current request."""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.add(phase, time.perf_counter() - started)
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_seconds += time.perf_counter() - started
+        stats.statements[sql] += 1
+
+
+def _install_query_recorder(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+# Connections are per thread, and the async ORM runs on executor threads,
+# so the wrapper is added to every connection as it is opened.
+connection_created.connect(_install_query_recorder)
+
+
+def _report_duplicates(view, stats):
+    threshold = getattr(settings, 'INSTRUMENTATION_DUPLICATE_QUERIES', 5)
+    if not threshold:
+        return
+    repeated = [(sql, count) for sql, count in stats.statements.items() if count >= threshold]
+    if not repeated:
+        return
+    metrics.increment('http_duplicate_queries_total', view=view)
+    for sql, count in repeated:
+        with _reported_lock:
+            if (view, sql) in _reported:
+                _reported.move_to_end((view, sql))
+                continue
+            _reported[view, sql] = True
+            if len(_reported) > DUPLICATE_REPORTS_REMEMBERED:
+                _reported.popitem(last=False)
+        logger.warning('%s ran the same query %d times in one request (N+1?): %s', view, count, sql[:500])
+
+
+def _stream(content, stats, done):
+    """Iterate ``content`` counting its queries in ``stats``, then call ``done``."""
+    iterator = iter(content)
+    try:
+        while True:
+            token = _current.set(stats)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _current.reset(token)
+            yield chunk
+    finally:
+        done()
+
+
+async def _astream(content, stats, done):
+    iterator = aiter(content)
+    try:
+        while True:
+            token = _current.set(stats)
+            try:
+                chunk = await anext(iterator)
+            except StopAsyncIteration:
+                return
+            finally:
+                _current.reset(token)
+            yield chunk
+    finally:
+        done()
+
+
+def _server_timing(stats, elapsed):
+    entries = [f'db;dur={stats.query_seconds * 1000:.2f};desc="{stats.queries} queries"']
+    entries.extend(f'{phase};dur={seconds * 1000:.2f}' for phase, seconds in stats.phases.items())
+    entries.append(f'total;dur={elapsed * 1000:.2f}')
+    return ', '.join(entries)
+
+
+class InstrumentationMiddleware:
+    """
+    Times each request and counts its queries: per-view ``http_request_*``
+    histograms, ``http_requests_total`` and the ``Server-Timing`` header.
+    Put it first in MIDDLEWARE.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            _install_query_recorder(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, stats)
+        return response
+
+    def process_template_response(self, request, response):
+        stats = _current.get()
+        if stats is not None:
+            started = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: stats.add('render', time.perf_counter() - started))
+        return response
+
+    def finish(self, request, response, stats):
+        if getattr(settings, 'INSTRUMENTATION_SERVER_TIMING', True):
+            response['Server-Timing'] = _server_timing(stats, time.perf_counter() - stats.started)
+        if not response.streaming:
+            self.record(request, response, stats)
+            return
+        stream = _astream if response.is_async else _stream
+        response.streaming_content = stream(
+            response.streaming_content, stats, functools.partial(self.record, request, response, stats),
+        )
+
+    def record(self, request, response, stats):
+        elapsed = time.perf_counter() - stats.started
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+
+        metrics.increment('http_requests_total', view=view, method=request.method, status=response.status_code)
+        metrics.observe_histogram('http_request_duration_seconds', elapsed, view=view)
+        metrics.observe_histogram('http_request_db_queries', stats.queries, QUERY_COUNT_BUCKETS, view=view)
+        metrics.observe_histogram('http_request_db_seconds', stats.query_seconds, view=view)
+        for phase, seconds in stats.phases.items():
+            metrics.observe_histogram(f'http_request_{phase}_seconds', seconds, view=view)
+        _report_duplicates(view, stats)
+
+        slow = getattr(settings, 'INSTRUMENTATION_SLOW_REQUEST_SECONDS', None)
+        if slow is not None and elapsed >= slow:
+            logger.warning(
+                'Slow request: %s %s took %.0f ms (%d queries, %.0f ms in the database)',
+                request.method, request.path, elapsed * 1000, stats.queries, stats.query_seconds * 1000,
+            )
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint: this worker's metrics in the text format."""
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', None)
+    if allowed is not None and request.META.get('REMOTE_ADDR') not in allowed:
+        raise Http404
+    return HttpResponse(metrics.render_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,116 @@
+"""Process-local metrics registry, rendered for Prometheus at /metrics."""
+import math
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+# Upper bounds of the default histogram buckets, in seconds.
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_summaries = defaultdict(lambda: [0, 0.0])
+_histograms = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def increment(name, amount=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] += amount
+
+
+def observe(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        summary = _summaries[key]
+        summary[0] += 1
+        summary[1] += value
+
+
+def observe_histogram(name, value, buckets=DURATION_BUCKETS, **labels):
+    """Count ``value`` in the first of the sorted ``buckets`` it does not exceed."""
+    key = _key(name, labels)
+    index = bisect_left(buckets, value)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [buckets, [0] * (len(buckets) + 1), 0.0]
+        histogram[1][index] += 1
+        histogram[2] += value
+
+
+def counters():
+    """Return ``{(name, ((label, value), ...)): total}``."""
+    with _lock:
+        return dict(_counters)
+
+
+def summaries():
+    """Return ``{(name, ((label, value), ...)): (count, sum)}``."""
+    with _lock:
+        return {key: tuple(summary) for key, summary in _summaries.items()}
+
+
+def histograms():
+    """
+    Return ``{(name, ((label, value), ...)): (buckets, counts, sum)}``,
+    ``counts`` having one entry per bucket plus one for larger values.
+    """
+    with _lock:
+        return {key: (buckets, tuple(counts), total) for key, (buckets, counts, total) in _histograms.items()}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _summaries.clear()
+        _histograms.clear()
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def render_text():
+    """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+    families = defaultdict(list)
+    for (name, labels), total in counters().items():
+        families[name, 'counter'].append(f'{name}{_labels(labels)} {_number(total)}')
+    for (name, labels), (count, total) in summaries().items():
+        families[name, 'summary'].extend((
+            f'{name}_count{_labels(labels)} {count}',
+            f'{name}_sum{_labels(labels)} {_number(total)}',
+        ))
+    for (name, labels), (buckets, counts, total) in histograms().items():
+        lines = families[name, 'histogram']
+        cumulative = 0
+        for bound, count in zip((*buckets, math.inf), counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{_labels((*labels, ("le", _number(bound))))} {cumulative}')
+        lines.extend((
+            f'{name}_count{_labels(labels)} {cumulative}',
+            f'{name}_sum{_labels(labels)} {_number(total)}',
+        ))
+    output = []
+    for (name, kind), lines in sorted(families.items()):
+        output.append(f'# TYPE {name} {kind}')
+        output.extend(lines)
+    return '\n'.join(output) + '\n'
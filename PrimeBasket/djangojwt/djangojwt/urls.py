@@ -1,14 +1,14 @@
 
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
-from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
-    TokenRefreshView,
-)
+from rest_framework_simplejwt.views import TokenRefreshView
 
 from myapp.views import *
 
+from .instrumentation import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/register/',RegisterView.as_view(),name="auth_register"),
@@ -17,5 +17,6 @@ urlpatterns = [
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/auth/reset-password/', ResetPasswordView.as_view(), name='auth_reset_password'),
-    path('api/shop/', include('shop.urls')),
+    path('metrics', metrics_view, name='metrics'),
+    path('api/shop/', include('shop.async_urls' if settings.SHOP_ASYNC_VIEWS else 'shop.urls')),
 ]
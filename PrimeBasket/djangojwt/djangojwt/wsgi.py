@@ -9,8 +9,16 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'djangojwt.settings')
 
 application = get_wsgi_application()
+
+# Build the search suggestion index while the worker waits for its first
+# request (see shop.suggest).
+if getattr(settings, 'SHOP_SUGGEST_PRELOAD', False):
+    from shop.suggest import preload
+
+    preload()
@@ -0,0 +1,198 @@
+"""
+JWT authentication that memoises verified tokens and, with
+``JWT_TOKEN_USER``, builds ``request.user`` from the token claims.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import authentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from djangojwt import metrics
+
+from .serializers import USER_CLAIMS
+
+VERIFIED_TOKEN_CACHE_SIZE = 4096
+USER_CACHE_SIZE = 10000
+
+_lock = threading.Lock()
+_verified_tokens = OrderedDict()
+_users = {}
+
+
+def _token_user_enabled():
+    return getattr(settings, 'JWT_TOKEN_USER', True)
+
+
+def _user_cache_ttl():
+    return getattr(settings, 'JWT_USER_CACHE_TTL', 30)
+
+
+def _verified_token_ttl():
+    return getattr(settings, 'JWT_VERIFIED_TOKEN_TTL', 30)
+
+
+def _cached_user(user_id):
+    # Keyed on the id as a string: tokens carry it as one, while
+    # forget_user() gets the model's pk.
+    entry = _users.get(str(user_id))
+    if entry is None or entry[0] < time.monotonic():
+        return None
+    metrics.increment('auth_user_lookups_total', source='cache')
+    # A copy, so a view changing its user cannot change everyone else's.
+    return copy.copy(entry[1])
+
+
+def _remember_user(user_id, user):
+    metrics.increment('auth_user_lookups_total', source='database')
+    with _lock:
+        if len(_users) >= USER_CACHE_SIZE:
+            _users.pop(next(iter(_users)))
+        _users[str(user_id)] = (time.monotonic() + _user_cache_ttl(), user)
+    return copy.copy(user)
+
+
+def get_user_record(user_id):
+    """
+    The ``User`` with ``USER_ID_FIELD`` ``user_id``, at most
+    ``JWT_USER_CACHE_TTL`` seconds old. Raises ``User.DoesNotExist``.
+    """
+    user = _cached_user(user_id)
+    if user is None:
+        user = _remember_user(user_id, get_user_model().objects.get(**{api_settings.USER_ID_FIELD: user_id}))
+    return user
+
+
+async def aget_user_record(user_id):
+    user = _cached_user(user_id)
+    if user is None:
+        user = _remember_user(user_id, await get_user_model().objects.aget(**{api_settings.USER_ID_FIELD: user_id}))
+    return user
+
+
+def forget_user(user_id):
+    """Drop ``user_id`` from this process's user and verified token caches."""
+    user_id = str(user_id)
+    with _lock:
+        _users.pop(user_id, None)
+        stale = [
+            raw_token for raw_token, (_, token) in _verified_tokens.items()
+            if str(token.get(api_settings.USER_ID_CLAIM)) == user_id
+        ]
+        for raw_token in stale:
+            del _verified_tokens[raw_token]
+
+
+def _memoised_token(raw_token):
+    entry = _verified_tokens.get(raw_token)
+    if entry is None or entry[0] <= time.time():
+        return None
+    return entry[1]
+
+
+def _memoise_token(raw_token, token):
+    expires = min(token.get('exp', 0), time.time() + _verified_token_ttl())
+    with _lock:
+        _verified_tokens[raw_token] = (expires, token)
+        if len(_verified_tokens) > VERIFIED_TOKEN_CACHE_SIZE:
+            _verified_tokens.popitem(last=False)
+
+
+class JWTAuthentication(authentication.JWTAuthentication):
+
+    def authenticate(self, request):
+        started = time.perf_counter()
+        result = 'failed'
+        try:
+            header = self.get_header(request)
+            raw_token = self.get_raw_token(header) if header is not None else None
+            if raw_token is None:
+                result = 'anonymous'
+                return None
+            validated_token = _memoised_token(raw_token)
+            if validated_token is None:
+                validated_token = self.get_validated_token(raw_token)
+                user = self.get_user(validated_token, verified=True)
+                _memoise_token(raw_token, validated_token)
+            else:
+                user = self.get_user(validated_token)
+            result = 'authenticated'
+            return user, validated_token
+        finally:
+            metrics.observe('auth_seconds', time.perf_counter() - started, result=result)
+
+    async def aauthenticate(self, request):
+        started = time.perf_counter()
+        result = 'failed'
+        try:
+            header = self.get_header(request)
+            raw_token = self.get_raw_token(header) if header is not None else None
+            if raw_token is None:
+                result = 'anonymous'
+                return None
+            validated_token = _memoised_token(raw_token)
+            if validated_token is None:
+                validated_token = self.get_validated_token(raw_token)
+                user = await self.aget_user(validated_token, verified=True)
+                _memoise_token(raw_token, validated_token)
+            else:
+                user = await self.aget_user(validated_token)
+            result = 'authenticated'
+            return user, validated_token
+        finally:
+            metrics.observe('auth_seconds', time.perf_counter() - started, result=result)
+
+    def _token_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        # Revocation is checked against the stored password hash, which a
+        # token user does not have.
+        if (
+            _token_user_enabled() and not api_settings.CHECK_REVOKE_TOKEN
+            and all(claim in validated_token for claim in USER_CLAIMS)
+        ):
+            metrics.increment('auth_user_lookups_total', source='token')
+            return api_settings.TOKEN_USER_CLASS(validated_token)
+        return None
+
+    def get_user(self, validated_token, verified=False):
+        """
+        The user of ``validated_token``. A token user is built from the
+        claims without checks, unless the token was ``verified`` just now.
+        """
+        user = None if verified else self._token_user(validated_token)
+        if user is None:
+            try:
+                user = get_user_record(validated_token[api_settings.USER_ID_CLAIM])
+            except self.user_model.DoesNotExist as e:
+                raise AuthenticationFailed(_('User not found'), code='user_not_found') from e
+            self.check_user(user, validated_token)
+            user = self._token_user(validated_token) or user
+        return user
+
+    async def aget_user(self, validated_token, verified=False):
+        user = None if verified else self._token_user(validated_token)
+        if user is None:
+            try:
+                user = await aget_user_record(validated_token[api_settings.USER_ID_CLAIM])
+            except self.user_model.DoesNotExist as e:
+                raise AuthenticationFailed(_('User not found'), code='user_not_found') from e
+            self.check_user(user, validated_token)
+            user = self._token_user(validated_token) or user
+        return user
+
+    def check_user(self, user, validated_token):
+        """The checks simplejwt runs on a user loaded for ``validated_token``."""
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+@checks.register(checks.Tags.caches)
+def check_hashing_cache(app_configs, **kwargs):
+    if not getattr(settings, 'PASSWORD_HASHING_CONCURRENCY', 0):
+        return []
+    alias = getattr(settings, 'PASSWORD_HASHING_CACHE', 'default')
+    if isinstance(caches[alias], (LocMemCache, DummyCache)):
+        return [checks.Error(
+            f"PASSWORD_HASHING_CACHE ('{alias}') is not shared between processes.",
+            hint='With several worker processes each one would allow PASSWORD_HASHING_CONCURRENCY '
+                 'hashes; point it at a database or Redis cache, or set PASSWORD_HASHING_CONCURRENCY = 0.',
+            id='myapp.E001',
+        )]
+    return []
@@ -0,0 +1,68 @@
+"""Global limit on concurrent password hashing, kept in a shared cache."""
+import random
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.cache import caches
+from rest_framework.exceptions import APIException
+
+from djangojwt import metrics
+
+SLOT_KEY = 'password-hashing-slot:%d'
+
+
+class HashingBusy(APIException):
+    status_code = 503
+    default_detail = 'Too many sign-in requests, try again shortly.'
+    default_code = 'hashing_busy'
+    # Picked up by DRF's exception handler as the Retry-After header.
+    wait = 1
+
+
+@contextmanager
+def hashing_slot():
+    limit = getattr(settings, 'PASSWORD_HASHING_CONCURRENCY', 0)
+    if not limit:
+        yield
+        return
+    cache = caches[getattr(settings, 'PASSWORD_HASHING_CACHE', 'default')]
+    owner = uuid.uuid4().hex
+    # Probe from a random slot, so callers rarely collide on the first add.
+    start = random.randrange(limit)
+    for offset in range(limit):
+        key = SLOT_KEY % ((start + offset) % limit)
+        # The timeout frees the slot of a worker killed while hashing.
+        if cache.add(key, owner, getattr(settings, 'PASSWORD_HASHING_SLOT_TIMEOUT', 30)):
+            break
+    else:
+        metrics.increment('password_hashing_rejected_total')
+        raise HashingBusy()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe('password_hashing_seconds', time.perf_counter() - started)
+        if cache.get(key) == owner:
+            cache.delete(key)
+
+
+def make_password(password):
+    with hashing_slot():
+        return hashers.make_password(password)
+
+
+def check_password(user, password):
+    """
+    ``user.check_password(password)`` within a hashing slot. A hash in an
+    outdated format is upgraded and saved, as Django does.
+    """
+    outdated = []
+    with hashing_slot():
+        valid = hashers.check_password(password, user.password, outdated.append)
+    if valid and outdated:
+        user.password = make_password(password)
+        user.save(update_fields=['password'])
+    return valid
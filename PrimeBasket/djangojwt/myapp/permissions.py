@@ -0,0 +1,22 @@
+from django.contrib.auth import get_user_model
+from rest_framework.permissions import BasePermission
+
+from .authentication import get_user_record
+
+
+class IsStaffUser(BasePermission):
+    """
+    Allows staff users only. Access tokens carry no staff claim, so with
+    ``JWT_TOKEN_USER`` on the flag is read from the cached ``User`` row.
+    """
+
+    def has_permission(self, request, view):
+        user = request.user
+        if not (user and user.is_authenticated):
+            return False
+        if not isinstance(user, get_user_model()):
+            try:
+                user = get_user_record(user.pk)
+            except get_user_model().DoesNotExist:
+                return False
+        return bool(user.is_active and user.is_staff)
@@ -1,23 +1,42 @@
 from rest_framework import serializers
+from rest_framework_simplejwt import serializers as jwt_serializers
 from django.contrib.auth.models import User
 
+from . import hashing
+
+# UserSerializer fields copied into access tokens, so authenticated views
+# can answer from the token alone (see myapp.authentication).
+USER_CLAIMS = ('username', 'email', 'date_joined')
+
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id','username','email','date_joined']
 
+
+class TokenObtainPairSerializer(jwt_serializers.TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        data = UserSerializer(user).data
+        for claim in USER_CLAIMS:
+            token[claim] = data[claim]
+        return token
+
 class RegisterSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['username','email','password']
 
     def create(self, validated_data):
-        user = User.objects.create_user(
-            validated_data['username'],
-            validated_data['email'],
-            validated_data['password'],
+        # What create_user() does, with the hash computed in the pool.
+        user = User(
+            username=User.normalize_username(validated_data['username']),
+            email=User.objects.normalize_email(validated_data['email']),
         )
+        user.password = hashing.make_password(validated_data['password'])
+        user.save()
         return user
     
 class LoginSerializer(serializers.Serializer):
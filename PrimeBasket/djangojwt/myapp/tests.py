@@ -1,3 +1,185 @@
-from django.test import TestCase
+import time
+from contextlib import ExitStack
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import authentication, hashing
+from .checks import check_hashing_cache
+from .authentication import get_user_record
+from .serializers import TokenObtainPairSerializer
+
+
+def bearer(token):
+    return f'Bearer {token}'
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AuthTestCase(TestCase):
+    """Starts every test with this process's token and user caches empty."""
+
+    def setUp(self):
+        authentication._users.clear()
+        authentication._verified_tokens.clear()
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'secret-pass-1')
+        self.token = TokenObtainPairSerializer.get_token(self.user).access_token
+
+
+class TokenUserTests(AuthTestCase):
+    def test_claims_authenticate_without_a_query(self):
+        self.client.get('/api/dashboard/', HTTP_AUTHORIZATION=bearer(self.token))
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/dashboard/', HTTP_AUTHORIZATION=bearer(self.token))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['username'], 'alice')
+
+    def test_request_user_is_a_token_user(self):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=bearer(self.token))
+        user, _ = authentication.JWTAuthentication().authenticate(request)
+        self.assertIsInstance(user, TokenUser)
+        self.assertEqual((str(user.pk), user.username), (str(self.user.pk), 'alice'))
+
+    def test_tokens_without_claims_load_the_user(self):
+        token = AccessToken.for_user(self.user)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/dashboard/', HTTP_AUTHORIZATION=bearer(token))
+        self.assertEqual(response.json()['user']['email'], 'alice@example.com')
+
+    def test_deactivation_is_enforced_within_the_ttl(self):
+        headers = {'HTTP_AUTHORIZATION': bearer(self.token)}
+        self.assertEqual(self.client.get('/api/dashboard/', **headers).status_code, 200)
+        # Deactivated from another process: no signal reaches this one.
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get('/api/dashboard/', **headers).status_code, 200)
+        authentication._users.clear()
+        later = time.time() + 31
+        with mock.patch('myapp.authentication.time.time', return_value=later):
+            self.assertEqual(self.client.get('/api/dashboard/', **headers).status_code, 401)
+
+    def test_saving_the_user_drops_its_tokens(self):
+        headers = {'HTTP_AUTHORIZATION': bearer(self.token)}
+        self.assertEqual(self.client.get('/api/dashboard/', **headers).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/dashboard/', **headers).status_code, 401)
+
+    def test_invalid_token(self):
+        response = self.client.get('/api/dashboard/', HTTP_AUTHORIZATION=bearer('not.a.token'))
+        self.assertEqual(response.status_code, 401)
+
+
+class UserCacheTests(AuthTestCase):
+    def test_rows_are_reused(self):
+        with self.assertNumQueries(1):
+            first = get_user_record(self.user.pk)
+            second = get_user_record(self.user.pk)
+        self.assertEqual(first, second)
+        # Copies, so one caller's changes do not leak to the next.
+        first.first_name = 'changed'
+        self.assertEqual(get_user_record(self.user.pk).first_name, '')
+
+    def test_saving_the_user_evicts_it(self):
+        get_user_record(self.user.pk)
+        self.user.email = 'new@example.com'
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(get_user_record(self.user.pk).email, 'new@example.com')
+
+    @override_settings(JWT_USER_CACHE_TTL=0)
+    def test_entries_expire(self):
+        get_user_record(self.user.pk)
+        with self.assertNumQueries(1):
+            get_user_record(self.user.pk)
+
+    def test_missing_user(self):
+        with self.assertRaises(User.DoesNotExist):
+            get_user_record(self.user.pk + 1)
+
+    @override_settings(JWT_TOKEN_USER=False)
+    def test_deactivated_user_is_refused_once_saved(self):
+        headers = {'HTTP_AUTHORIZATION': bearer(self.token)}
+        self.assertEqual(self.client.get('/api/dashboard/', **headers).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/dashboard/', **headers).status_code, 401)
+
+
+class LoginThrottleTests(AuthTestCase):
+    # The rates in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'].
+    PER_USERNAME, PER_ADDRESS = 10, 30
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def login(self, username, password='wrong', address='10.0.0.1', url='/api/auth/login/'):
+        return self.client.post(
+            url, {'username': username, 'password': password}, content_type='application/json', REMOTE_ADDR=address,
+        )
+
+    def test_username_is_throttled_per_address(self):
+        for _ in range(self.PER_USERNAME):
+            self.assertEqual(self.login('alice').status_code, 401)
+        response = self.login('alice', 'secret-pass-1')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        # A few failures from one address do not lock the account out elsewhere.
+        self.assertEqual(self.login('alice', 'secret-pass-1', address='10.0.0.2').status_code, 200)
+
+    def test_failures_from_other_addresses_never_lock_the_account(self):
+        for index in range(100):
+            self.assertEqual(self.login('Alice', address=f'10.1.{index // 250}.{index % 250}').status_code, 401)
+        self.assertEqual(self.login('alice', 'secret-pass-1', address='10.2.0.1').status_code, 200)
+
+    def test_address_is_throttled_across_usernames(self):
+        for index in range(self.PER_ADDRESS):
+            self.assertEqual(self.login(f'user{index}').status_code, 401)
+        self.assertEqual(self.login('alice', 'secret-pass-1').status_code, 429)
+        self.assertEqual(self.login('alice', 'secret-pass-1', address='10.0.0.2').status_code, 200)
+
+    def test_token_endpoint_shares_the_limits(self):
+        for _ in range(self.PER_USERNAME):
+            self.login('alice')
+        response = self.login('alice', 'secret-pass-1', url='/api/token/')
+        self.assertEqual(response.status_code, 429)
+
+
+@override_settings(PASSWORD_HASHING_CONCURRENCY=2)
+class HashingLimitTests(AuthTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        caches['hashing'].clear()
+
+    def login(self):
+        return self.client.post(
+            '/api/auth/login/', {'username': 'alice', 'password': 'secret-pass-1'}, content_type='application/json',
+        )
+
+    def test_full_slots_refuse_sign_ins(self):
+        with ExitStack() as others:
+            # Hashes in flight elsewhere hold every slot of the shared cache.
+            for _ in range(2):
+                others.enter_context(hashing.hashing_slot())
+            response = self.login()
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_slots_are_released(self):
+        for _ in range(3):
+            self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(
+            [caches['hashing'].get(hashing.SLOT_KEY % slot) for slot in range(2)], [None, None],
+        )
+
+    def test_process_local_cache_is_an_error(self):
+        self.assertEqual(check_hashing_cache(None), [])
+        with override_settings(PASSWORD_HASHING_CACHE='default'):
+            self.assertEqual([error.id for error in check_hashing_cache(None)], ['myapp.E001'])
+            with override_settings(PASSWORD_HASHING_CONCURRENCY=0):
+                self.assertEqual(check_hashing_cache(None), [])
@@ -0,0 +1,34 @@
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class LoginIPThrottle(SimpleRateThrottle):
+    """Sign-in attempts per client address (``login_ip`` rate)."""
+    scope = 'login_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+def _username(request):
+    username = request.data.get('username')
+    if not isinstance(username, str) or not username:
+        return None
+    return username.lower()
+
+
+class LoginUsernameThrottle(SimpleRateThrottle):
+    """
+    Sign-in attempts per username from one client address
+    (``login_username`` rate). Keyed on the address too, so nobody can lock
+    an account out by failing to sign in as it from elsewhere.
+    """
+    scope = 'login_username'
+
+    def get_cache_key(self, request, view):
+        username = _username(request)
+        if username is None:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': f'{username}:{self.get_ident(request)}'}
+
+
+LOGIN_THROTTLES = (LoginIPThrottle, LoginUsernameThrottle)
@@ -3,11 +3,13 @@ from django.shortcuts import render
 from rest_framework import generics, status # Import status for response codes
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from django.contrib.auth.models import User
-from .serializers import RegisterSerializer, LoginSerializer, UserSerializer, ResetPasswordSerializer
+from .serializers import RegisterSerializer, LoginSerializer, UserSerializer, ResetPasswordSerializer, TokenObtainPairSerializer
 from django.contrib.auth import authenticate
+from rest_framework_simplejwt import views as jwt_views
+from . import hashing
+from .throttling import LOGIN_THROTTLES
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
@@ -20,6 +22,7 @@ class RegisterView(generics.CreateAPIView):
 
 class LoginView(generics.CreateAPIView):
     serializer_class = LoginSerializer
+    throttle_classes = LOGIN_THROTTLES
 
     def post(self, request, *args, **kwargs):
         username = request.data.get('username')
@@ -27,7 +30,7 @@ class LoginView(generics.CreateAPIView):
         user = authenticate(username=username, password=password)
 
         if user is not None:
-            refresh = RefreshToken.for_user(user)
+            refresh = TokenObtainPairSerializer.get_token(user)
             user_serializer = UserSerializer(user)
             return Response({
                 'refresh':str(refresh),
@@ -48,7 +51,9 @@ class ResetPasswordView(generics.UpdateAPIView):
     permission_classes = (IsAuthenticated,)
 
     def get_object(self, queryset=None):
-        obj = self.request.user
+        # request.user may be a token user or a cached copy; a password
+        # change needs the current row.
+        obj = User.objects.get(pk=self.request.user.pk)
         return obj
 
     def update(self, request, *args, **kwargs):
@@ -64,7 +69,7 @@ class ResetPasswordView(generics.UpdateAPIView):
             
             # Set the new password
             logger.info(f"Setting new password for user: {self.object.username}")
-            self.object.set_password(serializer.validated_data.get("password")) # Use validated_data
+            self.object.password = hashing.make_password(serializer.validated_data.get("password"))
             logger.info(f"Saving user object for: {self.object.username}")
             self.object.save()
             logger.info(f"Password successfully updated for user: {self.object.username}")
@@ -88,4 +93,8 @@ class DashboardView(APIView):
         return Response({
             'message':'Welcome to Dashboard',
             'user': user_serializer.data
-        }, 200)
\ No newline at end of file
+        }, 200)
+
+class TokenObtainPairView(jwt_views.TokenObtainPairView):
+    # Same credentials check as LoginView, so the same throttles.
+    throttle_classes = LOGIN_THROTTLES
@@ -0,0 +1,23 @@
+from django.urls import path
+from .async_views import get_products, get_product, search_products, suggest, product_facets, cart_summary, add_to_cart, remove_from_cart, update_cart_quantity, batch_update_cart, export_catalog, bought_together_products
+from .views import similar_products, import_catalog, catalog_jobs, catalog_job
+
+# Same routes as shop.urls, served by the async views where one exists.
+urlpatterns = [
+    path('products/', get_products),
+    path('products/<int:product_id>/', get_product),
+    path('search/', search_products),
+    path('suggest/', suggest),
+    path('facets/', product_facets),
+    path('products/<int:product_id>/similar/', similar_products),
+    path('products/<int:product_id>/bought-together/', bought_together_products),
+    path('cart/summary/', cart_summary),
+    path('cart/add/', add_to_cart),
+    path('cart/remove/', remove_from_cart),
+    path('cart/update/', update_cart_quantity),
+    path('cart/batch/', batch_update_cart),
+    path('export/', export_catalog),
+    path('catalog/import/', import_catalog),
+    path('catalog/jobs/', catalog_jobs),
+    path('catalog/jobs/<int:job_id>/', catalog_job),
+]
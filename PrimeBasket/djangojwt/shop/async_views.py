@@ -0,0 +1,309 @@
+"""
+Async versions of the catalog and cart endpoints, routed by
+``shop.async_urls`` when ``SHOP_ASYNC_VIEWS`` is on.
+"""
+import functools
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+
+from djangojwt.instrumentation import timed
+from myapp.authentication import JWTAuthentication
+
+from .cache import cache_catalog_response
+from .export import InvalidExport, agzip_stream, astream_export, export_params, export_response
+from .facets import aget_facets
+from .fast_serializers import fast_json_response, get_product_plan
+from .models import CartItem, Product
+from .pagination import InvalidCursor, apaginate_queryset, build_page, get_page_size
+from .popularity import counts_product_views, record_cart_add
+from .search import get_search_backend
+from .suggest import current_suggest_index, load_suggest_index
+from .serializers import CartItemSerializer, CartSummarySerializer, InvalidFields
+from .versioning import aget_catalog_version
+from .views import (
+    PRODUCT_SORTS, InvalidCartOperations, apply_cart_operations, bought_together_queryset, cart_items,
+    cart_summary_data, cart_summary_queryset, filter_params, filter_products, parse_bought_together_limit,
+    parse_cart_operations, parse_positive_int, parse_suggest_limit, product_fields, product_list_params,
+    record_cart_adds, search_params, search_position, snapshot_slice,
+)
+
+_renderer = JSONRenderer()
+_authenticator = JWTAuthentication()
+
+
+def json_response(data, status=200, headers=None):
+    with timed('render'):
+        content = _renderer.render(data)
+    return HttpResponse(content, status=status, headers=headers, content_type='application/json')
+
+
+def _exception_response(exc):
+    # Same body and headers as DRF's default exception handler.
+    data = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+    response = json_response(data, status=exc.status_code)
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        response['WWW-Authenticate'] = _authenticator.authenticate_header(None)
+    return response
+
+
+def async_api_view(methods, authenticated=False):
+    """
+    Async counterpart of ``@api_view(methods)`` (plus
+    ``@permission_classes([IsAuthenticated])`` when ``authenticated``).
+    Like DRF, it authenticates every request, so an invalid or expired
+    token is refused with 401 even where anonymous requests are allowed.
+    """
+    def decorator(view):
+        @csrf_exempt
+        @functools.wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            try:
+                if request.method not in methods:
+                    raise exceptions.MethodNotAllowed(request.method)
+                result = await _authenticator.aauthenticate(request)
+                if result is not None:
+                    request.user, request.auth = result
+                elif authenticated:
+                    raise exceptions.NotAuthenticated()
+                response = await view(request, *args, **kwargs)
+            except exceptions.APIException as exc:
+                response = _exception_response(exc)
+            response['Allow'] = ', '.join(methods)
+            patch_vary_headers(response, ('Accept',))
+            return response
+        return wrapped
+    return decorator
+
+
+def request_data(request):
+    """The parsed JSON or form body, as ``request.data`` would be."""
+    if request.content_type != 'application/json':
+        return request.POST
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError as exc:
+        raise exceptions.ParseError(f'JSON parse error - {exc}') from exc
+    if not isinstance(data, dict):
+        raise exceptions.ParseError()
+    return data
+
+
+@cache_catalog_response('products', product_list_params)
+@async_api_view(['GET'])
+async def get_products(request):
+    sort = request.GET.get('sort', '')
+    if sort not in PRODUCT_SORTS:
+        sort = ''
+    products = filter_products(request)
+
+    try:
+        fields = product_fields(request, listing=True)
+    except InvalidFields as exc:
+        return json_response({'error': str(exc)}, status=400)
+
+    field, descending, nullable = PRODUCT_SORTS[sort]
+    plan = get_product_plan(fields)
+    columns = list(dict.fromkeys((*plan.columns, 'id', field)))
+    products = products.values(*columns)
+    ordering = sort or 'id'
+    cursor = request.GET.get('cursor')
+    page_size = get_page_size(request)
+
+    try:
+        page = None
+        if getattr(settings, 'SHOP_SNAPSHOT_READS', False):
+            # Loading a new snapshot reads its files, so it runs in a thread.
+            located = await sync_to_async(snapshot_slice)(
+                request, await aget_catalog_version(), ordering, field, cursor, page_size,
+            )
+            if located is not None:
+                rows = [row async for row in products.filter(id__in=located.ids)]
+                page = located.build_page(rows, page_size, ordering, field)
+        if page is None:
+            page = await apaginate_queryset(
+                products, ordering, field, descending, nullable, cursor=cursor, page_size=page_size,
+            )
+    except InvalidCursor as exc:
+        return json_response({'error': str(exc)}, status=400)
+
+    return fast_json_response(plan, page.rows, page.link_headers(request))
+
+
+@cache_catalog_response('search', search_params)
+@async_api_view(['GET'])
+async def search_products(request):
+    query = request.GET.get('q', '')
+    try:
+        fields = product_fields(request, listing=True)
+    except InvalidFields as exc:
+        return json_response({'error': str(exc)}, status=400)
+    if not query.strip():
+        return json_response([])
+
+    try:
+        position, after = search_position(request.GET.get('cursor'))
+    except InvalidCursor:
+        return json_response({'error': 'Invalid cursor'}, status=400)
+
+    page_size = get_page_size(request)
+    hits = await sync_to_async(get_search_backend().search_page)(query, page_size + 1, position, after)
+    page = build_page(hits, page_size, 'search', lambda hit: (hit[1], hit[0]), position, after)
+
+    product_ids = [pk for pk, _ in page.rows]
+    plan = get_product_plan(fields)
+    columns = list(dict.fromkeys((*plan.columns, 'id')))
+    rows = {row['id']: row async for row in Product.objects.filter(id__in=product_ids).values(*columns).aiterator()}
+    ranked = [rows[pk] for pk in product_ids if pk in rows]
+    return fast_json_response(plan, ranked, page.link_headers(request))
+
+
+@counts_product_views
+@cache_catalog_response('product', lambda request, product_id: {'id': product_id})
+@async_api_view(['GET'])
+async def get_product(request, product_id):
+    plan = get_product_plan()
+    row = await Product.objects.filter(id=product_id).values(*plan.columns).afirst()
+    if row is None:
+        return json_response({'error': 'Product not found'}, status=404)
+    return fast_json_response(plan, [row], many=False)
+
+
+@cache_catalog_response('facets', filter_params)
+@async_api_view(['GET'])
+async def product_facets(request):
+    return json_response(await aget_facets(**filter_params(request)))
+
+
+@async_api_view(['GET'])
+async def suggest(request):
+    limit = parse_suggest_limit(request)
+    if limit is None:
+        return json_response({'error': 'limit must be an integer'}, status=400)
+    version = await aget_catalog_version()
+    # Only the very first build, before any index exists, is waited for.
+    index = current_suggest_index(version) or await sync_to_async(load_suggest_index)(version)
+    return json_response(index.suggest(request.GET.get('q', ''), limit))
+
+
+@async_api_view(['GET'])
+async def bought_together_products(request, product_id):
+    limit = parse_bought_together_limit(request)
+    if limit is None:
+        return json_response({'error': 'limit must be an integer'}, status=400)
+    try:
+        fields = product_fields(request)
+    except InvalidFields as exc:
+        return json_response({'error': str(exc)}, status=400)
+
+    plan = get_product_plan(fields)
+    rows = [row async for row in bought_together_queryset(product_id).values(*plan.columns)[:limit]]
+    if not rows and not await Product.objects.filter(id=product_id).aexists():
+        return json_response({'error': 'Product not found'}, status=404)
+    return fast_json_response(plan, rows)
+
+
+async def cart_response(user, fields=None):
+    items = [item async for item in cart_items(user, fields).aiterator()]
+    serializer = CartItemSerializer(items, many=True, product_fields=fields)
+    return json_response(serializer.data)
+
+
+@async_api_view(['GET'], authenticated=True)
+async def cart_summary(request):
+    rows = [row async for row in cart_summary_queryset(request.user.pk)]
+    return json_response(CartSummarySerializer(cart_summary_data(rows)).data)
+
+
+@async_api_view(['POST'], authenticated=True)
+async def add_to_cart(request):
+    try:
+        fields = product_fields(request)
+    except InvalidFields as exc:
+        return json_response({'error': str(exc)}, status=400)
+    product_id = parse_positive_int(request_data(request).get('product_id'))
+    if not product_id:
+        return json_response({'error': 'Product ID is required'}, status=400)
+
+    items = CartItem.objects.filter(user_id=request.user.pk, product_id=product_id)
+    if not await items.aupdate(quantity=F('quantity') + 1):
+        if not await Product.objects.filter(id=product_id).aexists():
+            return json_response({'error': 'Product not found'}, status=404)
+        try:
+            # Async views never run inside ATOMIC_REQUESTS, so a failed
+            # INSERT cannot poison an enclosing transaction.
+            await CartItem.objects.acreate(user_id=request.user.pk, product_id=product_id)
+        except IntegrityError:
+            await items.aupdate(quantity=F('quantity') + 1)
+
+    record_cart_add(product_id)
+    return await cart_response(request.user, fields)
+
+
+@async_api_view(['POST'], authenticated=True)
+async def remove_from_cart(request):
+    try:
+        fields = product_fields(request)
+    except InvalidFields as exc:
+        return json_response({'error': str(exc)}, status=400)
+    product_id = parse_positive_int(request_data(request).get('product_id'))
+    if not product_id:
+        return json_response({'error': 'Product ID is required'}, status=400)
+
+    await CartItem.objects.filter(user_id=request.user.pk, product_id=product_id).adelete()
+
+    return await cart_response(request.user, fields)
+
+
+@async_api_view(['POST'], authenticated=True)
+async def update_cart_quantity(request):
+    try:
+        fields = product_fields(request)
+    except InvalidFields as exc:
+        return json_response({'error': str(exc)}, status=400)
+    data = request_data(request)
+    product_id = parse_positive_int(data.get('product_id'))
+    quantity = parse_positive_int(data.get('quantity'))
+    if not product_id or not quantity:
+        return json_response({'error': 'Product ID and quantity are required'}, status=400)
+
+    updated = await CartItem.objects.filter(user_id=request.user.pk, product_id=product_id).aupdate(quantity=quantity)
+    if not updated:
+        return json_response({'error': 'Product not found in cart'}, status=404)
+
+    return await cart_response(request.user, fields)
+
+
+@async_api_view(['POST'], authenticated=True)
+async def batch_update_cart(request):
+    try:
+        fields = product_fields(request)
+        operations = parse_cart_operations(request_data(request))
+    except (InvalidFields, InvalidCartOperations) as exc:
+        return json_response({'error': str(exc)}, status=400)
+
+    # The async ORM has no transactions, so the batch runs in a thread.
+    missing = await sync_to_async(apply_cart_operations)(request.user.pk, operations)
+    if missing:
+        return json_response({'error': 'Product not found', 'product_ids': missing}, status=404)
+
+    record_cart_adds(operations)
+    return await cart_response(request.user, fields)
+
+
+@async_api_view(['GET'], authenticated=True)
+async def export_catalog(request):
+    try:
+        fmt, since = export_params(request)
+    except InvalidExport as exc:
+        return json_response({'error': str(exc)}, status=400)
+    # An async iterator: ASGI would buffer a sync one in full.
+    return export_response(request, fmt, astream_export(fmt, since), agzip_stream)
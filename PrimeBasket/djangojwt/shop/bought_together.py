@@ -0,0 +1,185 @@
+"""
+"Frequently bought together" lists from a co-occurrence matrix of cart
+contents, built by ``manage.py build_bought_together``.
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from .models import BoughtTogether, CartItem, Product
+
+# Users and products per ``__in`` lookup.
+LOOKUP_BATCH = 500
+
+
+def get_state_path():
+    path = getattr(settings, 'SHOP_BOUGHT_TOGETHER_DIR', settings.BASE_DIR / 'var' / 'bought_together')
+    return Path(path) / 'counts.npz'
+
+
+def _batches(values, size=LOOKUP_BATCH):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _cart_items(queryset):
+    """``(ids, user_ids, product_ids)`` arrays of the CartItems in ``queryset``."""
+    rows = list(queryset.values_list('id', 'user_id', 'product_id').iterator(chunk_size=10000))
+    items = np.array(rows, dtype=np.int64).reshape(-1, 3)
+    return items[:, 0], items[:, 1], items[:, 2]
+
+
+def _cooccurrence(user_ids, product_ids, size):
+    """``size`` x ``size`` counts of the carts given as parallel user/product arrays."""
+    from scipy import sparse
+
+    if not len(user_ids):
+        return sparse.csr_matrix((size, size), dtype=np.int64)
+    _, rows = np.unique(user_ids, return_inverse=True)
+    # (user, product) is unique, so every cell of ``carts`` is 0 or 1.
+    carts = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int64), (rows, product_ids)), shape=(rows.max() + 1, size),
+    )
+    return (carts.T @ carts).tocsr()
+
+
+def _load_state(path):
+    from scipy import sparse
+
+    try:
+        with np.load(path) as state:
+            counts = sparse.csr_matrix(
+                (state['data'], state['indices'], state['indptr']), shape=tuple(state['shape']),
+            )
+            options = (int(state['top_k']), int(state['min_count']))
+            return counts, int(state['watermark']), int(state['items']), options
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _save_state(path, counts, watermark, items, top_k, min_count):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    staging = path.with_name(path.name + '.tmp')
+    with open(staging, 'wb') as handle:
+        np.savez(
+            handle, data=counts.data, indices=counts.indices, indptr=counts.indptr, shape=np.array(counts.shape),
+            watermark=watermark, items=items, top_k=top_k, min_count=min_count,
+        )
+    os.replace(staging, path)
+
+
+def _product_ids(size):
+    """Boolean array of length ``size``: which product ids exist."""
+    exists = np.zeros(size, dtype=bool)
+    ids = Product.objects.values_list('id', flat=True).iterator(chunk_size=10000)
+    exists[np.fromiter(ids, dtype=np.int64)] = True
+    return exists
+
+
+def _listed_products():
+    return np.fromiter(BoughtTogether.objects.values_list('product_id', flat=True).distinct(), dtype=np.int64)
+
+
+def top_partners(counts, diagonal, product_id, exists, top_k, min_count):
+    """
+    ``[(partner_id, count, score), ...]`` best first for one product.
+    ``diagonal`` is ``counts.diagonal()``.
+    """
+    begin, end = counts.indptr[product_id], counts.indptr[product_id + 1]
+    partners = counts.indices[begin:end]
+    together = counts.data[begin:end]
+    keep = (partners != product_id) & (together >= min_count) & exists[partners]
+    partners, together = partners[keep], together[keep]
+    if not len(partners):
+        return []
+    scores = together / np.sqrt(diagonal[product_id] * diagonal[partners])
+    # Score, then count, then the lower id first.
+    order = np.lexsort((partners, -together, -scores))[:top_k]
+    return list(zip(partners[order].tolist(), together[order].tolist(), scores[order].tolist()))
+
+
+def _write_lists(counts, product_ids, exists, top_k, min_count, batch_size):
+    """Replace the BoughtTogether rows of ``product_ids``, a batch of products per transaction."""
+    written = 0
+    diagonal = counts.diagonal().astype(np.float64)
+    for chunk in _batches(product_ids):
+        rows = []
+        for product_id in chunk:
+            if not exists[product_id]:
+                continue
+            partners = top_partners(counts, diagonal, product_id, exists, top_k, min_count)
+            rows.extend(
+                BoughtTogether(product_id=product_id, partner_id=partner_id, rank=rank, count=count, score=score)
+                for rank, (partner_id, count, score) in enumerate(partners)
+            )
+        with transaction.atomic():
+            BoughtTogether.objects.filter(product_id__in=chunk).delete()
+            BoughtTogether.objects.bulk_create(rows, batch_size=batch_size)
+        written += len(rows)
+    return written
+
+
+def build_bought_together(path=None, top_k=20, min_count=2, full=False, batch_size=2000):
+    """Build or refresh the co-occurrence counts and lists; returns a summary dict."""
+    path = Path(path) if path else get_state_path()
+    state = None if full else _load_state(path)
+    if state is not None and CartItem.objects.filter(id__lte=state[1]).count() < state[2]:
+        # Items counted before are gone; counts cannot be taken back.
+        state = None
+    size = (Product.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+    if state is not None:
+        size = max(size, state[0].shape[0])
+    # Carts are counted up to this item; later ones are left for the next run.
+    watermark = CartItem.objects.aggregate(Max('id'))['id__max'] or 0
+
+    if state is None:
+        _, user_ids, product_ids = _cart_items(CartItem.objects.filter(id__lte=watermark))
+        counts = _cooccurrence(user_ids, product_ids, size)
+        # Products listed by an earlier build that no longer have partners
+        # are rewritten too, to an empty list.
+        rewrite = np.union1d(np.flatnonzero(counts.diagonal()), _listed_products())
+        mode, counted = 'full', len(product_ids)
+        items = counted
+    else:
+        counts, previous, items, options = state
+        if counts.shape[0] < size:
+            counts.resize((size, size))
+        users = list(
+            CartItem.objects.filter(id__gt=previous, id__lte=watermark).values_list('user_id', flat=True).distinct()
+        )
+        if not users and options == (top_k, min_count):
+            return {'mode': 'unchanged', 'cart_items': 0, 'products': 0, 'rows': 0}
+
+        # Count every cart that changed as it is now, minus what the
+        # previous run already counted of it.
+        parts = [
+            _cart_items(CartItem.objects.filter(user_id__in=batch, id__lte=watermark)) for batch in _batches(users)
+        ]
+        item_ids, user_ids, product_ids = (
+            (np.concatenate(column) for column in zip(*parts)) if parts else _cart_items(CartItem.objects.none())
+        )
+        old = item_ids <= previous
+        delta = _cooccurrence(user_ids, product_ids, size) - _cooccurrence(user_ids[old], product_ids[old], size)
+        delta = delta.tocsr()
+        delta.eliminate_zeros()
+        counts = (counts + delta).tocsr()
+        counted = int((~old).sum())
+        items += counted
+
+        if options != (top_k, min_count):
+            rewrite = np.union1d(np.flatnonzero(counts.diagonal()), _listed_products())
+        else:
+            # A new count changes the scores of its two products, and a new
+            # cart for j changes the score of j in every list it is on.
+            touched = np.unique(delta.nonzero()[0])
+            rewrite = np.union1d(touched, counts[touched].indices)
+        mode = 'incremental'
+
+    exists = _product_ids(size)
+    rows = _write_lists(counts, rewrite.tolist(), exists, top_k, min_count, batch_size)
+    _save_state(path, counts, watermark, items, top_k, min_count)
+    return {'mode': mode, 'cart_items': counted, 'products': len(rewrite), 'rows': rows}
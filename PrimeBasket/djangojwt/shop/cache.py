@@ -0,0 +1,167 @@
+"""Response cache for catalog reads, keyed on the catalog version."""
+import functools
+import hashlib
+import json
+from inspect import iscoroutinefunction
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.exceptions import AuthenticationFailed
+
+from djangojwt import metrics
+from myapp.authentication import JWTAuthentication
+
+from .versioning import aget_catalog_version, get_catalog_version
+
+# Response headers that are part of a cached entry.
+CACHED_HEADERS = ('Link',)
+
+_authenticator = JWTAuthentication()
+
+
+def get_cache():
+    return caches[getattr(settings, 'SHOP_CACHE_ALIAS', 'default')]
+
+
+def _cache_timeout():
+    return getattr(settings, 'SHOP_CACHE_TIMEOUT', 300)
+
+
+def make_cache_key(name, version, params):
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+    return f'shop:{name}:{version}:{digest}', f'"{version}-{digest[:16]}"'
+
+
+def _bypass(request):
+    # The cache only ever stores compact JSON, so requests that could
+    # negotiate anything else bypass it: browsers asking for the browsable
+    # API, ?format=, and media type parameters such as ``indent``.
+    if request.method != 'GET' or request.GET.get('format', 'json') != 'json':
+        return True
+    accept = request.META.get('HTTP_ACCEPT', '')
+    return 'text/html' in accept or any(
+        param.split('=', 1)[0].strip() != 'q'
+        for media_range in accept.split(',') for param in media_range.split(';')[1:]
+    )
+
+
+def _rejected(request):
+    """
+    Whether ``request`` carries a token that does not authenticate. The
+    view answers those with 401, so the cache must not answer them first.
+    Verified tokens are memoised, so this is cheap for valid ones.
+    """
+    try:
+        _authenticator.authenticate(request)
+    except AuthenticationFailed:
+        return True
+    return False
+
+
+async def _arejected(request):
+    try:
+        await _authenticator.aauthenticate(request)
+    except AuthenticationFailed:
+        return True
+    return False
+
+
+def _not_modified(request, name, etag):
+    if etag not in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        return None
+    metrics.increment('shop_cache_requests_total', view=name, result='not_modified')
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
+
+
+def _response_from_entry(name, entry):
+    metrics.increment('shop_cache_requests_total', view=name, result='hit')
+    response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    for header, value in entry['headers'].items():
+        response[header] = value
+    return response
+
+
+def _entry_from_response(response):
+    """The cache entry for ``response``, or None if it must not be stored."""
+    if hasattr(response, 'render'):
+        response.render()
+    if response.status_code != 200 or not response.get('Content-Type', '').startswith('application/json'):
+        return None
+    return {
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        'headers': {header: response[header] for header in CACHED_HEADERS if response.has_header(header)},
+    }
+
+
+def _finish(response, etag):
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+
+def cache_catalog_response(name, key_params):
+    """
+    Cache successful JSON responses of a catalog read view, keyed on
+    ``key_params(request, **kwargs)`` (None leaves the request uncached);
+    a matching ``If-None-Match`` gets a 304. Apply it outside ``@api_view``.
+    """
+    def decorator(view):
+        def cache_params(request, args, kwargs):
+            if _bypass(request):
+                return None
+            params = key_params(request, *args, **kwargs)
+            if params is not None:
+                params['_host'] = request.get_host()
+            return params
+
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapped(request, *args, **kwargs):
+                params = cache_params(request, args, kwargs)
+                if params is None or await _arejected(request):
+                    return await view(request, *args, **kwargs)
+                key, etag = make_cache_key(name, await aget_catalog_version(), params)
+                response = _not_modified(request, name, etag)
+                if response is not None:
+                    return response
+                cache = get_cache()
+                entry = await cache.aget(key)
+                if entry is not None:
+                    return _finish(_response_from_entry(name, entry), etag)
+                metrics.increment('shop_cache_requests_total', view=name, result='miss')
+                response = await view(request, *args, **kwargs)
+                entry = _entry_from_response(response)
+                if entry is None:
+                    return response
+                await cache.aset(key, entry, _cache_timeout())
+                return _finish(response, etag)
+            return async_wrapped
+
+        @functools.wraps(view)
+        def wrapped(request, *args, **kwargs):
+            params = cache_params(request, args, kwargs)
+            if params is None or _rejected(request):
+                return view(request, *args, **kwargs)
+            key, etag = make_cache_key(name, get_catalog_version(), params)
+            response = _not_modified(request, name, etag)
+            if response is not None:
+                return response
+            cache = get_cache()
+            entry = cache.get(key)
+            if entry is not None:
+                return _finish(_response_from_entry(name, entry), etag)
+            metrics.increment('shop_cache_requests_total', view=name, result='miss')
+            response = view(request, *args, **kwargs)
+            entry = _entry_from_response(response)
+            if entry is None:
+                return response
+            cache.set(key, entry, _cache_timeout())
+            return _finish(response, etag)
+        return wrapped
+    return decorator
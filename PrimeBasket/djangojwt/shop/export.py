@@ -0,0 +1,193 @@
+"""Streaming NDJSON/CSV catalog export behind /api/shop/export/."""
+import csv
+import datetime
+import io
+import zlib
+from itertools import islice
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.middleware.gzip import re_accepts_gzip
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .fast_serializers import RowPlan, SlowPathRequired, render_json
+from .models import Product
+
+# Leading characters that make a spreadsheet read a cell as a formula.
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# format -> Content-Type
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+class InvalidExport(ValueError):
+    """Raised for an unknown ``format`` or an unparseable ``since``."""
+
+
+_plan = None
+
+
+def get_export_plan():
+    """``ProductExportSerializer`` plan, compiled on first use."""
+    global _plan
+    if _plan is None:
+        from .serializers import ProductExportSerializer
+        _plan = RowPlan(ProductExportSerializer)
+    return _plan
+
+
+def _parse(value):
+    try:
+        since = parse_datetime(value)
+        if since is None and (day := parse_date(value)):
+            since = datetime.datetime.combine(day, datetime.time())
+        return since
+    except ValueError:
+        return None
+
+
+def parse_since(value):
+    """
+    ``since`` as an aware datetime: ISO 8601 date or date-time, UTC unless
+    it carries an offset. None when empty.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    # An unescaped '+' of a UTC offset arrives as a space.
+    since = _parse(value) or _parse(value.replace(' ', '+'))
+    if since is None:
+        raise InvalidExport('since must be an ISO 8601 date or date-time')
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, datetime.timezone.utc)
+    return since
+
+
+def export_params(request):
+    """``(format, since)`` of an export request; raises InvalidExport."""
+    fmt = request.GET.get('format')
+    if not fmt:
+        fmt = 'csv' if 'text/csv' in request.META.get('HTTP_ACCEPT', '') else 'ndjson'
+    if fmt not in FORMATS:
+        raise InvalidExport(f'format must be one of: {", ".join(FORMATS)}')
+    return fmt, parse_since(request.GET.get('since'))
+
+
+def export_queryset(since=None):
+    products = Product.objects.values(*get_export_plan().columns)
+    if since is None:
+        return products.order_by('id')
+    # Rows stamped exactly at ``since`` are sent again; clients upsert by id.
+    # Deleted products are not reported.
+    return products.filter(last_modified__gte=since).order_by('last_modified', 'id')
+
+
+def chunk_size():
+    return getattr(settings, 'SHOP_EXPORT_CHUNK_SIZE', 2000)
+
+
+def _converted(plan, rows):
+    try:
+        return plan.convert_many(rows)
+    except SlowPathRequired:
+        return plan.convert_many(rows, lenient=True)
+
+
+def encode_ndjson(plan, rows):
+    return b''.join(render_json(item) + b'\n' for item in _converted(plan, rows))
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+def encode_csv(plan, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([_csv_value(value) for value in item.values()] for item in _converted(plan, rows))
+    return buffer.getvalue().encode()
+
+
+def csv_header(plan):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow([name for name, _, _ in plan.steps])
+    return buffer.getvalue().encode()
+
+
+_ENCODERS = {'ndjson': encode_ndjson, 'csv': encode_csv}
+
+
+def stream_export(fmt, since=None):
+    """Yield the export as encoded chunks of bytes."""
+    plan = get_export_plan()
+    encode = _ENCODERS[fmt]
+    size = chunk_size()
+    if fmt == 'csv':
+        yield csv_header(plan)
+    rows = export_queryset(since).iterator(chunk_size=size)
+    while batch := list(islice(rows, size)):
+        yield encode(plan, batch)
+
+
+async def astream_export(fmt, since=None):
+    """Async counterpart of ``stream_export``, reading with ``aiterator()``."""
+    plan = get_export_plan()
+    encode = _ENCODERS[fmt]
+    size = chunk_size()
+    if fmt == 'csv':
+        yield csv_header(plan)
+    batch = []
+    async for row in export_queryset(since).aiterator(chunk_size=size):
+        batch.append(row)
+        if len(batch) == size:
+            yield encode(plan, batch)
+            batch = []
+    if batch:
+        yield encode(plan, batch)
+
+
+def _compressor():
+    # wbits 16 + 15: a gzip container, as Content-Encoding: gzip expects.
+    return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def gzip_stream(chunks):
+    compressor = _compressor()
+    for chunk in chunks:
+        if data := compressor.compress(chunk):
+            yield data
+    yield compressor.flush()
+
+
+async def agzip_stream(chunks):
+    compressor = _compressor()
+    async for chunk in chunks:
+        if data := compressor.compress(chunk):
+            yield data
+    yield compressor.flush()
+
+
+def export_response(request, fmt, chunks, compress):
+    """
+    StreamingHttpResponse over ``chunks`` (an iterator, or an async
+    iterator under ASGI), gzip-compressed with ``compress`` when the client
+    accepts it.
+    """
+    headers = {'Content-Disposition': f'attachment; filename="catalog.{fmt}"'}
+    if re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        chunks = compress(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    response = StreamingHttpResponse(chunks, content_type=FORMATS[fmt], headers=headers)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -0,0 +1,210 @@
+"""
+Facet counts for /api/shop/facets/, materialised in ``FacetCount`` and
+updated incrementally from the product signals.
+"""
+from bisect import bisect_right
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Q, Value
+from django.db.models.functions import Lower
+
+from .models import FacetCount, FacetedProduct, Product
+
+FACETS = ('category', 'sub_category', 'brand', 'rating', 'price')
+# Facets counted within the full filter context. The category facet
+# ignores the category filter and the brand facet the brand filter, so
+# clients can offer the alternatives to the current selection.
+FILTERED_FACETS = ('sub_category', 'rating', 'price')
+# Context key meaning "not filtered on this column".
+ANY = ''
+UNRATED = 'unrated'
+RATING_BANDS = ('4-5', '3-4', '2-3', '1-2', '0-1', UNRATED)
+DEFAULT_PRICE_BUCKETS = (0, 50, 100, 200, 500, 1000)
+
+PRODUCT_COLUMNS = ('id', 'category', 'category_lower', 'sub_category', 'brand', 'brand_lower', 'rating', 'sale_price')
+CELL_FIELDS = ('category_key', 'brand_key', 'facet', 'value')
+KEY_FIELDS = ('category', 'category_key', 'sub_category', 'brand', 'brand_key', 'rating', 'price')
+
+
+def price_buckets():
+    return tuple(getattr(settings, 'SHOP_FACET_PRICE_BUCKETS', DEFAULT_PRICE_BUCKETS))
+
+
+def rating_band(rating):
+    if rating is None:
+        return UNRATED
+    low = min(max(int(rating), 0), 4)
+    return f'{low}-{low + 1}'
+
+
+def price_bucket(price, bounds):
+    index = max(bisect_right(bounds, price) - 1, 0)
+    if index == len(bounds) - 1:
+        return f'{bounds[index]}+'
+    return f'{bounds[index]}-{bounds[index + 1]}'
+
+
+def _facet_key(row, bounds):
+    """A product row's values for ``KEY_FIELDS``."""
+    return (
+        row['category'], row['category_lower'], row['sub_category'], row['brand'], row['brand_lower'],
+        rating_band(row['rating']), price_bucket(row['sale_price'], bounds),
+    )
+
+
+def _cells(key):
+    """The ``(category_key, brand_key, facet, value)`` cells a product with ``key`` counts towards."""
+    category, category_key, sub_category, brand, brand_key, rating, price = key
+    for brand_context in (ANY, brand_key):
+        yield ANY, brand_context, 'category', category
+    for category_context in (ANY, category_key):
+        yield category_context, ANY, 'brand', brand
+        for brand_context in (ANY, brand_key):
+            if sub_category:
+                yield category_context, brand_context, 'sub_category', sub_category
+            yield category_context, brand_context, 'rating', rating
+            yield category_context, brand_context, 'price', price
+
+
+def _upsert(cursor, model, unique, columns, rows, assignment='excluded.{column}'):
+    """``INSERT ... ON CONFLICT DO UPDATE`` of ``rows``, as written by SQLite (3.24+) and PostgreSQL."""
+    if not rows:
+        return
+    qn = cursor.db.ops.quote_name
+    table = qn(model._meta.db_table)
+    updates = ', '.join(
+        f'{qn(column)} = ' + assignment.format(table=table, column=qn(column))
+        for column in columns if column not in unique
+    )
+    cursor.executemany(
+        f'INSERT INTO {table} ({", ".join(map(qn, columns))}) VALUES ({", ".join(["%s"] * len(columns))}) '
+        f'ON CONFLICT ({", ".join(map(qn, unique))}) DO UPDATE SET {updates}',
+        rows,
+    )
+
+
+def _apply(cursor, deltas, changed, removed):
+    # In key order, so concurrent updates lock shared cells in the same
+    # order and cannot deadlock on them.
+    deltas = [(*cell, delta) for cell, delta in sorted(deltas.items()) if delta]
+    _upsert(cursor, FacetCount, CELL_FIELDS, (*CELL_FIELDS, 'count'), deltas, '{table}.{column} + excluded.{column}')
+    emptied = [row[:4] for row in deltas if row[4] < 0]
+    if emptied:
+        qn = cursor.db.ops.quote_name
+        match = ' AND '.join(f'{qn(column)} = %s' for column in CELL_FIELDS)
+        cursor.executemany(
+            f'DELETE FROM {qn(FacetCount._meta.db_table)} WHERE {match} AND {qn("count")} <= 0', emptied,
+        )
+    _upsert(cursor, FacetedProduct, ('product_id',), ('product_id', *KEY_FIELDS), changed)
+    if removed:
+        FacetedProduct.objects.using(cursor.db.alias).filter(product_id__in=removed).delete()
+
+
+def update_facets(product_ids, using=None, batch_size=2000):
+    """Bring the counts of ``product_ids`` (saved, changed or deleted) up to date."""
+    using = using or router.db_for_write(Product)
+    product_ids = list(dict.fromkeys(product_ids))
+    bounds = price_buckets()
+    for start in range(0, len(product_ids), batch_size):
+        batch = sorted(product_ids[start:start + batch_size])
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            # Read under the write lock, so a concurrent update of the same
+            # products applies its delta to what this one writes rather
+            # than to the same old values. PostgreSQL locks the rows (the
+            # Product row first, which also covers products not counted
+            # yet); SQLite's IMMEDIATE transactions hold the database lock.
+            current = {
+                row['id']: _facet_key(row, bounds)
+                for row in Product.objects.using(using).select_for_update()
+                .filter(id__in=batch).order_by('id').values(*PRODUCT_COLUMNS)
+            }
+            counted = {
+                row[0]: row[1:]
+                for row in FacetedProduct.objects.using(using).select_for_update()
+                .filter(product_id__in=batch).order_by('product_id').values_list('product_id', *KEY_FIELDS)
+            }
+            deltas = Counter()
+            changed, removed = [], []
+            for pk in batch:
+                old, new = counted.get(pk), current.get(pk)
+                if old == new:
+                    continue
+                if old is not None:
+                    deltas.subtract(_cells(old))
+                if new is not None:
+                    deltas.update(_cells(new))
+                    changed.append((pk, *new))
+                elif old is not None:
+                    removed.append(pk)
+            _apply(cursor, deltas, changed, removed)
+
+
+def rebuild_facets(using=None, batch_size=2000):
+    """Recount every product from scratch. Returns the number of products."""
+    using = using or router.db_for_write(Product)
+    bounds = price_buckets()
+    counts = Counter()
+    total = 0
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        FacetCount.objects.using(using).all().delete()
+        FacetedProduct.objects.using(using).all().delete()
+        rows = Product.objects.using(using).order_by().values(*PRODUCT_COLUMNS).iterator(chunk_size=batch_size)
+        batch = []
+        for row in rows:
+            key = _facet_key(row, bounds)
+            counts.update(_cells(key))
+            batch.append((row['id'], *key))
+            if len(batch) >= batch_size:
+                _upsert(cursor, FacetedProduct, ('product_id',), ('product_id', *KEY_FIELDS), batch)
+                total += len(batch)
+                batch = []
+        _upsert(cursor, FacetedProduct, ('product_id',), ('product_id', *KEY_FIELDS), batch)
+        total += len(batch)
+        _upsert(cursor, FacetCount, CELL_FIELDS, (*CELL_FIELDS, 'count'), [(*cell, n) for cell, n in counts.items()])
+    return total
+
+
+def facet_counts(category=ANY, brand=ANY):
+    """
+    ``(facet, value, count)`` rows for products matching the ``category``
+    and ``brand`` filters (``ANY`` for no filter). The keys were stored
+    through the database's LOWER(), so the filters go through it too:
+    SQLite only lower-cases ASCII.
+    """
+    category = Lower(Value(category)) if category else ANY
+    brand = Lower(Value(brand)) if brand else ANY
+    return FacetCount.objects.filter(
+        Q(category_key=ANY, brand_key=brand, facet='category')
+        | Q(category_key=category, brand_key=ANY, facet='brand')
+        | Q(category_key=category, brand_key=brand, facet__in=FILTERED_FACETS),
+        count__gt=0,
+    ).values_list('facet', 'value', 'count')
+
+
+def _price_order(value):
+    return float(value.rstrip('+').split('-')[0])
+
+
+def group_facets(rows):
+    """``{facet: [{'value': ..., 'count': ...}, ...]}`` from ``facet_counts`` rows."""
+    facets = {facet: [] for facet in FACETS}
+    for facet, value, count in rows:
+        facets[facet].append({'value': value, 'count': count})
+    for facet, values in facets.items():
+        if facet == 'rating':
+            values.sort(key=lambda entry: RATING_BANDS.index(entry['value']))
+        elif facet == 'price':
+            values.sort(key=lambda entry: _price_order(entry['value']))
+        else:
+            values.sort(key=lambda entry: (-entry['count'], entry['value']))
+    return facets
+
+
+def get_facets(category=ANY, brand=ANY):
+    return group_facets(facet_counts(category, brand))
+
+
+async def aget_facets(category=ANY, brand=ANY):
+    return group_facets([row async for row in facet_counts(category, brand)])
@@ -0,0 +1,196 @@
+"""
+Read-only fast path for list responses: ``.values()`` rows converted by a
+plan compiled from the serializer, byte for byte the same output.
+"""
+import decimal
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import ISO_8601
+from rest_framework import fields as drf_fields
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+from djangojwt.instrumentation import timed
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+class SlowPathRequired(Exception):
+    """Raised when a value cannot be rendered byte-compatibly by orjson."""
+
+
+def _passthrough(value):
+    return value
+
+
+def _as_int(value):
+    return int(value)
+
+
+def _as_str(value):
+    return str(value)
+
+
+def _as_float(value):
+    value = float(value)
+    # repr() switches to exponent notation outside this range and orjson
+    # formats exponents differently; NaN/inf are rejected by DRF anyway.
+    if value and not 1e-4 <= abs(value) < 1e16:
+        raise SlowPathRequired
+    return value
+
+
+def _decimal_converter(field):
+    coerce_to_string = getattr(field, 'coerce_to_string', None)
+    if coerce_to_string is None:
+        coerce_to_string = api_settings.COERCE_DECIMAL_TO_STRING
+    if field.localize or getattr(field, 'normalize_output', False) or not coerce_to_string:
+        return field.to_representation
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    quantum = decimal.Decimal('.1') ** field.decimal_places if field.decimal_places is not None else None
+    rounding = field.rounding
+
+    def convert(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        if quantum is not None:
+            value = value.quantize(quantum, rounding=rounding, context=context)
+        return '{:f}'.format(value)
+    return convert
+
+
+def _datetime_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if (not settings.USE_TZ or hasattr(field, 'timezone') or output_format is None
+            or output_format.lower() != ISO_8601):
+        return field.to_representation
+
+    def convert(value):
+        # DRF's ISO 8601 output for aware values, without its per-call
+        # settings lookups.
+        if value.tzinfo is None:
+            return field.to_representation(value)
+        try:
+            value = value.astimezone(timezone.get_current_timezone()).isoformat()
+        except OverflowError:
+            return field.to_representation(value)
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+def _converter(field):
+    # Exact classes only: subclasses may override to_representation.
+    kind = type(field)
+    if kind is drf_fields.IntegerField:
+        return _as_int
+    if kind is drf_fields.CharField:
+        return _as_str
+    if kind is drf_fields.FloatField:
+        return _as_float
+    if kind is drf_fields.DecimalField:
+        return _decimal_converter(field)
+    if kind is drf_fields.BooleanField:
+        return _passthrough
+    if kind is drf_fields.DateTimeField:
+        return _datetime_converter(field)
+    return field.to_representation
+
+
+class RowPlan:
+    """
+    Per-field conversion plan compiled from a ``ModelSerializer``.
+
+    ``columns`` are the model attributes to fetch with ``.values()``;
+    ``convert_many(rows)`` turns those dicts into the serializer's output.
+    ``fields`` restricts the plan to a subset of the serializer's fields.
+    """
+
+    def __init__(self, serializer_class, fields=None):
+        serializer = serializer_class()
+        model = serializer.Meta.model
+        self.steps = []
+        for name, field in serializer.fields.items():
+            if field.write_only or (fields is not None and name not in fields):
+                continue
+            source = field.source
+            if '.' in source or source == '*':
+                raise ValueError(f'{serializer_class.__name__}.{name} has a non-column source')
+            attname = model._meta.get_field(source).attname
+            self.steps.append((name, attname, _converter(field)))
+        self.columns = tuple(dict.fromkeys(attname for _, attname, _ in self.steps))
+        # Same plan without the orjson range guard, for the json fallback.
+        self.lenient_steps = [
+            (name, attname, float if convert is _as_float else convert)
+            for name, attname, convert in self.steps
+        ]
+
+    def convert_many(self, rows, lenient=False):
+        steps = self.lenient_steps if lenient else self.steps
+        return [
+            {name: None if row[attname] is None else convert(row[attname]) for name, attname, convert in steps}
+            for row in rows
+        ]
+
+
+_json_renderer = JSONRenderer()
+
+
+def render_json(data):
+    """Render ``data`` exactly as DRF's ``JSONRenderer`` does (compact form)."""
+    if orjson is not None:
+        try:
+            content = orjson.dumps(data)
+        except (TypeError, orjson.JSONEncodeError):
+            pass
+        else:
+            return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return _json_renderer.render(data)
+
+
+def can_use_fast_path(request):
+    """True when DRF negotiated plain compact JSON for ``request``."""
+    renderer = getattr(request, 'accepted_renderer', None)
+    media_type = getattr(request, 'accepted_media_type', '') or ''
+    return type(renderer) is JSONRenderer and 'indent' not in media_type
+
+
+def fast_json_response(plan, rows, headers=None, many=True):
+    """
+    Serialise ``.values()`` rows with ``plan`` into a JSON HttpResponse
+    (a single object when ``many`` is false). Rows with values the fast
+    converters refuse are rendered by DRF's renderer instead, which gives
+    the same bytes.
+    """
+    try:
+        with timed('serialize'):
+            data = plan.convert_many(rows)
+        with timed('render'):
+            content = render_json(data if many else data[0])
+    except SlowPathRequired:
+        with timed('serialize'):
+            data = plan.convert_many(rows, lenient=True)
+        with timed('render'):
+            content = _json_renderer.render(data if many else data[0])
+    response = HttpResponse(content, content_type='application/json')
+    for header, value in (headers or {}).items():
+        response[header] = value
+    return response
+
+
+_product_plans = {}
+
+
+def get_product_plan(fields=None):
+    """``ProductSerializer`` plan for the normalised field tuple ``fields``."""
+    plan = _product_plans.get(fields)
+    if plan is None:
+        from .serializers import ProductSerializer
+        plan = _product_plans[fields] = RowPlan(ProductSerializer, fields)
+    return plan
@@ -0,0 +1,160 @@
+"""Streaming CSV importer for the product catalog."""
+import time
+from dataclasses import dataclass
+
+from django.db import router, transaction
+
+from .models import Product
+from .signals import products_bulk_changed
+
+NATURAL_KEY = ('product', 'brand')
+TEXT_COLUMNS = ('product', 'category', 'sub_category', 'brand', 'type', 'description')
+REQUIRED_TEXT_COLUMNS = ('product', 'category', 'brand')
+UPDATE_FIELDS = (
+    'category', 'sub_category', 'type', 'description',
+    'market_price', 'sale_price', 'rating', 'last_modified',
+)
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    rejected: int = 0
+    duplicates: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+def _price_limit(field):
+    """Smallest price too large for the model's ``DecimalField``."""
+    field = Product._meta.get_field(field)
+    return 10 ** (field.max_digits - field.decimal_places)
+
+
+def clean_chunk(frame, upsert=True):
+    """
+    Coerce a raw chunk (all columns read as strings) into importable rows.
+
+    Returns ``(frame, rejected, duplicates)``. Rows without a name, brand,
+    category or a valid non-negative price that fits the model are dropped
+    and counted as rejected. With ``upsert``, rows whose natural key comes
+    again later in the chunk are dropped and counted as duplicates.
+    """
+    import pandas as pd
+
+    frame = frame.reindex(columns=[*TEXT_COLUMNS, 'market_price', 'sale_price', 'rating'])
+    total = len(frame)
+
+    for column in TEXT_COLUMNS:
+        values = frame[column].astype('string').str.strip()
+        frame[column] = values.mask(values == '')
+
+    sale_price = pd.to_numeric(frame['sale_price'], errors='coerce')
+    market_price = pd.to_numeric(frame['market_price'], errors='coerce')
+    market_price = market_price.fillna(sale_price)
+    frame['sale_price'] = sale_price.round(2)
+    frame['market_price'] = market_price.round(2)
+
+    rating = pd.to_numeric(frame['rating'], errors='coerce')
+    frame['rating'] = rating.where(rating.between(0, 5))
+
+    valid = frame[list(REQUIRED_TEXT_COLUMNS)].notna().all(axis=1)
+    for column in ('sale_price', 'market_price'):
+        valid &= frame[column].ge(0) & frame[column].lt(_price_limit(column))
+    frame = frame[valid]
+    rejected = total - len(frame)
+    if upsert:
+        # Later rows win when a chunk repeats a natural key.
+        frame = frame.drop_duplicates(subset=list(NATURAL_KEY), keep='last')
+
+    frame = frame.astype(object).where(frame.notna(), None)
+    return frame, rejected, total - rejected - len(frame)
+
+
+def _existing_ids(keys, using, batch_size):
+    """Map natural keys to the id of the oldest product carrying them."""
+    existing = {}
+    keys = list(keys)
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        names = {name for name, _ in batch}
+        brands = {brand for _, brand in batch}
+        wanted = set(batch)
+        rows = (
+            Product.objects.using(using)
+            .filter(product__in=names, brand__in=brands)
+            .order_by('-id')
+            .values_list('product', 'brand', 'id')
+        )
+        for name, brand, pk in rows:
+            if (name, brand) in wanted:
+                existing[(name, brand)] = pk
+    return existing
+
+
+def _write_chunk(frame, upsert, batch_size, using):
+    records = frame.to_dict('records')
+    existing = {}
+    if upsert:
+        existing = _existing_ids(((r['product'], r['brand']) for r in records), using, batch_size)
+
+    to_create, to_update = [], []
+    for record in records:
+        pk = existing.get((record['product'], record['brand']))
+        product = Product(id=pk, **record)
+        (to_update if pk else to_create).append(product)
+
+    with transaction.atomic(using=using):
+        created = Product.objects.using(using).bulk_create(to_create, batch_size=batch_size)
+        if to_update:
+            # INSERT ... ON CONFLICT (id) DO UPDATE: one multi-row statement
+            # per batch, unlike bulk_update()'s per-column CASE expressions.
+            Product.objects.using(using).bulk_create(
+                to_update, batch_size=batch_size,
+                update_conflicts=True, unique_fields=['id'], update_fields=UPDATE_FIELDS,
+            )
+
+    changed_ids = [p.id for p in created if p.id is not None] + [p.id for p in to_update]
+    if len(changed_ids) < len(records):
+        # The backend could not return ids from the bulk insert.
+        changed_ids = list(_existing_ids(((r['product'], r['brand']) for r in records), using, batch_size).values())
+    return len(to_create), len(to_update), changed_ids
+
+
+def import_products(path, chunk_size=10000, batch_size=2000, upsert=True, encoding='utf-8', progress=None):
+    """
+    Import the CSV at ``path`` and return an ``ImportResult``.
+
+    ``progress`` is called with the running ``ImportResult`` after every
+    chunk. Each chunk is committed separately, so an interrupted import
+    keeps the chunks that finished.
+    """
+    import pandas as pd
+
+    using = router.db_for_write(Product)
+    result = ImportResult()
+    started = time.perf_counter()
+    reader = pd.read_csv(
+        path, chunksize=chunk_size, encoding=encoding, dtype=str,
+        keep_default_na=False, skipinitialspace=True,
+    )
+    for raw in reader:
+        frame, rejected, duplicates = clean_chunk(raw, upsert)
+        created, updated, changed_ids = _write_chunk(frame, upsert, batch_size, using)
+        result.rows += len(raw)
+        result.created += created
+        result.updated += updated
+        result.rejected += rejected
+        result.duplicates += duplicates
+        result.elapsed = time.perf_counter() - started
+        if changed_ids:
+            products_bulk_changed.send(sender=Product, product_ids=changed_ids, using=using)
+        if progress is not None:
+            progress(result)
+    result.elapsed = time.perf_counter() - started
+    return result
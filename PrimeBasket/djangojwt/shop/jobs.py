@@ -0,0 +1,361 @@
+"""
+Background catalog jobs (CSV imports and rebuilds), queued as CatalogJob
+rows and run on leases by ``manage.py run_workers``.
+"""
+import dataclasses
+import contextlib
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.db import close_old_connections, connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import CatalogJob, Product
+from .signals import catalog_import_finished
+
+logger = logging.getLogger(__name__)
+
+# Import options accepted from job rows, passed on to import_products.
+IMPORT_OPTIONS = ('chunk_size', 'batch_size', 'upsert', 'encoding')
+
+
+def get_jobs_dir():
+    return Path(getattr(settings, 'SHOP_JOBS_DIR', settings.BASE_DIR / 'var' / 'jobs'))
+
+
+def get_import_max_bytes():
+    """Largest CSV upload accepted for import, in bytes; None for no limit."""
+    return getattr(settings, 'SHOP_IMPORT_MAX_BYTES', 100 * 1024 * 1024)
+
+
+def _lease_seconds():
+    return getattr(settings, 'SHOP_JOB_LEASE_SECONDS', 300)
+
+
+def enqueue(kind, options=None, path='', user_id=None):
+    """Queue a job of ``kind`` (one of CatalogJob.KINDS) and return it."""
+    if kind not in dict(CatalogJob.KINDS):
+        raise ValueError(f'Unknown job kind {kind!r}')
+    return CatalogJob.objects.create(kind=kind, options=options or {}, path=str(path), created_by_id=user_id)
+
+
+def enqueue_import(upload, options=None, user_id=None):
+    """Store an uploaded CSV under ``SHOP_JOBS_DIR`` and queue its import."""
+    directory = get_jobs_dir() / 'uploads'
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f'{uuid.uuid4().hex}.csv'
+    with open(path, 'wb') as handle:
+        for chunk in upload.chunks():
+            handle.write(chunk)
+    return enqueue(CatalogJob.IMPORT, options, path, user_id)
+
+
+def _discard_upload(path):
+    """Delete a job's uploaded CSV; rebuild jobs have none."""
+    if path:
+        Path(path).unlink(missing_ok=True)
+
+
+def _fail_lost(expired, now, error):
+    """
+    Fail the ``expired`` jobs one by one and delete their uploads, skipping
+    any whose lease was renewed meanwhile. Returns how many were failed.
+    """
+    failed = 0
+    for pk, path in expired.values_list('id', 'path'):
+        if expired.filter(id=pk).update(status=CatalogJob.FAILED, locked_until=None, finished_at=now, error=error):
+            _discard_upload(path)
+            failed += 1
+    return failed
+
+
+def reclaim_expired(now=None):
+    """
+    Queue the running jobs whose lease ran out again, or fail them once
+    they have used up ``SHOP_JOB_MAX_ATTEMPTS``. Imports without upsert are
+    never queued again. Failed jobs' uploads are deleted. Returns
+    ``(queued, failed)``.
+    """
+    now = now or timezone.now()
+    max_attempts = getattr(settings, 'SHOP_JOB_MAX_ATTEMPTS', 3)
+    # Running rows without a lease were claimed before leases existed.
+    expired = CatalogJob.objects.filter(
+        Q(locked_until__lt=now) | Q(locked_until__isnull=True), status=CatalogJob.RUNNING,
+    )
+    failed = _fail_lost(
+        expired.filter(kind=CatalogJob.IMPORT, options__upsert=False), now,
+        'Worker lost during an import without upsert; some rows may be imported, so it is not retried',
+    )
+    queued = expired.filter(attempts__lt=max_attempts).update(
+        status=CatalogJob.QUEUED, worker='', locked_until=None,
+    )
+    failed += _fail_lost(
+        expired.filter(attempts__gte=max_attempts), now, f'Worker lost {max_attempts} times; giving up',
+    )
+    for count, outcome in ((queued, 'queued again'), (failed, 'failed')):
+        if count:
+            logger.warning('%d catalog job(s) lost their worker and were %s', count, outcome)
+    return queued, failed
+
+
+def claim_next(worker):
+    """Lease the oldest queued job to ``worker`` and return it, or None."""
+    now = timezone.now()
+    reclaim_expired(now)
+    candidates = CatalogJob.objects.filter(status=CatalogJob.QUEUED).order_by('id').values_list('id', flat=True)
+    for job_id in candidates[:10]:
+        # A job queued again starts its progress over.
+        claimed = CatalogJob.objects.filter(id=job_id, status=CatalogJob.QUEUED).update(
+            status=CatalogJob.RUNNING, worker=worker, started_at=now, attempts=F('attempts') + 1,
+            locked_until=now + timedelta(seconds=_lease_seconds()),
+            total_rows=None, rows=0, created=0, updated=0, rejected=0, duplicates=0,
+        )
+        if claimed:
+            return CatalogJob.objects.get(id=job_id)
+    return None
+
+
+def _owned(job):
+    """The job's row, if this claim of it is still the current one."""
+    return CatalogJob.objects.filter(id=job.pk, status=CatalogJob.RUNNING, attempts=job.attempts)
+
+
+@contextlib.contextmanager
+def heartbeat(job):
+    """Renew the lease on ``job`` from a background thread until the block exits."""
+    lease = _lease_seconds()
+    stopped = threading.Event()
+
+    def renew():
+        try:
+            while not stopped.wait(lease / 3):
+                try:
+                    _owned(job).update(locked_until=timezone.now() + timedelta(seconds=lease))
+                except Exception:
+                    logger.exception('Could not renew the lease on catalog job %s', job.pk)
+        finally:
+            # This thread's connections; the worker never shares them.
+            connections.close_all()
+
+    thread = threading.Thread(target=renew, name=f'shop-job-{job.pk}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+# Imports -------------------------------------------------------------------
+
+def split_csv(path, parts, directory, chunk_size=10000, encoding='utf-8'):
+    """
+    Partition the CSV at ``path`` into ``parts`` files in ``directory`` by
+    the importer's natural key, keeping the row order within each part.
+    Returns ``(paths, rows)``.
+    """
+    import pandas as pd
+
+    from .importer import NATURAL_KEY
+
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = [directory / f'part-{index}.csv' for index in range(parts)]
+    written = [False] * parts
+    rows = 0
+    reader = pd.read_csv(
+        path, chunksize=chunk_size, encoding=encoding, dtype=str,
+        keep_default_na=False, skipinitialspace=True,
+    )
+    for frame in reader:
+        rows += len(frame)
+        # Keyed the way clean_chunk normalises the columns.
+        keys = frame.reindex(columns=list(NATURAL_KEY)).fillna('').apply(lambda column: column.str.strip())
+        part_of = pd.util.hash_pandas_object(keys, index=False).to_numpy() % parts
+        for index in range(parts):
+            part = frame[part_of == index]
+            if len(part):
+                part.to_csv(paths[index], mode='a', header=not written[index], index=False, encoding='utf-8')
+                written[index] = True
+    return [path for path, used in zip(paths, written) if used], rows
+
+
+def import_part(job_id, path, options):
+    """Pool task: import one part, adding its progress to the job row."""
+    from .importer import ImportResult, import_products
+
+    reported = ImportResult()
+
+    def report(result):
+        CatalogJob.objects.filter(id=job_id).update(
+            rows=F('rows') + (result.rows - reported.rows),
+            created=F('created') + (result.created - reported.created),
+            updated=F('updated') + (result.updated - reported.updated),
+            rejected=F('rejected') + (result.rejected - reported.rejected),
+            duplicates=F('duplicates') + (result.duplicates - reported.duplicates),
+        )
+        reported.rows, reported.created = result.rows, result.created
+        reported.updated, reported.rejected = result.updated, result.rejected
+        reported.duplicates = result.duplicates
+
+    return dataclasses.asdict(import_products(path, progress=report, **options))
+
+
+def _run_import(job, pool, processes):
+    options = {name: value for name, value in job.options.items() if name in IMPORT_OPTIONS}
+    started = time.perf_counter()
+    directory = get_jobs_dir() / f'job-{job.pk}'
+    # Parts left behind by an attempt whose worker died.
+    shutil.rmtree(directory, ignore_errors=True)
+    try:
+        paths, rows = split_csv(
+            job.path, processes, directory,
+            chunk_size=options.get('chunk_size', 10000), encoding=options.get('encoding', 'utf-8'),
+        )
+        CatalogJob.objects.filter(id=job.pk).update(total_rows=rows)
+        futures = [pool.submit(import_part, job.pk, str(path), options) for path in paths]
+        # Every part runs to the end; a failed one fails the job, while the
+        # chunks other parts committed stay imported.
+        wait(futures)
+        results = [future.result() for future in futures]
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    _discard_upload(job.path)
+    summary = {key: sum(result[key] for result in results) for key in ('rows', 'created', 'updated', 'rejected', 'duplicates')}
+    summary['parts'] = len(paths)
+    summary['elapsed'] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+# Rebuilds ------------------------------------------------------------------
+
+def _rebuild_search_index(options):
+    from .search import get_search_backend
+
+    with transaction.atomic(using=router.db_for_write(Product)):
+        total = get_search_backend().rebuild(batch_size=options.get('batch_size', 2000))
+    return {'products': total or 0}
+
+
+def _rebuild_facets(options):
+    from .facets import rebuild_facets
+
+    return {'products': rebuild_facets(batch_size=options.get('batch_size', 2000))}
+
+
+def _build_similar_products(options):
+    from .recommendations import build_similar_products
+
+    return build_similar_products(top_k=options.get('top_k', 20), full=options.get('full', False))
+
+
+def _build_bought_together(options):
+    from .bought_together import build_bought_together
+
+    return build_bought_together(
+        top_k=options.get('top_k', 20), min_count=options.get('min_count', 2), full=options.get('full', False),
+    )
+
+
+def _export_snapshot(options):
+    from .snapshot import export_catalog_snapshot
+
+    return export_catalog_snapshot(only_if_stale=options.get('if_stale', True))
+
+
+REBUILDS = {
+    'search_index': _rebuild_search_index,
+    'facets': _rebuild_facets,
+    'similar_products': _build_similar_products,
+    'bought_together': _build_bought_together,
+    'snapshot': _export_snapshot,
+}
+
+
+def run_rebuild(kind, options):
+    """Pool task: run the rebuild ``kind`` and return its summary."""
+    return REBUILDS[kind](options)
+
+
+# Workers -------------------------------------------------------------------
+
+def _finish(job, status, **fields):
+    # A claim whose lease ran out no longer owns the row; leave it be.
+    return _owned(job).update(status=status, finished_at=timezone.now(), locked_until=None, **fields)
+
+
+def run_job(job, pool, processes):
+    """Run a claimed job on ``pool`` and record the outcome on its row."""
+    try:
+        with heartbeat(job):
+            if job.kind == CatalogJob.IMPORT:
+                result = _run_import(job, pool, processes)
+            else:
+                result = pool.submit(run_rebuild, job.kind, job.options).result()
+    except Exception as exc:
+        logger.exception('Catalog job %s (%s) failed', job.pk, job.kind)
+        # Failed jobs are not run again, so their upload can go; unless the
+        # lease ran out and another worker has the job now.
+        if _finish(job, CatalogJob.FAILED, error=f'{type(exc).__name__}: {exc}'):
+            _discard_upload(job.path)
+        if isinstance(exc, BrokenProcessPool):
+            raise
+        return False
+    if not _finish(job, CatalogJob.SUCCEEDED, result=result):
+        logger.warning('Catalog job %s finished after its lease ran out; result dropped', job.pk)
+        return False
+    if job.kind == CatalogJob.IMPORT:
+        catalog_import_finished.send(sender=CatalogJob, job=job, result=result, using=router.db_for_write(Product))
+    return True
+
+
+def _pool(processes):
+    # Fresh interpreters rather than forks, so no process inherits the
+    # supervisor's database connections; each one sets Django up first.
+    return ProcessPoolExecutor(processes, mp_context=get_context('spawn'), initializer=django.setup)
+
+
+def run_workers(processes=None, poll_interval=1.0, burst=False, log=None):
+    """
+    Claim and run jobs until interrupted, or with ``burst`` until the queue
+    is empty. Returns the number of jobs run.
+    """
+    processes = processes or getattr(settings, 'SHOP_JOB_WORKERS', None) or os.cpu_count() or 1
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    done = 0
+    pool = _pool(processes)
+    try:
+        while True:
+            close_old_connections()
+            job = claim_next(worker)
+            if job is None:
+                if burst:
+                    return done
+                time.sleep(poll_interval)
+                continue
+            if log is not None:
+                log(f'Job {job.pk}: {job.kind}' + (f' (attempt {job.attempts})' if job.attempts > 1 else ''))
+            try:
+                succeeded = run_job(job, pool, processes)
+            except BrokenProcessPool:
+                # A pool process died (out of memory, killed); start over.
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = _pool(processes)
+                succeeded = False
+            done += 1
+            if log is not None:
+                log(f'Job {job.pk}: {"succeeded" if succeeded else "failed"}')
+    finally:
+        pool.shutdown(cancel_futures=True)
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.bought_together import build_bought_together, get_state_path
+
+
+class Command(BaseCommand):
+    help = (
+        "Build or incrementally refresh the \"frequently bought together\" lists from cart contents. "
+        "Once a counted cart item is removed, the next run recounts every cart."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None, help="Counts file (defaults to SHOP_BOUGHT_TOGETHER_DIR/counts.npz)")
+        parser.add_argument('--top-k', type=int, default=20, help="Partners kept per product")
+        parser.add_argument('--min-count', type=int, default=2, help="Carts two products must share to be listed")
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--full', action='store_true', help="Recount all carts instead of only new cart items")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        summary = build_bought_together(
+            path=options['path'],
+            top_k=options['top_k'],
+            min_count=options['min_count'],
+            full=options['full'],
+            batch_size=options['batch_size'],
+        )
+        elapsed = time.perf_counter() - started
+        details = ', '.join(f"{key}={value}" for key, value in summary.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Bought-together counts at {options['path'] or get_state_path()}: {details} ({elapsed:.2f}s)"
+        ))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.recommendations import build_similar_products, get_model_dir
+
+
+class Command(BaseCommand):
+    help = "Build or incrementally refresh the similar-products model"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None, help="Model directory (defaults to SHOP_RECOMMENDATIONS_DIR)")
+        parser.add_argument('--top-k', type=int, default=20, help="Neighbours kept per product")
+        parser.add_argument('--chunk-size', type=int, default=512, help="Rows scored per sparse matrix product")
+        parser.add_argument('--full', action='store_true', help="Refit the vectorizer instead of updating in place")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        summary = build_similar_products(
+            path=options['path'],
+            top_k=options['top_k'],
+            chunk_size=options['chunk_size'],
+            full=options['full'],
+        )
+        elapsed = time.perf_counter() - started
+        details = ', '.join(f"{key}={value}" for key, value in summary.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Similar products model at {options['path'] or get_model_dir()}: {details} ({elapsed:.2f}s)"
+        ))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.snapshot import export_catalog_snapshot, get_snapshot_dir
+
+
+class Command(BaseCommand):
+    help = "Export the columnar catalog snapshot served with SHOP_SNAPSHOT_READS"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None, help="Snapshot directory (defaults to SHOP_SNAPSHOT_DIR)")
+        parser.add_argument('--if-stale', action='store_true',
+                            help="Do nothing if the snapshot already matches the catalog version")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        summary = export_catalog_snapshot(path=options['path'], only_if_stale=options['if_stale'])
+        elapsed = time.perf_counter() - started
+        details = ', '.join(f"{key}={value}" for key, value in summary.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Catalog snapshot at {options['path'] or get_snapshot_dir()}: {details} ({elapsed:.2f}s)"
+        ))
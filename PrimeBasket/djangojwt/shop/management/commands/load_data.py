@@ -1,22 +1,39 @@
-import pandas as pd
-from django.core.management.base import BaseCommand
-from shop.models import Product
+from django.core.management.base import BaseCommand, CommandError
+from shop.importer import import_products
 
 class Command(BaseCommand):
     help = "Load products from CSV"
 
-    def handle(self, *args, **kwargs):
-        df = pd.read_csv('d:/Python/Django_Project/Prime_basket_app_with_matheen/PrimeBasket/djangojwt/shop/management/commands/datab.csv', encoding='utf-8')
-        for _, row in df.iterrows():
-            Product.objects.create(
-                category=row.get("category", ""),
-                sub_category=row.get("sub_category", ""),
-                brand=row.get("brand", ""),
-                product=row.get("product", ""),
-                type=row.get("type", ""),
-                description=row.get("description", ""),
-                market_price=row.get("market_price", 0),
-                sale_price=row.get("sale_price", 0),
-                rating=row.get("rating", None)
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file with one product per row")
+        parser.add_argument('--chunk-size', type=int, default=10000, help="Rows read and committed per chunk")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Rows per INSERT/UPDATE statement")
+        parser.add_argument('--no-upsert', action='store_true',
+                            help="Always insert, even when a product with the same name and brand exists")
+        parser.add_argument('--encoding', default='utf-8')
+
+    def handle(self, *args, **options):
+        def report(result):
+            self.stdout.write(
+                f"{result.rows:>10,} rows  {result.created:,} created  {result.updated:,} updated  "
+                f"{result.rejected:,} rejected  {result.duplicates:,} duplicates  "
+                f"({result.rows_per_second:,.0f} rows/s)"
+            )
+
+        try:
+            result = import_products(
+                options['path'],
+                chunk_size=options['chunk_size'],
+                batch_size=options['batch_size'],
+                upsert=not options['no_upsert'],
+                encoding=options['encoding'],
+                progress=report,
             )
-        self.stdout.write(self.style.SUCCESS("Successfully loaded products"))
+        except FileNotFoundError as exc:
+            raise CommandError(f"File not found: {options['path']}") from exc
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully loaded products: {result.rows:,} rows in {result.elapsed:.1f}s "
+            f"({result.rows_per_second:,.0f} rows/s), {result.created:,} created, "
+            f"{result.updated:,} updated, {result.rejected:,} rejected, {result.duplicates:,} duplicates"
+        ))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+
+from shop.models import Product
+from shop.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product full-text search index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        started = time.perf_counter()
+        with transaction.atomic(using=router.db_for_write(Product)):
+            total = backend.rebuild(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {total or 0} products with {type(backend).__name__} in {elapsed:.2f}s"
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from shop.jobs import run_workers
+
+
+class Command(BaseCommand):
+    help = "Run queued catalog jobs (imports and rebuilds) on a process pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None, help="Pool size (defaults to SHOP_JOB_WORKERS)")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between checks of an empty queue")
+        parser.add_argument('--burst', action='store_true', help="Exit once the queue is empty")
+
+    def handle(self, *args, **options):
+        done = run_workers(
+            processes=options['processes'],
+            poll_interval=options['poll_interval'],
+            burst=options['burst'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Ran {done} catalog jobs"))
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:07
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_product_natural_key_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='brand_lower',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.Lower('brand'), output_field=models.CharField(max_length=100)),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='category_lower',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.Lower('category'), output_field=models.CharField(max_length=100)),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['sale_price', 'id'], name='shop_prod_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['rating', 'id'], name='shop_prod_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category_lower', 'id'], name='shop_prod_cat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category_lower', 'sale_price', 'id'], name='shop_prod_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category_lower', 'rating', 'id'], name='shop_prod_cat_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['brand_lower', 'id'], name='shop_prod_brand_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['brand_lower', 'sale_price', 'id'], name='shop_prod_brand_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['brand_lower', 'rating', 'id'], name='shop_prod_brand_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category_lower', 'brand_lower', 'id'], name='shop_prod_cat_brand_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category_lower', 'brand_lower', 'sale_price', 'id'], name='shop_prod_cat_brand_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category_lower', 'brand_lower', 'rating', 'id'], name='shop_prod_cat_brand_rating_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+"""
+Give every cart item an owner (one cart per user).
+
+Before this migration all users shared a single global cart, whose items
+have no user to be assigned to. They are DELETED: migrating forward empties
+the cart. Migrating back keeps the items but drops their owners, merging
+them into one global cart again.
+"""
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def delete_shared_cart(apps, schema_editor):
+    # Items of the old global cart have no owner to be assigned to.
+    # Nothing to undo on the way back, hence RunPython.noop below.
+    CartItem = apps.get_model('shop', 'CartItem')
+    CartItem.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('shop', '0005_product_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_shared_cart, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='cartitem',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='cart_items', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='cartitem',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_items', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='shop_cartitem_user_product_uniq'),
+        ),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:39
+
+from bisect import bisect_right
+from collections import Counter
+
+from django.conf import settings
+from django.db import migrations, models
+
+# The counting of shop.facets as of this migration, against the historical
+# models, so later changes to that module or the models cannot break it.
+PRICE_BUCKETS = (0, 50, 100, 200, 500, 1000)
+
+
+def _rating_band(rating):
+    if rating is None:
+        return 'unrated'
+    low = min(max(int(rating), 0), 4)
+    return f'{low}-{low + 1}'
+
+
+def _price_bucket(price, bounds):
+    index = max(bisect_right(bounds, price) - 1, 0)
+    if index == len(bounds) - 1:
+        return f'{bounds[index]}+'
+    return f'{bounds[index]}-{bounds[index + 1]}'
+
+
+def _cells(category, category_key, sub_category, brand, brand_key, rating, price):
+    for brand_context in ('', brand_key):
+        yield '', brand_context, 'category', category
+    for category_context in ('', category_key):
+        yield category_context, '', 'brand', brand
+        for brand_context in ('', brand_key):
+            if sub_category:
+                yield category_context, brand_context, 'sub_category', sub_category
+            yield category_context, brand_context, 'rating', rating
+            yield category_context, brand_context, 'price', price
+
+
+def count_facets(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    Product = apps.get_model('shop', 'Product')
+    FacetedProduct = apps.get_model('shop', 'FacetedProduct')
+    FacetCount = apps.get_model('shop', 'FacetCount')
+    bounds = tuple(getattr(settings, 'SHOP_FACET_PRICE_BUCKETS', PRICE_BUCKETS))
+    counts = Counter()
+    batch = []
+    rows = Product.objects.using(alias).order_by().values_list(
+        'id', 'category', 'category_lower', 'sub_category', 'brand', 'brand_lower', 'rating', 'sale_price',
+    ).iterator(chunk_size=2000)
+    for pk, category, category_key, sub_category, brand, brand_key, rating, sale_price in rows:
+        key = (category, category_key, sub_category, brand, brand_key, _rating_band(rating), _price_bucket(sale_price, bounds))
+        counts.update(_cells(*key))
+        batch.append(FacetedProduct(pk, *key))
+        if len(batch) >= 2000:
+            FacetedProduct.objects.using(alias).bulk_create(batch)
+            batch = []
+    FacetedProduct.objects.using(alias).bulk_create(batch)
+    FacetCount.objects.using(alias).bulk_create(
+        (FacetCount(category_key=c, brand_key=b, facet=f, value=v, count=n) for (c, b, f, v), n in counts.items()),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_catalogversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetedProduct',
+            fields=[
+                ('product_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('category', models.CharField(max_length=100)),
+                ('category_key', models.CharField(max_length=100)),
+                ('sub_category', models.CharField(max_length=100, null=True)),
+                ('brand', models.CharField(max_length=100)),
+                ('brand_key', models.CharField(max_length=100)),
+                ('rating', models.CharField(max_length=20)),
+                ('price', models.CharField(max_length=20)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category_key', models.CharField(max_length=100)),
+                ('brand_key', models.CharField(max_length=100)),
+                ('facet', models.CharField(max_length=20)),
+                ('value', models.CharField(max_length=100)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('category_key', 'brand_key', 'facet', 'value'), name='shop_facetcount_key_uniq')],
+            },
+        ),
+        migrations.RunPython(count_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:08
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_facet_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='last_modified',
+            field=models.DateTimeField(auto_now=True, db_default=django.db.models.functions.datetime.Now()),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['last_modified', 'id'], name='shop_prod_modified_idx'),
+        ),
+    ]
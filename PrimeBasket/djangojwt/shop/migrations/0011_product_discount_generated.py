@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:40
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+import django.db.models.functions.math
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_bought_together'),
+    ]
+
+    # A column cannot be altered into a generated one, so discount is
+    # dropped and re-added; the database recomputes it for every row.
+    operations = [
+        migrations.RemoveField(
+            model_name='product',
+            name='discount',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='discount',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(market_price__gt=models.F('sale_price'), then=django.db.models.functions.math.Round(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Cast(django.db.models.expressions.CombinedExpression(models.F('market_price'), '-', models.F('sale_price')), models.FloatField()), '*', models.Value(100)), '/', django.db.models.functions.comparison.Cast('market_price', models.FloatField())), 2)), models.When(market_price__gt=0, then=models.Value(0.0)), default=None, output_field=models.FloatField()), output_field=models.FloatField()),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_catalog_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='trending',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['trending', 'id'], name='shop_prod_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category_lower', 'trending', 'id'], name='shop_prod_cat_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['brand_lower', 'trending', 'id'], name='shop_prod_brand_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category_lower', 'brand_lower', 'trending', 'id'], name='shop_prod_cat_brand_trend_idx'),
+        ),
+    ]
@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.db import models
+from django.db.models.functions import Cast, Lower, Now, Round
 
 class Product(models.Model):
     id = models.AutoField(primary_key=True)
@@ -11,8 +13,186 @@ class Product(models.Model):
     market_price = models.DecimalField(max_digits=10, decimal_places=2)
     sale_price = models.DecimalField(max_digits=10, decimal_places=2)
     rating = models.FloatField(blank=True, null=True)
-    discount = models.FloatField(blank=True, null=True)
+    # Percent off the market price, rounded to 2 places, maintained by the
+    # database on every write. 0 when the sale price is not lower, NULL
+    # without a market price.
+    discount = models.GeneratedField(
+        expression=models.Case(
+            models.When(
+                market_price__gt=models.F('sale_price'),
+                # In floating point: SQLite stores whole prices as integers,
+                # and integer division would truncate.
+                then=Round(
+                    Cast(models.F('market_price') - models.F('sale_price'), models.FloatField()) * 100
+                    / Cast('market_price', models.FloatField()),
+                    2,
+                ),
+            ),
+            models.When(market_price__gt=0, then=models.Value(0.0)),
+            default=None,
+            output_field=models.FloatField(),
+        ),
+        output_field=models.FloatField(),
+        db_persist=True,
+    )
+    # Set on every save and by the importer; the database fills it in for
+    # rows inserted with raw SQL. Drives incremental exports (?since=).
+    last_modified = models.DateTimeField(auto_now=True, db_default=Now())
+    # Time-decayed popularity from views and cart adds, in log2 space (see
+    # shop.popularity). Written by the counters' flush, never by the
+    # importer; NULL until the product is first seen.
+    trending = models.FloatField(blank=True, null=True, editable=False)
+    # Lower-cased copies of the listing filters, maintained by the database,
+    # so case-insensitive filtering can use the indexes below.
+    category_lower = models.GeneratedField(
+        expression=Lower('category'),
+        output_field=models.CharField(max_length=100),
+        db_persist=True,
+    )
+    brand_lower = models.GeneratedField(
+        expression=Lower('brand'),
+        output_field=models.CharField(max_length=100),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            # Natural key used by the CSV importer to match existing rows.
+            models.Index(fields=['brand', 'product'], name='shop_product_natural_key'),
+            # One index per filter + sort combination of /api/shop/products/.
+            # The trailing id is the tie-breaker of every listing order.
+            models.Index(fields=['sale_price', 'id'], name='shop_prod_price_idx'),
+            models.Index(fields=['rating', 'id'], name='shop_prod_rating_idx'),
+            models.Index(fields=['category_lower', 'id'], name='shop_prod_cat_idx'),
+            models.Index(fields=['category_lower', 'sale_price', 'id'], name='shop_prod_cat_price_idx'),
+            models.Index(fields=['category_lower', 'rating', 'id'], name='shop_prod_cat_rating_idx'),
+            models.Index(fields=['brand_lower', 'id'], name='shop_prod_brand_idx'),
+            models.Index(fields=['brand_lower', 'sale_price', 'id'], name='shop_prod_brand_price_idx'),
+            models.Index(fields=['brand_lower', 'rating', 'id'], name='shop_prod_brand_rating_idx'),
+            models.Index(fields=['category_lower', 'brand_lower', 'id'], name='shop_prod_cat_brand_idx'),
+            models.Index(
+                fields=['category_lower', 'brand_lower', 'sale_price', 'id'], name='shop_prod_cat_brand_price_idx',
+            ),
+            models.Index(
+                fields=['category_lower', 'brand_lower', 'rating', 'id'], name='shop_prod_cat_brand_rating_idx',
+            ),
+            models.Index(fields=['trending', 'id'], name='shop_prod_trending_idx'),
+            models.Index(fields=['category_lower', 'trending', 'id'], name='shop_prod_cat_trending_idx'),
+            models.Index(fields=['brand_lower', 'trending', 'id'], name='shop_prod_brand_trending_idx'),
+            models.Index(
+                fields=['category_lower', 'brand_lower', 'trending', 'id'], name='shop_prod_cat_brand_trend_idx',
+            ),
+            # Incremental exports, in (last_modified, id) order.
+            models.Index(fields=['last_modified', 'id'], name='shop_prod_modified_idx'),
+        ]
 
 class CartItem(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='cart_items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
-    quantity = models.PositiveIntegerField(default=1)
\ No newline at end of file
+    quantity = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='shop_cartitem_user_product_uniq'),
+        ]
+
+
+class CatalogVersion(models.Model):
+    """Single-row counter bumped on every catalog write (see shop.versioning)."""
+    SINGLETON_ID = 1
+
+    version = models.BigIntegerField(default=0)
+
+
+class FacetCount(models.Model):
+    """Products matching ``category_key``/``brand_key`` ('' for any) whose ``facet`` is ``value``."""
+    category_key = models.CharField(max_length=100)
+    brand_key = models.CharField(max_length=100)
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=100)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['category_key', 'brand_key', 'facet', 'value'], name='shop_facetcount_key_uniq',
+            ),
+        ]
+
+
+class FacetedProduct(models.Model):
+    """The facet values each product is currently counted under in FacetCount."""
+    product_id = models.IntegerField(primary_key=True)
+    category = models.CharField(max_length=100)
+    category_key = models.CharField(max_length=100)
+    sub_category = models.CharField(max_length=100, null=True)
+    brand = models.CharField(max_length=100)
+    brand_key = models.CharField(max_length=100)
+    rating = models.CharField(max_length=20)
+    price = models.CharField(max_length=20)
+
+
+class BoughtTogether(models.Model):
+    """One row per (product, rank) of its "frequently bought together" list."""
+    # Covered by the (product, rank) constraint.
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', db_index=False)
+    partner = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='bought_with')
+    rank = models.PositiveSmallIntegerField()
+    # Carts holding both products, and that count normalised by how many
+    # carts hold each of them.
+    count = models.PositiveIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='shop_boughttogether_rank_uniq'),
+        ]
+
+
+class CatalogJob(models.Model):
+    """A queued catalog import or rebuild, run by ``manage.py run_workers`` (see shop.jobs)."""
+    IMPORT = 'import'
+    KINDS = (
+        (IMPORT, 'Product CSV import'),
+        ('search_index', 'Search index rebuild'),
+        ('facets', 'Facet recount'),
+        ('similar_products', 'Similar products model'),
+        ('bought_together', 'Bought together lists'),
+        ('snapshot', 'Catalog snapshot'),
+    )
+    QUEUED, RUNNING, SUCCEEDED, FAILED = 'queued', 'running', 'succeeded', 'failed'
+    STATUSES = ((QUEUED, 'Queued'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed'))
+
+    kind = models.CharField(max_length=30, choices=KINDS)
+    status = models.CharField(max_length=20, choices=STATUSES, default=QUEUED)
+    options = models.JSONField(default=dict, blank=True)
+    # Uploaded CSV of an import, removed once the import succeeds.
+    path = models.CharField(max_length=500, blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    # Import progress, added to by every part as its chunks commit.
+    total_rows = models.IntegerField(null=True, blank=True)
+    rows = models.IntegerField(default=0)
+    created = models.IntegerField(default=0)
+    updated = models.IntegerField(default=0)
+    rejected = models.IntegerField(default=0)
+    # Rows superseded by a later row with the same natural key.
+    duplicates = models.IntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    # host:pid of the run_workers process that claimed the job.
+    worker = models.CharField(max_length=100, blank=True)
+    # Times the job was claimed; a job whose worker died is queued again
+    # until this reaches SHOP_JOB_MAX_ATTEMPTS.
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Renewed by the worker while the job runs; a running job past its
+    # lease has lost its worker.
+    locked_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers take the oldest queued job.
+            models.Index(fields=['status', 'id'], name='shop_catalogjob_queue_idx'),
+        ]
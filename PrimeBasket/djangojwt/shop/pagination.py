@@ -0,0 +1,176 @@
+"""Keyset (cursor) pagination for the catalog endpoints."""
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(ordering, value, pk, after=True):
+    if isinstance(value, Decimal):
+        value = str(value)
+    payload = json.dumps({'o': ordering, 'v': value, 'id': pk, 'd': 'next' if after else 'prev'},
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, ordering):
+    """Return ``(value, pk, after)`` for a cursor issued for ``ordering``."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if payload['o'] != ordering or payload['d'] not in ('next', 'prev'):
+            raise InvalidCursor('Cursor does not belong to this listing')
+        return payload['v'], int(payload['id']), payload['d'] == 'next'
+    except (ValueError, KeyError, TypeError, binascii.Error) as exc:
+        raise InvalidCursor('Invalid cursor') from exc
+
+
+def get_page_size(request):
+    default = getattr(settings, 'SHOP_PAGE_SIZE', 50)
+    maximum = getattr(settings, 'SHOP_MAX_PAGE_SIZE', 200)
+    try:
+        page_size = int(request.GET.get('page_size', default))
+    except ValueError:
+        return default
+    return min(max(page_size, 1), maximum)
+
+
+@dataclass
+class KeysetPage:
+    rows: list
+    next_cursor: str = None
+    previous_cursor: str = None
+
+    def link_headers(self, request):
+        links = []
+        for rel, cursor in (('next', self.next_cursor), ('prev', self.previous_cursor)):
+            if cursor:
+                query = request.GET.copy()
+                query['cursor'] = cursor
+                links.append(f'<{request.build_absolute_uri(request.path)}?{query.urlencode()}>; rel="{rel}"')
+        return {'Link': ', '.join(links)} if links else {}
+
+
+def build_page(rows, page_size, ordering, key, position, after):
+    """
+    Turn ``page_size + 1`` rows fetched in scan order into a page. ``key``
+    maps a row to its (sort value, id) position.
+    """
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if not after:
+        rows.reverse()
+    has_next = has_more if after else True
+    has_previous = position is not None if after else has_more
+    page = KeysetPage(rows)
+    if rows and has_next:
+        page.next_cursor = encode_cursor(ordering, *key(rows[-1]), after=True)
+    if rows and has_previous:
+        page.previous_cursor = encode_cursor(ordering, *key(rows[0]), after=False)
+    return page
+
+
+def _row_value(row, name):
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+def _after_position(field, value, pk, scan_descending):
+    """Rows strictly past (value, pk) when scanning (field, id) in that direction."""
+    if field == 'id':
+        return Q(id__lt=pk) if scan_descending else Q(id__gt=pk)
+    bound, tie = ('lte', 'gte') if scan_descending else ('gte', 'lte')
+    # "field >= value AND NOT (field = value AND id <= pk)" keeps the
+    # predicate a single range on the (field, id) index.
+    return Q(**{f'{field}__{bound}': value}) & ~Q(**{field: value, f'id__{tie}': pk})
+
+
+def _scan_segments(queryset, field, descending, nullable, position, after):
+    """
+    Yield querysets that, concatenated, list rows in scan order starting
+    right after ``position``. NULL sort values are listed last (in display
+    order) as their own segment so each query stays an index range scan.
+    """
+    scan_descending = descending if after else not descending
+    prefix = '-' if scan_descending else ''
+    ordering = (f'{prefix}{field}', f'{prefix}id') if field != 'id' else (f'{prefix}id',)
+    values = queryset.filter(**{f'{field}__isnull': False}) if nullable else queryset
+    nulls = queryset.filter(**{f'{field}__isnull': True}).order_by(f'{prefix}id') if nullable else None
+
+    if position is None:
+        segments = [values.order_by(*ordering)]
+        if nulls is not None:
+            segments.append(nulls)
+        yield from segments
+        return
+
+    value, pk = position
+    if value is None and nullable:
+        id_filter = Q(id__lt=pk) if scan_descending else Q(id__gt=pk)
+        yield nulls.filter(id_filter)
+        if not after:
+            yield values.order_by(*ordering)
+        return
+
+    yield values.filter(_after_position(field, value, pk, scan_descending)).order_by(*ordering)
+    if after and nulls is not None:
+        yield nulls
+
+
+def _cursor_position(queryset, ordering, field, nullable, cursor):
+    if not cursor:
+        return None, True
+    value, pk, after = decode_cursor(cursor, ordering)
+    if value is None and not nullable:
+        raise InvalidCursor('Invalid cursor')
+    if value is not None:
+        try:
+            value = queryset.model._meta.get_field(field).to_python(value)
+        except ValidationError as exc:
+            raise InvalidCursor('Invalid cursor') from exc
+    return (value, pk), after
+
+
+def _row_key(field):
+    def key(row):
+        return _row_value(row, field), _row_value(row, 'id')
+    return key
+
+
+def paginate_queryset(queryset, ordering, field, descending=False, nullable=False, cursor=None, page_size=50):
+    """
+    Return a ``KeysetPage`` of ``queryset`` ordered by ``(field, id)``.
+
+    ``ordering`` names the sort mode and is embedded in cursors so a cursor
+    from one listing cannot be replayed against another. Raises
+    ``InvalidCursor`` for malformed cursors.
+    """
+    position, after = _cursor_position(queryset, ordering, field, nullable, cursor)
+    limit = page_size + 1
+    rows = []
+    for segment in _scan_segments(queryset, field, descending, nullable, position, after):
+        rows.extend(segment[:limit - len(rows)])
+        if len(rows) >= limit:
+            break
+    return build_page(rows, page_size, ordering, _row_key(field), position, after)
+
+
+async def apaginate_queryset(queryset, ordering, field, descending=False, nullable=False, cursor=None, page_size=50):
+    """Async version of ``paginate_queryset`` for async views."""
+    position, after = _cursor_position(queryset, ordering, field, nullable, cursor)
+    limit = page_size + 1
+    rows = []
+    for segment in _scan_segments(queryset, field, descending, nullable, position, after):
+        async for row in segment[:limit - len(rows)].aiterator():
+            rows.append(row)
+        if len(rows) >= limit:
+            break
+    return build_page(rows, page_size, ordering, _row_key(field), position, after)
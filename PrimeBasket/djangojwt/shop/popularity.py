@@ -0,0 +1,184 @@
+"""
+Trending scores from product views and cart adds, counted in memory and
+flushed to ``Product.trending`` by a background thread.
+"""
+import atexit
+import datetime
+import functools
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from inspect import iscoroutinefunction
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Abs, Greatest, Ln, Power
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+# ``trending`` holds log2(sum of weight * 2 ** ((t - EPOCH) / half_life)) over
+# events at times t: ordering by it orders by the decayed score without
+# rewriting rows as time passes, and flushes add with a commutative log-add.
+# Origin of the score's time axis. Fixed: scores written against another
+# epoch would not be comparable.
+EPOCH = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc).timestamp()
+# Most products per UPDATE statement.
+FLUSH_BATCH = 500
+
+DEFAULT_WEIGHTS = {'view': 1.0, 'cart': 5.0}
+
+
+def enabled():
+    return getattr(settings, 'SHOP_TRENDING', True)
+
+
+def _half_life():
+    return getattr(settings, 'SHOP_TRENDING_HALF_LIFE', 86400)
+
+
+def _weight(event):
+    return getattr(settings, 'SHOP_TRENDING_WEIGHTS', DEFAULT_WEIGHTS).get(event, 0.0)
+
+
+def score_at(total, when=None):
+    """The ``trending`` value of ``total`` weight recorded at ``when`` (a Unix time, default now)."""
+    when = time.time() if when is None else when
+    return math.log2(total) + (when - EPOCH) / _half_life()
+
+
+def current_score(trending, now=None):
+    """The decayed score a stored ``trending`` value stands for at ``now``."""
+    if trending is None:
+        return 0.0
+    now = time.time() if now is None else now
+    return 2 ** (trending - (now - EPOCH) / _half_life())
+
+
+def _log_add(score):
+    """SQL for ``log2(2 ** trending + 2 ** score)``; ``score`` when ``trending`` is NULL."""
+    current = F('trending')
+    value = Value(score)
+    combined = Greatest(current, value) + Ln(1 + Power(2, -Abs(current - value))) / math.log(2)
+    return Case(When(trending__isnull=True, then=value), default=combined, output_field=FloatField())
+
+
+def write_counts(counts, when=None):
+    """Add ``{product_id: weight}`` recorded at ``when`` to the scores; returns the products written."""
+    when = time.time() if when is None else when
+    # Products with the same total get the same increment, so each distinct
+    # total is one plain UPDATE ... WHERE id IN (...). Totals are mostly
+    # small multiples of the weights, so there are few of them.
+    by_total = defaultdict(list)
+    for product_id, total in counts.items():
+        if total > 0:
+            by_total[total].append(product_id)
+    for total, product_ids in by_total.items():
+        score = score_at(total, when)
+        for start in range(0, len(product_ids), FLUSH_BATCH):
+            Product.objects.filter(id__in=product_ids[start:start + FLUSH_BATCH]).update(trending=_log_add(score))
+    return sum(len(product_ids) for product_ids in by_total.values())
+
+
+class PopularityCounter:
+    """Per-process event counts, written out by a background thread."""
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def record(self, product_id, weight):
+        with self._lock:
+            self._counts[product_id] = self._counts.get(product_id, 0.0) + weight
+            pending = len(self._counts)
+            if self._thread is None:
+                self._start()
+        if pending >= getattr(settings, 'SHOP_TRENDING_MAX_PENDING', 10000):
+            self._wakeup.set()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name='shop-popularity-flush', daemon=True)
+        self._thread.start()
+
+    def drain(self):
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        return counts
+
+    def flush(self):
+        """Write the pending counts now; returns the number of products written."""
+        counts = self.drain()
+        if not counts:
+            return 0
+        try:
+            return write_counts(counts)
+        except Exception:
+            logger.exception('Could not write %d trending counts; retrying at the next flush', len(counts))
+            # Put them back for the next attempt.
+            with self._lock:
+                for product_id, weight in counts.items():
+                    self._counts[product_id] = self._counts.get(product_id, 0.0) + weight
+            return 0
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(getattr(settings, 'SHOP_TRENDING_FLUSH_INTERVAL', 10.0))
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                # This thread's connections; requests never share them.
+                connections.close_all()
+
+
+_counter = PopularityCounter()
+# A forked worker starts with no counts and starts its own thread.
+os.register_at_fork(after_in_child=_counter._reset)
+atexit.register(_counter.flush)
+
+
+def get_counter():
+    return _counter
+
+
+def record_view(product_id):
+    if enabled():
+        _counter.record(product_id, _weight('view'))
+
+
+def record_cart_add(product_id, quantity=1):
+    if enabled():
+        _counter.record(product_id, _weight('cart') * quantity)
+
+
+def counts_product_views(view):
+    """
+    Count successful responses of a product detail view, cached ones
+    included, so it goes outside ``cache_catalog_response``.
+    """
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapped(request, product_id, *args, **kwargs):
+            response = await view(request, product_id, *args, **kwargs)
+            if response.status_code in (200, 304):
+                record_view(product_id)
+            return response
+        return async_wrapped
+
+    @functools.wraps(view)
+    def wrapped(request, product_id, *args, **kwargs):
+        response = view(request, product_id, *args, **kwargs)
+        if response.status_code in (200, 304):
+            record_view(product_id)
+        return response
+    return wrapped
@@ -0,0 +1,276 @@
+"""
+"Similar products" from a TF-IDF model built by
+``manage.py build_similar_products`` and memory-mapped by workers.
+"""
+import hashlib
+import os
+import pickle
+import shutil
+import threading
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .models import Product
+
+TEXT_FIELDS = ('product', 'brand', 'category', 'description')
+
+# Above this share of changed rows the stored vocabulary and IDF weights are
+# considered stale and the model is refitted from scratch.
+FULL_REBUILD_RATIO = 0.2
+
+
+def get_model_dir():
+    return Path(getattr(settings, 'SHOP_RECOMMENDATIONS_DIR', settings.BASE_DIR / 'var' / 'similar'))
+
+
+def product_text(row):
+    return ' '.join(str(value) for value in row if value)
+
+
+def fingerprint(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class SimilarProducts:
+    """Read side of the model: memory-mapped lookups by product id."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.ids = np.load(self.path / 'ids.npy', mmap_mode='r')
+        self.neighbours = np.load(self.path / 'neighbours.npy', mmap_mode='r')
+        self.scores = np.load(self.path / 'scores.npy', mmap_mode='r')
+
+    @property
+    def top_k(self):
+        return self.neighbours.shape[1]
+
+    def __contains__(self, product_id):
+        return self._row(product_id) is not None
+
+    def _row(self, product_id):
+        row = int(np.searchsorted(self.ids, product_id))
+        if row < len(self.ids) and self.ids[row] == product_id:
+            return row
+        return None
+
+    def similar(self, product_id, limit=10):
+        """Return ``[(product_id, score), ...]`` best match first."""
+        row = self._row(product_id)
+        if row is None:
+            return []
+        neighbours = self.neighbours[row, :limit]
+        scores = self.scores[row, :limit]
+        return [(int(pk), float(score)) for pk, score in zip(neighbours, scores) if pk >= 0]
+
+
+_loaded = None
+_loaded_mtime = None
+_load_lock = threading.Lock()
+
+
+def get_similar_products():
+    """
+    Return the current model, or None if it has not been built yet. The
+    model is reloaded when a build replaces the directory; until a reload
+    succeeds, the previously loaded one keeps serving.
+    """
+    global _loaded, _loaded_mtime
+    path = get_model_dir()
+    try:
+        mtime = (path / 'ids.npy').stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if _loaded is None or mtime != _loaded_mtime:
+        with _load_lock:
+            if _loaded is None or mtime != _loaded_mtime:
+                try:
+                    _loaded = SimilarProducts(path)
+                except (OSError, ValueError, KeyError):
+                    # Mid-replacement by a build, or a damaged array.
+                    return _loaded
+                _loaded_mtime = mtime
+    return _loaded
+
+
+# Build side ---------------------------------------------------------------
+
+def _top_k_rows(matrix, rows, ids, top_k, chunk_size):
+    """
+    Compute the top-k cosine neighbours of ``rows``. TF-IDF rows are L2
+    normalised, so the sparse dot product is the cosine similarity.
+    """
+    neighbours = np.full((len(rows), top_k), -1, dtype=np.int64)
+    scores = np.zeros((len(rows), top_k), dtype=np.float32)
+    transposed = matrix.T.tocsr()
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        similarities = (matrix[chunk] @ transposed).tocsr()
+        for offset, row in enumerate(chunk):
+            begin, end = similarities.indptr[offset], similarities.indptr[offset + 1]
+            columns = similarities.indices[begin:end]
+            values = similarities.data[begin:end]
+            keep = columns != row
+            columns, values = columns[keep], values[keep]
+            if not len(columns):
+                continue
+            if len(columns) > top_k:
+                best = np.argpartition(-values, top_k - 1)[:top_k]
+                columns, values = columns[best], values[best]
+            order = np.lexsort((ids[columns], -values))
+            count = len(order)
+            neighbours[start + offset, :count] = ids[columns[order]]
+            scores[start + offset, :count] = values[order]
+    return neighbours, scores
+
+
+def _merge_candidates(old_neighbours, old_scores, extra, top_k):
+    candidates = {int(pk): float(score) for pk, score in zip(old_neighbours, old_scores) if pk >= 0}
+    for pk, score in extra:
+        candidates[pk] = max(score, candidates.get(pk, 0.0))
+    best = sorted(candidates.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+    neighbours = np.full(top_k, -1, dtype=np.int64)
+    scores = np.zeros(top_k, dtype=np.float32)
+    for index, (pk, score) in enumerate(best):
+        neighbours[index] = pk
+        scores[index] = score
+    return neighbours, scores
+
+
+def _load_catalog():
+    ids, texts = [], []
+    queryset = Product.objects.order_by('id').values_list('id', *TEXT_FIELDS)
+    for pk, *values in queryset.iterator(chunk_size=5000):
+        ids.append(pk)
+        texts.append(product_text(values))
+    ids = np.asarray(ids, dtype=np.int64)
+    fingerprints = np.fromiter((fingerprint(text) for text in texts), dtype=np.uint64, count=len(texts))
+    return ids, texts, fingerprints
+
+
+def _save(path, ids, neighbours, scores, fingerprints, matrix, vectorizer):
+    from scipy import sparse
+
+    path = Path(path)
+    staging = path.with_name(path.name + '.tmp')
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    np.save(staging / 'neighbours.npy', neighbours)
+    np.save(staging / 'scores.npy', scores)
+    np.save(staging / 'fingerprints.npy', fingerprints)
+    sparse.save_npz(staging / 'tfidf.npz', matrix)
+    with open(staging / 'vectorizer.pkl', 'wb') as handle:
+        pickle.dump(vectorizer, handle, protocol=pickle.HIGHEST_PROTOCOL)
+    # ids.npy is written last: its mtime is what readers watch.
+    np.save(staging / 'ids.npy', ids)
+
+    retired = path.with_name(path.name + '.old')
+    shutil.rmtree(retired, ignore_errors=True)
+    if path.exists():
+        os.replace(path, retired)
+    os.replace(staging, path)
+    shutil.rmtree(retired, ignore_errors=True)
+
+
+def build_similar_products(path=None, top_k=20, chunk_size=512, full=False):
+    """
+    Build or refresh the model and return a summary dict.
+
+    Incremental builds reuse the stored vectorizer, vectorise only new and
+    changed products and recompute neighbour lists only where they can
+    have changed.
+    """
+    from scipy import sparse
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    path = Path(path or get_model_dir())
+    ids, texts, fingerprints = _load_catalog()
+
+    previous = None
+    if not full and (path / 'vectorizer.pkl').exists():
+        try:
+            with open(path / 'vectorizer.pkl', 'rb') as handle:
+                vectorizer = pickle.load(handle)
+            previous = {
+                'ids': np.load(path / 'ids.npy'),
+                'neighbours': np.load(path / 'neighbours.npy'),
+                'scores': np.load(path / 'scores.npy'),
+                'fingerprints': np.load(path / 'fingerprints.npy'),
+                'matrix': sparse.load_npz(path / 'tfidf.npz').tocsr(),
+            }
+        except (OSError, ValueError, pickle.UnpicklingError):
+            previous = None
+        # A model built on an empty catalog has no fitted vectorizer.
+        if previous is not None and (previous['neighbours'].shape[1] != top_k or not len(previous['ids'])):
+            previous = None
+
+    if previous is not None:
+        old_ids = previous['ids']
+        positions = np.minimum(np.searchsorted(old_ids, ids), len(old_ids) - 1)
+        known = old_ids[positions] == ids
+        unchanged = known & (previous['fingerprints'][positions] == fingerprints)
+        changed_rows = np.flatnonzero(~unchanged)
+        removed_ids = np.setdiff1d(old_ids, ids, assume_unique=True)
+
+        if not len(changed_rows) and not len(removed_ids):
+            return {'mode': 'unchanged', 'products': len(ids), 'changed': 0, 'removed': 0}
+        if len(changed_rows) + len(removed_ids) > FULL_REBUILD_RATIO * max(len(ids), 1):
+            previous = None
+
+    if previous is None:
+        vectorizer = TfidfVectorizer(stop_words='english', sublinear_tf=True, dtype=np.float32)
+        matrix = vectorizer.fit_transform(texts).tocsr() if texts else sparse.csr_matrix((0, 0), dtype=np.float32)
+        rows = np.arange(len(ids))
+        neighbours, scores = _top_k_rows(matrix, rows, ids, top_k, chunk_size) if len(ids) else (
+            np.full((0, top_k), -1, dtype=np.int64), np.zeros((0, top_k), dtype=np.float32))
+        _save(path, ids, neighbours, scores, fingerprints, matrix, vectorizer)
+        return {'mode': 'full', 'products': len(ids), 'changed': len(ids), 'removed': 0}
+
+    # Incremental: unchanged rows keep their vectors, so similarities between
+    # two unchanged products are exactly what the previous build computed.
+    old_matrix = previous['matrix']
+    unchanged_rows = np.flatnonzero(unchanged)
+    parts = []
+    if len(unchanged_rows):
+        parts.append((unchanged_rows, old_matrix[positions[unchanged_rows]]))
+    if len(changed_rows):
+        parts.append((changed_rows, vectorizer.transform([texts[row] for row in changed_rows]).astype(np.float32)))
+    order = np.concatenate([rows for rows, _ in parts])
+    stacked = sparse.vstack([block for _, block in parts]).tocsr()
+    matrix = stacked[np.argsort(order)].tocsr()
+
+    neighbours = np.full((len(ids), top_k), -1, dtype=np.int64)
+    scores = np.zeros((len(ids), top_k), dtype=np.float32)
+    neighbours[unchanged_rows] = previous['neighbours'][positions[unchanged_rows]]
+    scores[unchanged_rows] = previous['scores'][positions[unchanged_rows]]
+
+    # An unchanged row whose list mentions a changed or removed product may
+    # need a neighbour it did not keep before, so it is recomputed fully.
+    # Every other unchanged row only has to consider the changed products.
+    stale_ids = np.concatenate([ids[changed_rows], removed_ids])
+    mentions_stale = np.isin(neighbours[unchanged_rows], stale_ids).any(axis=1)
+    recompute = np.union1d(changed_rows, unchanged_rows[mentions_stale])
+    merge_rows = unchanged_rows[~mentions_stale]
+
+    if len(changed_rows) and len(merge_rows):
+        cross = (matrix[changed_rows] @ matrix[merge_rows].T).tocsc()
+        changed_ids = ids[changed_rows]
+        for column, row in enumerate(merge_rows):
+            begin, end = cross.indptr[column], cross.indptr[column + 1]
+            if begin == end:
+                continue
+            extra = zip(changed_ids[cross.indices[begin:end]].tolist(), cross.data[begin:end].tolist())
+            neighbours[row], scores[row] = _merge_candidates(neighbours[row], scores[row], extra, top_k)
+
+    if len(recompute):
+        neighbours[recompute], scores[recompute] = _top_k_rows(matrix, recompute, ids, top_k, chunk_size)
+
+    _save(path, ids, neighbours, scores, fingerprints, matrix, vectorizer)
+    return {
+        'mode': 'incremental',
+        'products': len(ids),
+        'changed': len(changed_rows),
+        'removed': len(removed_ids),
+        'recomputed': len(recompute),
+    }
@@ -0,0 +1,41 @@
+"""Routes catalog reads to the ``replica`` database alias when there is one."""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA = 'replica'
+CATALOG_MODELS = frozenset({
+    'shop.product', 'shop.catalogversion', 'shop.facetcount', 'shop.facetedproduct', 'shop.boughttogether',
+})
+
+
+def _label(model):
+    # Not _meta.label_lower: the database cache routes a stand-in model
+    # whose options only carry app_label and model_name.
+    return f'{model._meta.app_label}.{model._meta.model_name}'
+
+
+class CatalogReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if _label(model) in CATALOG_MODELS and REPLICA in settings.DATABASES:
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Without this, Django saves an instance to the alias it was read
+        # from, which for catalog rows is the replica.
+        if _label(model) in CATALOG_MODELS:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data.
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPLICA}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema from the primary.
+        if db == REPLICA:
+            return False
+        return None
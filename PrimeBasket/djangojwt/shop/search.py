@@ -0,0 +1,177 @@
+import re
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+SEARCH_FIELDS = ('product', 'brand', 'category', 'description')
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    return _TOKEN_RE.findall(query.lower())
+
+
+class BaseSearchBackend:
+    """
+    Interface every search backend implements. ``search_page`` returns
+    ``(product_id, score)`` pairs in (score, id) order, resuming after the
+    ``position`` of the last row seen (before it with ``after=False``).
+    """
+
+    def search_page(self, query, limit=50, position=None, after=True):
+        raise NotImplementedError
+
+    def search(self, query, limit=50):
+        return [pk for pk, _ in self.search_page(query, limit)]
+
+    def index_products(self, products):
+        """Add or replace the index entries for ``products``."""
+
+    def remove_products(self, product_ids):
+        """Drop the index entries for ``product_ids``."""
+
+    def rebuild(self, batch_size=2000):
+        """Rebuild the whole index from the Product table."""
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+    Unindexed fallback for databases without a full-text engine. This is the
+    old ``icontains`` behaviour, so results are unranked.
+    """
+
+    def search_page(self, query, limit=50, position=None, after=True):
+        query = query.strip()
+        if not query:
+            return []
+        condition = Q()
+        for field in SEARCH_FIELDS:
+            condition |= Q(**{f'{field}__icontains': query})
+        products = Product.objects.filter(condition)
+        if position is not None:
+            products = products.filter(id__gt=position[1]) if after else products.filter(id__lt=position[1])
+        ids = products.order_by('id' if after else '-id').values_list('id', flat=True)[:limit]
+        return [(pk, 0.0) for pk in ids]
+
+
+class SQLiteFTS5Backend(BaseSearchBackend):
+    """
+    Inverted index kept in an FTS5 virtual table whose rowid is the product
+    id. Results are ranked with BM25, weighting name matches above brand,
+    category and description matches.
+    """
+
+    table = 'shop_product_fts'
+    weights = (10.0, 5.0, 3.0, 1.0)
+
+    def _read_connection(self):
+        return connections[router.db_for_read(Product)]
+
+    def _write_connection(self):
+        return connections[router.db_for_write(Product)]
+
+    def build_match(self, query):
+        # Quote every token so FTS5 operators in user input are treated as
+        # text, and allow prefix matches so partially typed words still hit.
+        tokens = tokenize(query)
+        return ' '.join(f'"{token}"*' for token in tokens)
+
+    def search_page(self, query, limit=50, position=None, after=True):
+        match = self.build_match(query)
+        if not match:
+            return []
+        weights = ', '.join(str(weight) for weight in self.weights)
+        sql = (
+            f'SELECT rowid, score FROM ('
+            f'SELECT rowid, bm25({self.table}, {weights}) AS score '
+            f'FROM {self.table} WHERE {self.table} MATCH %s)'
+        )
+        params = [match]
+        if position is not None:
+            compare = '>' if after else '<'
+            sql += f' WHERE score {compare} %s OR (score = %s AND rowid {compare} %s)'
+            params += [position[0], position[0], position[1]]
+        direction = 'ASC' if after else 'DESC'
+        sql += f' ORDER BY score {direction}, rowid {direction} LIMIT %s'
+        params.append(limit)
+        with self._read_connection().cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def _rows(self, products):
+        return [
+            (p.id, p.product or '', p.brand or '', p.category or '', p.description or '')
+            for p in products
+        ]
+
+    def index_products(self, products):
+        rows = self._rows(products)
+        if not rows:
+            return
+        connection = self._write_connection()
+        # One transaction per batch; in autocommit mode every row would be
+        # its own commit.
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, product, brand, category, description) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                rows,
+            )
+
+    def remove_products(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        connection = self._write_connection()
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(pk,) for pk in product_ids])
+
+    def rebuild(self, batch_size=2000):
+        with self._write_connection().cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+        queryset = Product.objects.only('id', *SEARCH_FIELDS).order_by('id')
+        batch = []
+        total = 0
+        for product in queryset.iterator(chunk_size=batch_size):
+            batch.append(product)
+            if len(batch) >= batch_size:
+                self.index_products(batch)
+                total += len(batch)
+                batch = []
+        self.index_products(batch)
+        total += len(batch)
+        with self._write_connection().cursor() as cursor:
+            # Merge the b-tree segments left behind by the batched inserts.
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+        return total
+
+
+# Default backend per database vendor; others fall back to
+# DatabaseSearchBackend.
+VENDOR_BACKENDS = {
+    'sqlite': 'shop.search.SQLiteFTS5Backend',
+}
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    The ``SHOP_SEARCH_BACKEND`` backend, or when that is unset the default
+    for the vendor of the database products are written to: the FTS5
+    table only exists on SQLite (migration 0003).
+    """
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'SHOP_SEARCH_BACKEND', None)
+        if not path:
+            vendor = connections[router.db_for_write(Product)].vendor
+            path = VENDOR_BACKENDS.get(vendor, 'shop.search.DatabaseSearchBackend')
+        _backend = import_string(path)()
+    return _backend
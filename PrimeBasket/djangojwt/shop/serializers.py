@@ -1,13 +1,144 @@
+from django.db import models
 from rest_framework import serializers
-from .models import Product, CartItem
 
-class ProductSerializer(serializers.ModelSerializer):
+from djangojwt.instrumentation import timed
+
+from .models import CatalogJob, Product, CartItem
+
+# Named field sets accepted by ``?fields=``; ``card`` is what a listing tile
+# renders. ``all`` is the full product.
+PRODUCT_PROJECTIONS = {
+    'all': None,
+    'card': ('id', 'product', 'brand', 'market_price', 'sale_price', 'rating'),
+}
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+class TimedDataMixin:
+    """Counts building ``.data`` as the request's serialize phase."""
+
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
+
+
+class TimedListSerializer(TimedDataMixin, serializers.ListSerializer):
+    pass
+
+
+class ProductSerializer(TimedDataMixin, serializers.ModelSerializer):
+    """``fields`` limits the output to those fields, in declaration order."""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def build_standard_field(self, field_name, model_field):
+        # Generated columns (discount) are read-only values of their output
+        # field's type, not opaque ModelFields.
+        if isinstance(model_field, models.GeneratedField):
+            field_class = self.serializer_field_mapping[type(model_field.output_field)]
+            return field_class, {'read_only': True}
+        return super().build_standard_field(field_name, model_field)
+
     class Meta:
         model = Product
-        fields = '__all__'
+        list_serializer_class = TimedListSerializer
+        # The *_lower columns only exist for indexed filtering;
+        # last_modified is only part of exports, and trending only orders
+        # listings.
+        exclude = ('category_lower', 'brand_lower', 'last_modified', 'trending')
+
+
+class ProductExportSerializer(ProductSerializer):
+    """Rows of /api/shop/export/: the product fields plus ``last_modified``."""
+
+    class Meta(ProductSerializer.Meta):
+        exclude = ('category_lower', 'brand_lower', 'trending')
+
 
-class CartItemSerializer(serializers.ModelSerializer):
+_product_field_names = None
+
+
+def product_field_names():
+    global _product_field_names
+    if _product_field_names is None:
+        _product_field_names = tuple(ProductSerializer().fields)
+    return _product_field_names
+
+
+def parse_product_fields(value):
+    """
+    Turn a ``?fields=`` value (a projection name or comma-separated field
+    names) into a tuple of ProductSerializer fields in declaration order,
+    or ``None`` for every field. Raises ``InvalidFields`` for unknown names.
+    """
+    value = (value or '').strip()
+    if value in PRODUCT_PROJECTIONS:
+        return PRODUCT_PROJECTIONS[value]
+    names = {name.strip() for name in value.split(',') if name.strip()}
+    if not names:
+        return None
+    available = product_field_names()
+    unknown = sorted(names.difference(available))
+    if unknown:
+        raise InvalidFields(f'Unknown field(s): {", ".join(unknown)}')
+    return tuple(name for name in available if name in names)
+
+
+class CartItemSerializer(TimedDataMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
+
+    def __init__(self, *args, product_fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if product_fields is not None:
+            self.fields['product'] = ProductSerializer(read_only=True, fields=product_fields)
+
     class Meta:
         model = CartItem
-        fields = '__all__'
\ No newline at end of file
+        list_serializer_class = TimedListSerializer
+        fields = ['id', 'product', 'quantity']
+
+
+class CartLineSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    name = serializers.CharField()
+    quantity = serializers.IntegerField()
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    market_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    discount = serializers.FloatField(allow_null=True)
+    line_total = serializers.DecimalField(max_digits=14, decimal_places=2)
+    line_savings = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class CartSummarySerializer(TimedDataMixin, serializers.Serializer):
+    """Body of /api/shop/cart/summary/, from the rows of ``cart_summary_queryset``."""
+    item_count = serializers.IntegerField()
+    subtotal = serializers.DecimalField(max_digits=14, decimal_places=2)
+    savings = serializers.DecimalField(max_digits=14, decimal_places=2)
+    lines = CartLineSerializer(many=True)
+
+
+class CatalogJobSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CatalogJob
+        fields = [
+            'id', 'kind', 'status', 'attempts', 'total_rows', 'rows', 'created', 'updated', 'rejected', 'duplicates',
+            'progress', 'result', 'error', 'created_at', 'started_at', 'finished_at',
+        ]
+
+    def get_progress(self, job):
+        """Share of the rows processed, 0 to 1; None until the upload is counted."""
+        if job.status == CatalogJob.SUCCEEDED:
+            return 1.0
+        if not job.total_rows:
+            return None
+        return round(min(job.rows / job.total_rows, 1.0), 4)
@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .facets import update_facets
+from .models import Product
+from .search import get_search_backend
+from .versioning import bump_catalog_version
+
+# Sent after writes that bypass Model.save(), such as bulk imports.
+# Receivers get ``product_ids`` (created or updated rows) and ``using``.
+products_bulk_changed = Signal()
+# Sent by shop.jobs after a catalog import job succeeds, with ``job``,
+# ``result`` (the import summary) and ``using``.
+catalog_import_finished = Signal()
+
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    get_search_backend().index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance, **kwargs):
+    get_search_backend().remove_products([instance.pk])
+
+
+@receiver(products_bulk_changed)
+def index_bulk_changed_products(sender, product_ids, using=None, batch_size=2000, **kwargs):
+    backend = get_search_backend()
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), batch_size):
+        batch = product_ids[start:start + batch_size]
+        backend.index_products(Product.objects.using(using).filter(id__in=batch))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def update_product_facets(sender, instance, using=None, **kwargs):
+    update_facets([instance.pk], using)
+
+
+@receiver(products_bulk_changed)
+def update_bulk_changed_facets(sender, product_ids, using=None, **kwargs):
+    update_facets(product_ids, using)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(products_bulk_changed)
+@receiver(catalog_import_finished)
+def invalidate_catalog(sender, using=None, **kwargs):
+    # Orphans every cached catalog response at once (see shop.cache).
+    bump_catalog_version(using)
+
+
+@receiver(catalog_import_finished)
+def queue_jobs_after_import(sender, job, **kwargs):
+    from .jobs import enqueue
+
+    for kind in getattr(settings, 'SHOP_JOBS_AFTER_IMPORT', ()):
+        enqueue(kind, user_id=job.created_by_id)
@@ -0,0 +1,336 @@
+"""
+Columnar catalog snapshot, memory-mapped by read-heavy nodes to serve
+/api/shop/products/ while its catalog version is current.
+"""
+import itertools
+import json
+import os
+import shutil
+import threading
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import router
+
+from .models import Product
+from .pagination import _row_key, _row_value, build_page, decode_cursor
+from .versioning import read_catalog_version
+
+FORMAT_VERSION = 1
+# Rows fetched and converted at a time by the export.
+EXPORT_CHUNK = 10000
+
+
+def get_snapshot_dir():
+    return Path(getattr(settings, 'SHOP_SNAPSHOT_DIR', settings.BASE_DIR / 'var' / 'catalog'))
+
+
+def _cents(price):
+    return int(Decimal(price).scaleb(2))
+
+
+@dataclass
+class SnapshotSlice:
+    """The ids of a listing page located in the snapshot, in scan order."""
+    ids: list
+    position: tuple
+    after: bool
+
+    def build_page(self, rows, page_size, ordering, field):
+        """
+        A ``KeysetPage`` from the rows fetched for ``ids``, or None if
+        some of them have since been deleted.
+        """
+        by_id = {_row_value(row, 'id'): row for row in rows}
+        if len(by_id) != len(self.ids):
+            return None
+        return build_page([by_id[pk] for pk in self.ids], page_size, ordering, _row_key(field), self.position, self.after)
+
+
+class CatalogSnapshot:
+    """Read side of the snapshot: memory-mapped arrays."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / 'meta.json') as handle:
+            self.meta = json.load(handle)
+        if self.meta.get('format') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format {self.meta.get('format')!r}")
+        self.catalog_version = self.meta['catalog_version']
+        self.ids = self._load('ids')
+        self.sale_price = self._load('sale_price')
+        self.rating = self._load('rating')
+        self.categories = {value: code for code, value in enumerate(self._load('categories').tolist())}
+        self.brands = {value: code for code, value in enumerate(self._load('brands').tolist())}
+        self.orders = {
+            ordering: (
+                self._load(f'order_{ordering}'), self._load(f'rank_{ordering}'),
+                self._load(f'category_{ordering}'), self._load(f'brand_{ordering}'),
+            )
+            for ordering in self.meta['orderings']
+        }
+
+    def _load(self, name):
+        return np.load(self.path / f'{name}.npy', mmap_mode='r')
+
+    def _row(self, pk):
+        row = int(np.searchsorted(self.ids, pk))
+        if row < len(self.ids) and self.ids[row] == pk:
+            return row
+        return None
+
+    def _matches(self, field, row, value):
+        """Whether ``row`` still has the sort ``value`` a cursor was issued for."""
+        try:
+            if field == 'id':
+                return int(value) == self.ids[row]
+            if field == 'sale_price':
+                return value is not None and _cents(value) == self.sale_price[row]
+            if field == 'rating':
+                return np.isnan(self.rating[row]) if value is None else float(value) == self.rating[row]
+        except (TypeError, ValueError, InvalidOperation):
+            pass
+        return False
+
+    def locate(self, ordering, field, category='', brand='', cursor=None, page_size=50):
+        """
+        A ``SnapshotSlice`` of ``page_size + 1`` rows of the filtered
+        ``ordering`` listing, or None when the ORM has to answer instead
+        (the cursor's row changed, or a filter key is not in the snapshot).
+        """
+        if ordering not in self.orders:
+            return None
+        order, rank, category_codes, brand_codes = self.orders[ordering]
+        position, after = None, True
+        if cursor:
+            value, pk, after = decode_cursor(cursor, ordering)
+            row = self._row(pk)
+            if row is None or not self._matches(field, row, value):
+                return None
+            position = (value, pk)
+
+        filters = []
+        for value, codes, table in ((category, category_codes, self.categories), (brand, brand_codes, self.brands)):
+            if value:
+                if value not in table:
+                    return None
+                filters.append((codes, table[value]))
+
+        if position is None:
+            start = 0
+        else:
+            display = int(rank[row])
+            start = display + 1 if after else display
+        positions = _scan(filters, len(order), start, after, page_size + 1)
+        return SnapshotSlice(self.ids[order[positions]].tolist(), position, after)
+
+
+def _scan(filters, size, start, forward, limit):
+    """
+    Up to ``limit`` display positions, in scan order, of rows matching every
+    ``(codes, code)`` filter: from ``start`` onwards, or backwards from just
+    before ``start``. Chunks double in size, so a selective filter costs
+    a few vectorised passes rather than one per page row.
+    """
+    if not filters:
+        if forward:
+            return np.arange(start, min(start + limit, size))
+        return np.arange(start - 1, max(start - limit, 0) - 1, -1)
+
+    found, count = [], 0
+    chunk = max(limit * 16, 4096)
+    low = high = start
+    while count < limit and (high < size if forward else low > 0):
+        if forward:
+            low, high = high, min(high + chunk, size)
+        else:
+            low, high = max(low - chunk, 0), low
+        matches = None
+        for codes, code in filters:
+            hit = codes[low:high] == code
+            matches = hit if matches is None else matches & hit
+        hits = np.flatnonzero(matches) + low
+        if not forward:
+            hits = hits[::-1]
+        found.append(hits[:limit - count])
+        count += len(found[-1])
+        chunk *= 2
+    return np.concatenate(found) if found else np.zeros(0, dtype=np.intp)
+
+
+_loaded = None
+_loaded_mtime = None
+_load_lock = threading.Lock()
+
+
+def load_snapshot():
+    """The exported snapshot, or None. Reloaded when an export replaces it."""
+    global _loaded, _loaded_mtime
+    path = get_snapshot_dir()
+    try:
+        mtime = (path / 'meta.json').stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if _loaded is None or mtime != _loaded_mtime:
+        with _load_lock:
+            if _loaded is None or mtime != _loaded_mtime:
+                try:
+                    _loaded = CatalogSnapshot(path)
+                except (OSError, ValueError, KeyError):
+                    # Mid-replacement by an export, or an older format.
+                    return None
+                _loaded_mtime = mtime
+    return _loaded
+
+
+def get_catalog_snapshot(catalog_version):
+    """
+    The snapshot to serve listings from at ``catalog_version``: None when
+    nothing was exported or it is stale.
+    """
+    snapshot = load_snapshot()
+    if snapshot is None or snapshot.catalog_version != catalog_version:
+        return None
+    return snapshot
+
+
+# Export side --------------------------------------------------------------
+
+def _display_order(values, ids, descending, nullable):
+    """Rows in listing order: by (value, id), NULL values last, as in shop.pagination."""
+    if nullable:
+        missing = np.isnan(values)
+        present = np.flatnonzero(~missing)
+        nulls = np.flatnonzero(missing)
+    else:
+        present = np.arange(len(values))
+        nulls = np.zeros(0, dtype=np.intp)
+    present = present[np.lexsort((ids[present], values[present]))]
+    if descending:
+        present, nulls = present[::-1], nulls[::-1]
+    return np.concatenate([present, nulls]).astype(np.int32)
+
+
+def _encode(seen, codes):
+    """
+    The sorted table of the distinct values in ``seen`` (value -> code, in
+    order of first appearance) and ``codes`` renumbered to index it, in the
+    narrowest dtype.
+    """
+    values = np.array(list(seen), dtype=str)
+    order = np.argsort(values, kind='stable')
+    renumber = np.empty(len(order), dtype=np.int64)
+    renumber[order] = np.arange(len(order))
+    return values[order], renumber[codes].astype(np.min_scalar_type(max(len(values) - 1, 0)))
+
+
+def _grown(array, size):
+    grown = np.empty(size, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+def _save(path, arrays, meta):
+    path = Path(path)
+    staging = path.with_name(path.name + '.tmp')
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    for name, array in arrays.items():
+        np.save(staging / f'{name}.npy', array)
+    # meta.json is written last: its mtime is what readers watch.
+    with open(staging / 'meta.json', 'w') as handle:
+        json.dump(meta, handle)
+
+    retired = path.with_name(path.name + '.old')
+    shutil.rmtree(retired, ignore_errors=True)
+    if path.exists():
+        os.replace(path, retired)
+    os.replace(staging, path)
+    shutil.rmtree(retired, ignore_errors=True)
+
+
+def export_catalog_snapshot(path=None, only_if_stale=False):
+    """
+    Write the snapshot of the current catalog and return a summary dict.
+    With ``only_if_stale``, an up-to-date snapshot is left alone.
+    """
+    from .views import PRODUCT_SORTS, VOLATILE_SORTS
+
+    path = Path(path or get_snapshot_dir())
+    using = router.db_for_read(Product)
+    # Read before the rows: a write racing the export bumps the version
+    # after it commits, which leaves this snapshot stale rather than wrongly
+    # current. That holds without a transaction, so the export does not
+    # take one (on SQLite it would hold the write lock throughout).
+    version = read_catalog_version(using)
+    if only_if_stale:
+        try:
+            with open(path / 'meta.json') as handle:
+                meta = json.load(handle)
+            if meta.get('format') == FORMAT_VERSION and meta.get('catalog_version') == version:
+                return {'mode': 'unchanged', 'products': meta['products'], 'catalog_version': version}
+        except (OSError, ValueError):
+            pass
+    queryset = (
+        Product.objects.using(using).order_by('id')
+        .values_list('id', 'sale_price', 'rating', 'category_lower', 'brand_lower')
+    )
+    # Columns are sized from the count and filled a chunk at a time, so no
+    # more than EXPORT_CHUNK rows are held as Python objects. Writes can
+    # land between the count and the read, so the columns grow if needed.
+    capacity = queryset.count()
+    columns = {
+        'id': np.empty(capacity, dtype=np.int64),
+        'sale_price': np.empty(capacity, dtype=np.int64),
+        'rating': np.empty(capacity, dtype=np.float64),
+        'category': np.empty(capacity, dtype=np.int64),
+        'brand': np.empty(capacity, dtype=np.int64),
+    }
+    seen = {'category': {}, 'brand': {}}
+    products = 0
+    # Streamed: a server-side cursor on PostgreSQL, chunked fetches on SQLite.
+    rows = queryset.iterator(chunk_size=EXPORT_CHUNK)
+    while chunk := list(itertools.islice(rows, EXPORT_CHUNK)):
+        end = products + len(chunk)
+        if end > capacity:
+            capacity = max(end, capacity * 2)
+            columns = {name: _grown(column, capacity) for name, column in columns.items()}
+        count = len(chunk)
+        columns['id'][products:end] = np.fromiter((row[0] for row in chunk), dtype=np.int64, count=count)
+        columns['sale_price'][products:end] = np.fromiter((_cents(row[1]) for row in chunk), dtype=np.int64, count=count)
+        columns['rating'][products:end] = np.fromiter(
+            (np.nan if row[2] is None else row[2] for row in chunk), dtype=np.float64, count=count,
+        )
+        for name, index in (('category', 3), ('brand', 4)):
+            codes = seen[name]
+            columns[name][products:end] = np.fromiter(
+                (codes.setdefault(row[index], len(codes)) for row in chunk), dtype=np.int64, count=count,
+            )
+        products = end
+
+    columns = {name: column[:products] for name, column in columns.items()}
+    ids = columns['id']
+    categories, category_codes = _encode(seen['category'], columns['category'])
+    brands, brand_codes = _encode(seen['brand'], columns['brand'])
+    arrays = {'ids': ids, 'sale_price': columns['sale_price'], 'rating': columns['rating'],
+              'categories': categories, 'brands': brands}
+    sorts = {sort: spec for sort, spec in PRODUCT_SORTS.items() if sort not in VOLATILE_SORTS}
+    for sort, (field, descending, nullable) in sorts.items():
+        ordering = sort or 'id'
+        order = _display_order(columns[field], ids, descending, nullable)
+        rank = np.empty(len(order), dtype=np.int32)
+        rank[order] = np.arange(len(order), dtype=np.int32)
+        arrays[f'order_{ordering}'] = order
+        arrays[f'rank_{ordering}'] = rank
+        arrays[f'category_{ordering}'] = category_codes[order]
+        arrays[f'brand_{ordering}'] = brand_codes[order]
+
+    meta = {
+        'format': FORMAT_VERSION, 'catalog_version': version, 'products': products,
+        'orderings': [sort or 'id' for sort in sorts],
+    }
+    _save(path, arrays, meta)
+    return {'mode': 'exported', 'products': products, 'catalog_version': version}
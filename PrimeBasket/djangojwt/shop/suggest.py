@@ -0,0 +1,193 @@
+"""Typeahead suggestions for /api/shop/suggest/ from in-memory prefix indexes."""
+import heapq
+import os
+import threading
+from array import array
+from bisect import bisect_left
+
+from django.db import connections
+
+from .models import Product
+from .versioning import get_catalog_version
+
+KINDS = ('products', 'brands', 'categories')
+# Names are keyed at their first few word starts only; later words add
+# keys (memory) without adding many useful completions.
+MAX_KEYED_WORDS = 6
+# Sorts after every character a key can continue with.
+_PREFIX_END = '\U0010ffff'
+
+
+def normalise(text):
+    return ' '.join(text.casefold().split())
+
+
+def word_keys(text):
+    """``text`` keyed at each of its first word starts."""
+    words = normalise(text).split(' ')
+    return [' '.join(words[start:]) for start in range(min(len(words), MAX_KEYED_WORDS)) if words[start]]
+
+
+class PrefixIndex:
+    """Sorted ``(key, score, item)`` entries with a max-score segment tree."""
+
+    def __init__(self, entries):
+        entries.sort(key=lambda entry: entry[0])
+        self.keys = [key for key, _, _ in entries]
+        self.scores = array('d', (score for _, score, _ in entries))
+        self.items = [item for _, _, item in entries]
+        size = 1
+        while size < len(entries):
+            size *= 2
+        self.size = size
+        # tree[node]: index of the best entry under node, -1 when empty.
+        tree = array('l', [-1]) * (2 * size)
+        tree[size:size + len(entries)] = array('l', range(len(entries)))
+        scores = self.scores
+        for node in range(size - 1, 0, -1):
+            left, right = tree[2 * node], tree[2 * node + 1]
+            tree[node] = left if right < 0 or (left >= 0 and scores[left] >= scores[right]) else right
+        self.tree = tree
+
+    def _ranked(self, low, high):
+        """Entry indices in ``[low, high)``, best score first."""
+        tree, scores, size = self.tree, self.scores, self.size
+        heap = []
+        low, high = low + size, high + size
+        while low < high:
+            if low & 1:
+                heap.append(low)
+                low += 1
+            if high & 1:
+                high -= 1
+                heap.append(high)
+            low >>= 1
+            high >>= 1
+        heap = [(-scores[tree[node]], tree[node], node) for node in heap if tree[node] >= 0]
+        heapq.heapify(heap)
+        while heap:
+            _, best, node = heapq.heappop(heap)
+            if node >= size:
+                yield best
+                continue
+            for child in (2 * node, 2 * node + 1):
+                if tree[child] >= 0:
+                    heapq.heappush(heap, (-scores[tree[child]], tree[child], child))
+
+    def top(self, prefix, limit):
+        """The ``limit`` best distinct items with a key starting with ``prefix``."""
+        low = bisect_left(self.keys, prefix)
+        high = bisect_left(self.keys, prefix + _PREFIX_END, low)
+        found = {}
+        for index in self._ranked(low, high):
+            # A name keyed at several word starts can match more than once.
+            found.setdefault(id(self.items[index]), self.items[index])
+            if len(found) == limit:
+                break
+        return list(found.values())
+
+
+class SuggestIndex:
+
+    def __init__(self, catalog_version, products, brands, categories):
+        self.catalog_version = catalog_version
+        self.indexes = {'products': products, 'brands': brands, 'categories': categories}
+
+    @classmethod
+    def build(cls, catalog_version, using=None):
+        names, brands, categories = {}, {}, {}
+        rows = (
+            Product.objects.using(using).order_by('id')
+            .values_list('id', 'product', 'brand', 'category', 'rating').iterator(chunk_size=5000)
+        )
+        for pk, name, brand, category, rating in rows:
+            score = -1.0 if rating is None else rating
+            # Products sharing a name (pack sizes, ...) are suggested once,
+            # linking to the best rated of them.
+            entry = names.setdefault(normalise(name), [name, pk, score])
+            if score > entry[2]:
+                entry[1:] = [pk, score]
+            for groups, value in ((brands, brand), (categories, category)):
+                groups.setdefault(normalise(value), [value, 0])[1] += 1
+
+        def index(groups, item):
+            entries = []
+            for key, group in groups.items():
+                shown = item(group)
+                entries.extend((word_key, group[-1], shown) for word_key in word_keys(key))
+            return PrefixIndex(entries)
+
+        return cls(
+            catalog_version,
+            index(names, lambda group: {'id': group[1], 'text': group[0]}),
+            index(brands, lambda group: {'text': group[0]}),
+            index(categories, lambda group: {'text': group[0]}),
+        )
+
+    def suggest(self, query, limit=8):
+        prefix = normalise(query)
+        if not prefix:
+            return {kind: [] for kind in KINDS}
+        return {kind: self.indexes[kind].top(prefix, limit) for kind in KINDS}
+
+
+_index = None
+_lock = threading.Lock()
+_refreshing = False
+
+
+def _reset_after_fork():
+    global _lock, _refreshing
+    _lock = threading.Lock()
+    _refreshing = False
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _refresh(catalog_version):
+    global _index, _refreshing
+    try:
+        _index = SuggestIndex.build(catalog_version)
+    finally:
+        _refreshing = False
+        connections.close_all()
+
+
+def current_suggest_index(catalog_version):
+    """
+    The index to answer with at ``catalog_version`` without waiting: the
+    loaded one, with a background rebuild started if it is stale, or None
+    if nothing has been built yet.
+    """
+    global _refreshing
+    index = _index
+    if index is not None and index.catalog_version < catalog_version and not _refreshing:
+        with _lock:
+            if not _refreshing:
+                _refreshing = True
+                threading.Thread(target=_refresh, args=(catalog_version,), name='suggest-index', daemon=True).start()
+    return index
+
+
+def load_suggest_index(catalog_version):
+    """The current index, building the first one in this thread if needed."""
+    global _index
+    index = current_suggest_index(catalog_version)
+    if index is None:
+        with _lock:
+            if _index is None:
+                _index = SuggestIndex.build(catalog_version)
+            index = _index
+    return index
+
+
+def preload():
+    """Build the index in the background, so the first request does not wait."""
+    def build():
+        try:
+            load_suggest_index(get_catalog_version())
+        finally:
+            connections.close_all()
+
+    threading.Thread(target=build, name='suggest-preload', daemon=True).start()
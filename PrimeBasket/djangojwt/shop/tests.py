@@ -1,3 +1,1532 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import math
+import re
+import tempfile
+from collections import Counter, defaultdict
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlencode, urlsplit
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, router
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from myapp.serializers import TokenObtainPairSerializer
+
+from . import (
+    bought_together, fast_serializers, jobs, popularity, recommendations, routers, search, snapshot, suggest,
+    versioning, views,
+)
+from .facets import get_facets, rebuild_facets, update_facets
+from .importer import import_products
+from .models import BoughtTogether, CartItem, CatalogJob, CatalogVersion, FacetCount, FacetedProduct, Product
+from .pagination import InvalidCursor, decode_cursor, encode_cursor
+from .serializers import (
+    PRODUCT_PROJECTIONS, InvalidFields, ProductSerializer, parse_product_fields, product_field_names,
+)
+from .signals import products_bulk_changed
+
+LINK_RE = re.compile(r'<([^>]+)>; rel="(\w+)"')
+
+
+def make_product(name, sale_price, brand='Acme', category='Tea', rating=4.0, market_price=None, **fields):
+    return Product.objects.create(
+        product=name, brand=brand, category=category, rating=rating,
+        sale_price=Decimal(sale_price), market_price=Decimal(market_price or sale_price), **fields,
+    )
+
+
+def bearer(user):
+    return f'Bearer {TokenObtainPairSerializer.get_token(user).access_token}'
+
+
+def links_of(header):
+    return {rel: url for url, rel in LINK_RE.findall(header or '')}
+
+
+def links(response):
+    """The ``Link`` header of ``response`` as ``{rel: url}``."""
+    return links_of(response.get('Link'))
+
+
+@override_settings(SHOP_TRENDING=False, SHOP_SNAPSHOT_READS=False)
+class CatalogTestCase(TestCase):
+    """Starts every test with empty caches and no memoised catalog version."""
+
+    def setUp(self):
+        for alias in caches:
+            caches[alias].clear()
+        # Expire the memo, so the version is read from this test's database.
+        versioning._remember(None, 0.0)
+
+    def use_temporary_dir(self, setting):
+        """Point ``setting`` at a directory removed after the test, and return its path."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(**{setting: directory.name})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        return directory.name
+
+    def walk(self, url, rel):
+        """The ids on every page from ``url`` on, following ``rel`` links, and the last response."""
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['id'] for row in response.json()])
+            url = links(response).get(rel)
+        return pages, response
+
+
+class CursorTests(TestCase):
+    def test_round_trip(self):
+        token = encode_cursor('sale_price', Decimal('12.50'), 7, after=False)
+        self.assertNotIn('=', token)
+        self.assertEqual(decode_cursor(token, 'sale_price'), ('12.50', 7, False))
+
+    def test_cursor_of_another_listing(self):
+        token = encode_cursor('rating', 4.5, 3)
+        with self.assertRaises(InvalidCursor):
+            decode_cursor(token, 'sale_price')
+
+    def test_garbage(self):
+        for token in ('', 'not-base64!', encode_cursor('id', 1, 1)[:-4]):
+            with self.subTest(token=token), self.assertRaises(InvalidCursor):
+                decode_cursor(token, 'id')
+
+
+class KeysetPaginationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        # Ties on price, so pages have to break them on id.
+        prices = ['5', '3', '3', '9', '1', '3', '7']
+        self.products = [make_product(f'Product {index}', price) for index, price in enumerate(prices)]
+
+    def test_pages_follow_the_sort_order(self):
+        expected = [p.id for p in sorted(self.products, key=lambda p: (p.sale_price, p.id))]
+        pages, _ = self.walk('/api/shop/products/?sort=price_asc&page_size=2', 'next')
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_prev_links_walk_back(self):
+        forward, last = self.walk('/api/shop/products/?sort=price_desc&page_size=3', 'next')
+        backward, first = self.walk(links(last)['prev'], 'prev')
+        self.assertEqual(backward, forward[-2::-1])
+        self.assertNotIn('prev', links(first))
+
+    def test_first_page_has_no_prev_link(self):
+        response = self.client.get('/api/shop/products/?page_size=2')
+        self.assertEqual(set(links(response)), {'next'})
+        self.assertIn('page_size=2', links(response)['next'])
+
+    def test_invalid_cursors_are_rejected(self):
+        other = encode_cursor('rating', 4.0, self.products[0].id)
+        for cursor in ('garbage', other):
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/shop/products/', {'sort': 'price_asc', 'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'the FTS5 table only exists on SQLite')
+class FTS5SearchTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.backend = search.SQLiteFTS5Backend()
+        self.in_name = make_product('Tea Caddy', '5', brand='Tinware', category='Kitchen')
+        self.in_brand = make_product('Caddy', '5', brand='Tea Traders', category='Kitchen')
+        self.in_category = make_product('Caddy', '5', brand='Tinware', category='Tea')
+        self.in_description = make_product('Caddy', '5', brand='Tinware', category='Kitchen', description='for tea')
+        make_product('Spoon', '5', brand='Tinware', category='Kitchen')
+
+    def ids(self, query, limit=50):
+        return [pk for pk, _ in self.backend.search_page(query, limit)]
+
+    def test_bm25_ranks_name_brand_category_description(self):
+        expected = [self.in_name.id, self.in_brand.id, self.in_category.id, self.in_description.id]
+        self.assertEqual(self.ids('tea'), expected)
+        scores = [score for _, score in self.backend.search_page('tea')]
+        self.assertEqual(scores, sorted(scores))
+        # Prefixes match, and FTS5 syntax is searched as text.
+        self.assertEqual(self.ids('TE'), expected)
+        self.assertEqual(self.ids('tea OR spoon'), [])
+        self.assertEqual(self.ids('"'), [])
+
+    def test_index_follows_saves_deletes_and_bulk_changes(self):
+        self.in_name.product = 'Coffee Caddy'
+        self.in_name.save()
+        self.assertNotIn(self.in_name.id, self.ids('tea'))
+        self.assertEqual(self.ids('coffee'), [self.in_name.id])
+
+        self.in_brand.delete()
+        self.assertNotIn(self.in_brand.id, self.ids('tea'))
+
+        Product.objects.filter(id=self.in_description.id).update(description='for cocoa')
+        self.assertIn(self.in_description.id, self.ids('tea'))
+        products_bulk_changed.send(sender=Product, product_ids=[self.in_description.id])
+        self.assertEqual(self.ids('cocoa'), [self.in_description.id])
+        self.assertEqual(self.ids('tea'), [self.in_category.id])
+
+    def test_cursors_page_by_score_and_rowid(self):
+        # Identical rows score the same, so pages have to break ties on rowid.
+        for _ in range(4):
+            make_product('Tea Tin', '5', brand='Tinware', category='Kitchen')
+        expected = self.ids('tea')
+        self.assertEqual(len(expected), 8)
+        forward, last = self.walk('/api/shop/search/?q=tea&page_size=3', 'next')
+        self.assertEqual([len(page) for page in forward], [3, 3, 2])
+        self.assertEqual(sum(forward, []), expected)
+        backward, first = self.walk(links(last)['prev'], 'prev')
+        self.assertEqual(backward, forward[-2::-1])
+        self.assertNotIn('prev', links(first))
+        pk, score = self.backend.search_page('tea')[2]
+        position = (score, pk)
+        self.assertEqual([pk for pk, _ in self.backend.search_page('tea', 50, position)], expected[3:])
+        self.assertEqual([pk for pk, _ in self.backend.search_page('tea', 2, position, after=False)], expected[1::-1])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/shop/search/', {'q': 'tea', 'cursor': encode_cursor('id', 1, 1)})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(SHOP_SEARCH_BACKEND='shop.search.DatabaseSearchBackend')
+class DatabaseSearchTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(setattr, search, '_backend', search._backend)
+        search._backend = None
+        self.matches = [
+            make_product('Green Tea', '5', category='Drinks'), make_product('Mug', '5', brand='Teapot Co'),
+            make_product('Cup', '5', category='Kitchen', description='holds TEA'),
+        ]
+        make_product('Spoon', '5', category='Kitchen')
+
+    def test_unranked_substring_matches_in_id_order(self):
+        self.assertIsInstance(search.get_search_backend(), search.DatabaseSearchBackend)
+        forward, last = self.walk('/api/shop/search/?q=tea&page_size=2', 'next')
+        self.assertEqual(forward, [[self.matches[0].id, self.matches[1].id], [self.matches[2].id]])
+        backward, _ = self.walk(links(last)['prev'], 'prev')
+        self.assertEqual(backward, forward[-2::-1])
+        self.assertEqual(self.client.get('/api/shop/search/', {'q': '  '}).json(), [])
+
+
+class ImporterTests(TestCase):
+    HEADER = 'product,category,sub_category,brand,type,description,market_price,sale_price,rating\n'
+
+    def run_import(self, *rows, **options):
+        return import_products(io.StringIO(self.HEADER + ''.join(f'{row}\n' for row in rows)), **options)
+
+    def test_rows_are_cleaned_and_rejected(self):
+        result = self.run_import(
+            ' Green Tea ,Tea,Leaf,Acme,t,d,250,199,4.5',
+            'No brand,Tea,Leaf,,t,d,10,9,4',
+            'Bad price,Tea,Leaf,Acme,t,d,10,free,4',
+            'Honey,Food,,Bees,t,,,49,9',
+        )
+        self.assertEqual((result.rows, result.created, result.updated, result.rejected), (4, 2, 0, 2))
+        tea = Product.objects.get(product='Green Tea')
+        self.assertEqual((tea.sale_price, tea.market_price, tea.rating), (Decimal('199'), Decimal('250'), 4.5))
+        honey = Product.objects.get(product='Honey')
+        # A missing market price falls back to the sale price; an out of range rating is dropped.
+        self.assertEqual((honey.market_price, honey.rating, honey.sub_category), (Decimal('49'), None, None))
+
+    def test_reimport_updates_on_the_natural_key(self):
+        self.run_import('Green Tea,Tea,Leaf,Acme,t,d,250,199,4.5', 'Green Tea,Tea,Leaf,Other,t,d,20,19,4')
+        tea = Product.objects.get(product='Green Tea', brand='Acme')
+        result = self.run_import(
+            'Green Tea,Tea,Leaf,Acme,t,d,250,150,4.8', 'Mint Tea,Tea,Leaf,Acme,t,d,30,25,4', chunk_size=1,
+        )
+        self.assertEqual((result.created, result.updated), (1, 1))
+        self.assertEqual(Product.objects.count(), 3)
+        tea.refresh_from_db()
+        self.assertEqual((tea.sale_price, tea.rating), (Decimal('150'), 4.8))
+
+    def test_later_rows_win_within_a_chunk(self):
+        result = self.run_import('Green Tea,Tea,Leaf,Acme,t,d,250,199,4', 'Green Tea,Tea,Leaf,Acme,t,d,250,99,4')
+        self.assertEqual((result.created, result.updated, result.rejected, result.duplicates), (1, 0, 0, 1))
+        self.assertEqual(Product.objects.get().sale_price, Decimal('99'))
+
+    def test_without_upsert_rows_are_always_created(self):
+        self.run_import('Green Tea,Tea,Leaf,Acme,t,d,250,199,4')
+        result = self.run_import(
+            'Green Tea,Tea,Leaf,Acme,t,d,250,199,4', 'Green Tea,Tea,Leaf,Acme,t,d,250,99,4', upsert=False,
+        )
+        self.assertEqual((result.created, result.updated, result.duplicates), (2, 0, 0))
+        self.assertEqual(Product.objects.filter(product='Green Tea').count(), 3)
+
+    def test_prices_too_large_for_the_column_are_rejected(self):
+        result = self.run_import(
+            'Yacht,Boats,,Acme,t,d,,99999999.99,4',
+            'Island,Land,,Acme,t,d,,100000000,4',
+            'Castle,Land,,Acme,t,d,123456789012,5,4',
+            'Rounds up,Land,,Acme,t,d,,99999999.999,4',
+        )
+        self.assertEqual((result.created, result.rejected), (1, 3))
+        self.assertEqual(Product.objects.get().sale_price, Decimal('99999999.99'))
+
+
+class CartScopingTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.tea = make_product('Green Tea', '199')
+        self.honey = make_product('Honey', '49')
+
+    def post(self, user, url, data):
+        return self.client.post(url, data, content_type='application/json', HTTP_AUTHORIZATION=bearer(user))
+
+    def cart(self, response):
+        return {item['product']['id']: item['quantity'] for item in response.json()}
+
+    def test_requires_authentication(self):
+        response = self.client.post('/api/shop/cart/add/', {'product_id': self.tea.id}, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_each_user_sees_only_their_cart(self):
+        self.post(self.alice, '/api/shop/cart/add/', {'product_id': self.tea.id})
+        alice = self.post(self.alice, '/api/shop/cart/add/', {'product_id': self.tea.id})
+        bob = self.post(self.bob, '/api/shop/cart/add/', {'product_id': self.honey.id})
+        self.assertEqual(self.cart(alice), {self.tea.id: 2})
+        self.assertEqual(self.cart(bob), {self.honey.id: 1})
+
+    def test_changes_stay_in_the_callers_cart(self):
+        self.post(self.alice, '/api/shop/cart/add/', {'product_id': self.tea.id})
+        self.post(self.bob, '/api/shop/cart/add/', {'product_id': self.tea.id})
+        response = self.post(self.bob, '/api/shop/cart/remove/', {'product_id': self.tea.id})
+        self.assertEqual(self.cart(response), {})
+        response = self.post(self.bob, '/api/shop/cart/update/', {'product_id': self.tea.id, 'quantity': 5})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(list(CartItem.objects.values_list('user__username', 'product_id', 'quantity')),
+                         [('alice', self.tea.id, 1)])
+
+    def test_unknown_product(self):
+        response = self.post(self.alice, '/api/shop/cart/add/', {'product_id': self.honey.id + 100})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(CartItem.objects.exists())
+
+
+@override_settings(SHOP_CATALOG_VERSION_TTL=60)
+class CatalogCacheTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tea = make_product('Green Tea', '199')
+
+    def test_matching_etag_is_not_modified(self):
+        response = self.client.get('/api/shop/products/')
+        etag = response['ETag']
+        response = self.client.get('/api/shop/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_repeated_requests_are_served_from_the_cache(self):
+        first = self.client.get(f'/api/shop/products/{self.tea.id}/')
+        token = bearer(User.objects.create_user('alice'))
+        self.client.get(f'/api/shop/products/{self.tea.id}/', HTTP_AUTHORIZATION=token)
+        # Signed in or not: the token is checked from memory.
+        with self.assertNumQueries(0):
+            second = self.client.get(f'/api/shop/products/{self.tea.id}/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_parameters_are_part_of_the_key(self):
+        etags = {self.client.get('/api/shop/products/', params)['ETag']
+                 for params in ({}, {'sort': 'price_asc'}, {'brand': 'acme'})}
+        self.assertEqual(len(etags), 3)
+
+    def test_only_compact_json_is_cached(self):
+        url = f'/api/shop/products/{self.tea.id}/'
+        for accept in ('application/json', 'application/json; indent=4', 'application/json'):
+            with self.subTest(accept=accept):
+                response = self.client.get(url, HTTP_ACCEPT=accept)
+                self.assertEqual(b'\n    "id"' in response.content, 'indent' in accept)
+                self.assertEqual(response.has_header('ETag'), 'indent' not in accept)
+
+    def test_product_write_invalidates(self):
+        response = self.client.get(f'/api/shop/products/{self.tea.id}/')
+        etag = response['ETag']
+        self.tea.product = 'Jasmine Tea'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tea.save()
+        response = self.client.get(f'/api/shop/products/{self.tea.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['product'], 'Jasmine Tea')
+
+    def test_saving_a_product_invalidates(self):
+        etag = self.client.get('/api/shop/products/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            make_product('Honey', '49')
+        response = self.client.get('/api/shop/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_invalid_tokens_are_not_served_from_the_cache(self):
+        url = f'/api/shop/products/{self.tea.id}/'
+        etag = self.client.get(url)['ETag']
+        for headers in ({}, {'HTTP_IF_NONE_MATCH': etag}):
+            with self.subTest(headers=headers):
+                response = self.client.get(url, HTTP_AUTHORIZATION='Bearer not.a.token', **headers)
+                self.assertEqual(response.status_code, 401)
+
+    def test_errors_are_not_cached(self):
+        self.assertEqual(self.client.get('/api/shop/products/999999/').status_code, 404)
+        self.assertFalse(self.client.get('/api/shop/products/999999/').has_header('ETag'))
+
+
+class FacetDeltaTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.green = make_product('Green Tea', '40', rating=4.5, sub_category='Leaf')
+        self.black = make_product('Black Tea', '120', brand='Leafy', rating=3.2, sub_category='Leaf')
+        self.honey = make_product('Honey', '49', brand='Bees', category='Food', rating=None)
+
+    def counts(self):
+        return {
+            (row.category_key, row.brand_key, row.facet, row.value): row.count
+            for row in FacetCount.objects.all()
+        }
+
+    def assertMatchesRebuild(self):
+        """The incrementally kept counts equal a recount from scratch, with no empty rows left."""
+        incremental = self.counts()
+        self.assertNotIn(0, incremental.values())
+        rebuild_facets()
+        self.assertEqual(incremental, self.counts())
+
+    def facet(self, name, **filters):
+        return {entry['value']: entry['count'] for entry in get_facets(**filters)[name]}
+
+    def test_saved_products_are_counted(self):
+        self.assertEqual(self.facet('category'), {'Tea': 2, 'Food': 1})
+        self.assertEqual(self.facet('brand', category='tea'), {'Acme': 1, 'Leafy': 1})
+        self.assertEqual(self.facet('rating', category='tea'), {'4-5': 1, '3-4': 1})
+        self.assertEqual(self.facet('price', brand='bees'), {'0-50': 1})
+        self.assertEqual(self.facet('rating', brand='bees'), {'unrated': 1})
+        self.assertMatchesRebuild()
+
+    def test_a_change_moves_only_its_cells(self):
+        self.green.sale_price = Decimal('1500')
+        self.green.brand = 'Leafy'
+        self.green.save()
+        self.assertEqual(self.facet('price', category='tea'), {'100-200': 1, '1000+': 1})
+        self.assertEqual(self.facet('brand', category='tea'), {'Leafy': 2})
+        self.assertMatchesRebuild()
+
+    def test_deleted_products_are_uncounted(self):
+        self.honey.delete()
+        self.assertEqual(self.facet('category'), {'Tea': 2})
+        self.assertFalse(FacetCount.objects.filter(value='Bees').exists())
+        self.assertMatchesRebuild()
+
+    def test_bulk_changes(self):
+        # Writes that bypass save(), as the importer's, are counted through update_facets.
+        Product.objects.filter(category='Tea').update(category='Drinks', rating=1.0)
+        update_facets([self.green.id, self.black.id, self.honey.id])
+        self.assertEqual(self.facet('category'), {'Drinks': 2, 'Food': 1})
+        self.assertEqual(self.facet('rating', category='drinks'), {'1-2': 2})
+        self.assertMatchesRebuild()
+
+    def test_unchanged_products_write_nothing(self):
+        before = self.counts()
+        # Savepoint, the two reads and release: nothing to write.
+        with self.assertNumQueries(4):
+            update_facets([self.green.id, self.black.id])
+        self.assertEqual(self.counts(), before)
+
+    def test_endpoint(self):
+        response = self.client.get('/api/shop/facets/', {'category': 'Tea'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['brand'], [{'value': 'Acme', 'count': 1}, {'value': 'Leafy', 'count': 1}])
+
+    def test_non_ascii_filters_match_the_listing(self):
+        # SQLite's LOWER() leaves non-ASCII letters alone, so the stored
+        # keys are not what str.lower() gives.
+        make_product('Confiture', '9', brand='Épices Ölund', category='Épicerie', rating=4.2)
+        for params in ({'category': 'Épicerie'}, {'category': 'ÉPICERIE'}, {'brand': 'ÉPICES ÖLUND'}):
+            with self.subTest(params=params):
+                listed = self.client.get('/api/shop/products/', params).json()
+                facets = self.client.get('/api/shop/facets/', params).json()
+                self.assertEqual(sum(entry['count'] for entry in facets['rating']), len(listed))
+                self.assertEqual(len(listed), 1)
+                self.assertEqual(facets['price'], [{'value': '0-50', 'count': 1}])
+
+
+class CartBatchTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice')
+        self.tea = make_product('Green Tea', '199')
+        self.honey = make_product('Honey', '49')
+
+    def batch(self, *operations):
+        return self.client.post(
+            '/api/shop/cart/batch/', {'operations': list(operations)},
+            content_type='application/json', HTTP_AUTHORIZATION=bearer(self.user),
+        )
+
+    def cart(self):
+        return dict(CartItem.objects.filter(user=self.user).values_list('product_id', 'quantity'))
+
+    def test_operations_apply_in_order(self):
+        CartItem.objects.create(user=self.user, product=self.honey, quantity=4)
+        response = self.batch(
+            {'op': 'add', 'product_id': self.tea.id},
+            {'op': 'add', 'product_id': self.tea.id, 'quantity': 2},
+            {'op': 'set', 'product_id': self.honey.id, 'quantity': 1},
+            {'op': 'remove', 'product_id': self.honey.id},
+            {'op': 'add', 'product_id': self.honey.id},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cart(), {self.tea.id: 3, self.honey.id: 1})
+
+    def test_unknown_products_apply_nothing(self):
+        response = self.batch({'op': 'add', 'product_id': self.tea.id}, {'op': 'add', 'product_id': 999999})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['product_ids'], [999999])
+        self.assertEqual(self.cart(), {})
+
+    def test_invalid_operations(self):
+        response = self.batch({'op': 'add'}, {'op': 'set', 'product_id': self.tea.id}, {'op': 'drop', 'product_id': 1})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'].count('operations['), 3)
+        with override_settings(SHOP_CART_BATCH_MAX=1):
+            self.assertEqual(self.batch(*[{'op': 'add', 'product_id': self.tea.id}] * 2).status_code, 400)
+
+    def test_concurrent_insert_is_retried(self):
+        # Another request adds the product after this batch read the cart:
+        # the first pass's insert hits the unique constraint and the second
+        # pass adds to that row instead.
+        CartItem.objects.create(user=self.user, product=self.tea, quantity=2)
+        select_for_update = CartItem.objects.select_for_update
+        reads = []
+
+        def stale_first_read(*args, **kwargs):
+            reads.append(None)
+            queryset = select_for_update(*args, **kwargs)
+            return queryset.none() if len(reads) == 1 else queryset
+
+        with mock.patch.object(CartItem.objects, 'select_for_update', side_effect=stale_first_read):
+            response = self.batch({'op': 'add', 'product_id': self.tea.id, 'quantity': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(reads), 2)
+        self.assertEqual(self.cart(), {self.tea.id: 5})
+
+
+@override_settings(SHOP_JOB_MAX_ATTEMPTS=2)
+class JobLeaseTests(TestCase):
+    def expire(self, job):
+        CatalogJob.objects.filter(id=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+
+    def upload(self):
+        """The path of an uploaded CSV, as enqueue_import leaves it."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name) / 'products.csv'
+        path.write_text('product,category,brand,sale_price\nGreen Tea,Tea,Acme,5\n')
+        return path
+
+    def test_claims_are_leased(self):
+        job = jobs.enqueue('facets')
+        claimed = jobs.claim_next('host:1')
+        self.assertEqual((claimed.pk, claimed.status, claimed.attempts), (job.pk, CatalogJob.RUNNING, 1))
+        self.assertGreater(claimed.locked_until, timezone.now())
+        self.assertIsNone(jobs.claim_next('host:2'))
+
+    def test_expired_jobs_are_reclaimed_then_failed(self):
+        job = jobs.enqueue('facets')
+        first = jobs.claim_next('host:1')
+        self.expire(job)
+        second = jobs.claim_next('host:2')
+        self.assertEqual((second.pk, second.attempts, second.worker), (job.pk, 2, 'host:2'))
+        # The lost claim can no longer record an outcome.
+        self.assertFalse(jobs._finish(first, CatalogJob.SUCCEEDED))
+        self.expire(job)
+        self.assertIsNone(jobs.claim_next('host:3'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, CatalogJob.FAILED)
+        self.assertIn('Worker lost', job.error)
+
+    def test_lost_imports_without_upsert_are_not_retried(self):
+        job = jobs.enqueue(CatalogJob.IMPORT, {'upsert': False}, path=self.upload())
+        upsert = jobs.enqueue(CatalogJob.IMPORT, {'upsert': True}, path=self.upload())
+        jobs.claim_next('host:1')
+        jobs.claim_next('host:1')
+        self.expire(job)
+        self.expire(upsert)
+        self.assertEqual(jobs.reclaim_expired(), (1, 1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, CatalogJob.FAILED)
+        self.assertIn('without upsert', job.error)
+        self.assertFalse(Path(job.path).exists())
+        self.assertEqual(jobs.claim_next('host:2').pk, upsert.pk)
+        self.assertTrue(Path(upsert.path).exists())
+
+    @override_settings(SHOP_JOB_MAX_ATTEMPTS=1)
+    def test_uploads_of_failed_imports_are_deleted(self):
+        lost = jobs.enqueue(CatalogJob.IMPORT, {'upsert': True}, path=self.upload())
+        jobs.claim_next('host:1')
+        self.expire(lost)
+        self.assertEqual(jobs.reclaim_expired(), (0, 1))
+        self.assertFalse(Path(lost.path).exists())
+
+        broken = jobs.enqueue(CatalogJob.IMPORT, {'encoding': 'no-such-codec'}, path=self.upload())
+        claimed = jobs.claim_next('host:1')
+        with self.assertLogs('shop.jobs', 'ERROR'):
+            self.assertFalse(jobs.run_job(claimed, pool=None, processes=1))
+        broken.refresh_from_db()
+        self.assertEqual(broken.status, CatalogJob.FAILED)
+        self.assertFalse(Path(broken.path).exists())
+
+    @override_settings(SHOP_IMPORT_MAX_BYTES=10)
+    def test_oversized_uploads_are_refused(self):
+        staff = User.objects.create_user('staff', is_staff=True)
+        response = self.client.post(
+            '/api/shop/catalog/import/', {'file': SimpleUploadedFile('products.csv', b'x' * 100)},
+            HTTP_AUTHORIZATION=bearer(staff),
+        )
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(CatalogJob.objects.exists())
+
+
+# The async views, mounted at the root.
+@override_settings(ROOT_URLCONF='shop.async_urls')
+class AsyncAuthenticationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tea = make_product('Green Tea', '199')
+        self.user = User.objects.create_user('alice')
+
+    async def get(self, url, authorization=None):
+        headers = {'Authorization': authorization} if authorization else {}
+        return await AsyncClient().get(url, headers=headers)
+
+    async def test_catalog_reads_check_a_given_token(self):
+        for url in ('/products/', f'/products/{self.tea.id}/', '/search/?q=tea'):
+            with self.subTest(url=url):
+                self.assertEqual((await self.get(url)).status_code, 200)
+                self.assertEqual((await self.get(url, bearer(self.user))).status_code, 200)
+                response = await self.get(url, 'Bearer not.a.token')
+                self.assertEqual(response.status_code, 401)
+                self.assertIn('WWW-Authenticate', response)
+
+    async def test_cart_requires_a_token(self):
+        self.assertEqual((await self.get('/cart/summary/')).status_code, 401)
+        self.assertEqual((await self.get('/cart/summary/', bearer(self.user))).status_code, 200)
+
+
+class AsyncParityTests(CatalogTestCase):
+    """The async views answer like the sync ones, byte for byte."""
+
+    def setUp(self):
+        super().setUp()
+        self.tea = make_product('Green Tea', '199', market_price='250', description='loose leaf')
+        self.honey = make_product('Honey', '49', brand='Bees', category='Food', rating=None)
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+
+    def exchange(self, method, path, data=None, users=(None, None), **headers):
+        """``(status, Content-Type, body)`` from the sync view, then from the async one."""
+        def options(user):
+            options = {'headers': {**headers, **({'Authorization': bearer(user)} if user else {})}}
+            if data is not None:
+                options.update(data=data, content_type='application/json')
+            return options
+
+        async def fetch():
+            response = await getattr(AsyncClient(), method)(path, **options(users[1]))
+            return response, b''.join([chunk async for chunk in response]) if response.streaming else response.content
+
+        response = getattr(self.client, method)(f'/api/shop{path}', **options(users[0]))
+        answers = [(response, b''.join(response.streaming_content) if response.streaming else response.content)]
+        # Not from the response cache the sync view just filled.
+        for alias in caches:
+            caches[alias].clear()
+        with override_settings(ROOT_URLCONF='shop.async_urls'):
+            answers.append(async_to_sync(fetch)())
+        return [
+            (response.status_code, response.get('Content-Type'),
+             gzip.decompress(body) if response.get('Content-Encoding') == 'gzip' else body)
+            for response, body in answers
+        ]
+
+    def assert_parity(self, method, path, data=None, users=(None, None), **headers):
+        sync, async_ = self.exchange(method, path, data, users, **headers)
+        self.assertEqual(sync, async_)
+        return sync
+
+    def assert_cart_parity(self, path, data):
+        """Alice's cart changed by the sync view matches Bob's changed by the async one."""
+        sync, async_ = self.exchange('post', path, data, (self.alice, self.bob))
+        self.assertEqual(sync[:2], async_[:2])
+        if sync[0] != 200:
+            self.assertEqual(sync[2], async_[2])
+            return
+        # Cart item ids are the only difference between the two carts.
+        strip = lambda body: [{key: value for key, value in item.items() if key != 'id'} for item in json.loads(body)]
+        self.assertEqual(strip(sync[2]), strip(async_[2]))
+
+    def test_catalog_reads(self):
+        for path in (
+            '/products/', '/products/?sort=price_asc&page_size=1', '/products/?fields=card',
+            '/products/?fields=rating,id&brand=bees', '/products/?fields=colour', '/products/?cursor=nonsense',
+            f'/products/{self.tea.id}/', '/products/999999/', '/search/?q=tea&fields=id,product',
+            '/search/?q=tea&fields=colour', '/search/?q=%20', '/facets/?category=tea',
+        ):
+            with self.subTest(path=path):
+                self.assert_parity('get', path)
+
+    def test_snapshot_reads(self):
+        self.use_temporary_dir('SHOP_SNAPSHOT_DIR')
+        snapshot._loaded = None
+        snapshot.export_catalog_snapshot()
+        with override_settings(SHOP_SNAPSHOT_READS=True), mock.patch.object(
+            snapshot.CatalogSnapshot, 'locate', autospec=True, side_effect=snapshot.CatalogSnapshot.locate,
+        ) as locate:
+            for path in ('/products/?sort=price_asc&page_size=1', '/products/?brand=bees&fields=card'):
+                with self.subTest(path=path):
+                    self.assert_parity('get', path)
+        self.assertEqual(locate.call_count, 4)
+
+    def test_cart_changes(self):
+        for path, data in (
+            ('/cart/add/', {'product_id': self.tea.id}),
+            ('/cart/add/', {'product_id': self.tea.id}),
+            ('/cart/add/?fields=card', {'product_id': self.honey.id}),
+            ('/cart/add/', {'product_id': 999999}),
+            ('/cart/add/', {}),
+            ('/cart/update/', {'product_id': self.honey.id, 'quantity': 5}),
+            ('/cart/update/?fields=id', {'product_id': self.tea.id, 'quantity': 3}),
+            ('/cart/update/', {'product_id': 999999, 'quantity': 3}),
+            ('/cart/update/', {'product_id': self.tea.id, 'quantity': 0}),
+            ('/cart/remove/', {'product_id': self.honey.id}),
+            ('/cart/remove/', {}),
+            ('/cart/batch/', {'operations': [{'op': 'add', 'product_id': self.honey.id, 'quantity': 2},
+                                             {'op': 'set', 'product_id': self.tea.id, 'quantity': 1}]}),
+            ('/cart/batch/?fields=card', {'operations': [{'op': 'remove', 'product_id': self.tea.id}]}),
+            ('/cart/batch/', {'operations': [{'op': 'add', 'product_id': 999999}]}),
+            ('/cart/batch/', {'operations': [{'op': 'explode', 'product_id': self.tea.id}]}),
+            ('/cart/add/?fields=colour', {'product_id': self.tea.id}),
+        ):
+            with self.subTest(path=path, data=data):
+                self.assert_cart_parity(path, data)
+        self.assertEqual(
+            list(CartItem.objects.filter(user=self.alice).values_list('product_id', 'quantity')),
+            list(CartItem.objects.filter(user=self.bob).values_list('product_id', 'quantity')),
+        )
+        self.assert_parity('get', '/cart/summary/', users=(self.alice, self.bob))
+
+    def test_export_streams(self):
+        for path, encoding in (
+            ('/export/', ''), ('/export/?format=csv', ''), ('/export/', 'gzip'),
+            ('/export/?since=2100-01-01T00:00:00Z', ''), ('/export/?format=xml', ''),
+        ):
+            with self.subTest(path=path, encoding=encoding):
+                status, _, body = self.assert_parity(
+                    'get', path, users=(self.alice, self.alice), **{'Accept-Encoding': encoding},
+                )
+                self.assertEqual(bool(body.strip()), 'since' not in path)
+
+    def test_unsupported_methods(self):
+        for method, path in (('post', '/products/'), ('delete', f'/products/{self.tea.id}/'), ('get', '/cart/add/')):
+            with self.subTest(method=method, path=path):
+                status, _, _ = self.assert_parity(method, path, users=(self.alice, self.alice))
+                self.assertEqual(status, 405)
+
+
+class SnapshotReadTests(CatalogTestCase):
+    """Listings located in the catalog snapshot are the ORM's, page for page."""
+
+    def setUp(self):
+        super().setUp()
+        specs = [
+            ('Tea', 'Acme', '5', 4.5), ('Tea', 'Acme', '3', None), ('Tea', 'Leafy', '3', 4.5),
+            ('Food', 'Bees', '9', 2.0), ('Tea', 'Leafy', '1', None), ('Épicerie', 'Ölund', '3', 3.0),
+            ('Food', 'Acme', '7', 4.5), ('Tea', 'Acme', '3', 1.0), ('Épicerie', 'Acme', '2', None),
+        ]
+        for index, (category, brand, price, rating) in enumerate(specs):
+            make_product(f'Product {index}', price, brand=brand, category=category, rating=rating)
+        self.use_temporary_dir('SHOP_SNAPSHOT_DIR')
+        snapshot._loaded = None
+        snapshot.export_catalog_snapshot()
+
+    def walk(self, url, rel, snapshot_reads):
+        """Bodies and Link headers from ``url`` on, following ``rel`` links."""
+        for alias in caches:
+            caches[alias].clear()
+        pages = []
+        with override_settings(SHOP_SNAPSHOT_READS=snapshot_reads):
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                pages.append((response.json(), response.get('Link')))
+                url = links(response).get(rel)
+        return pages
+
+    def test_pages_match_the_orm(self):
+        filters = ['', '&category=tea', '&brand=ACME', '&category=Tea&brand=leafy', '&category=Épicerie',
+                   '&category=ÉPICERIE', '&brand=nobody']
+        located = []
+        locate = snapshot.CatalogSnapshot.locate
+
+        def spy(*args, **kwargs):
+            located.append(locate(*args, **kwargs))
+            return located[-1]
+
+        for sort in ('', 'price_asc', 'price_desc', 'rating_desc'):
+            for query in filters:
+                url = f'/api/shop/products/?page_size=2&sort={sort}{query}'
+                with self.subTest(url=url):
+                    with mock.patch.object(snapshot.CatalogSnapshot, 'locate', autospec=True, side_effect=spy):
+                        forward = self.walk(url, 'next', True)
+                    self.assertEqual(forward, self.walk(url, 'next', False))
+                    last_page = links_of(forward[-1][1]).get('prev')
+                    if last_page:
+                        with mock.patch.object(snapshot.CatalogSnapshot, 'locate', autospec=True, side_effect=spy):
+                            backward = self.walk(last_page, 'prev', True)
+                        self.assertEqual(backward, self.walk(last_page, 'prev', False))
+        # Most pages came from the snapshot; unknown keys fell back to the ORM.
+        self.assertGreater(sum(result is not None for result in located), len(located) // 2)
+        self.assertIn(None, located)
+
+    def test_stale_snapshot_is_not_used(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_product('Late', '4')
+        with mock.patch.object(snapshot.CatalogSnapshot, 'locate') as locate:
+            pages = self.walk('/api/shop/products/?page_size=50', 'next', True)
+        locate.assert_not_called()
+        self.assertEqual(len(pages[0][0]), 10)
+
+
+class SimilarProductsTests(CatalogTestCase):
+    DESCRIPTIONS = [
+        'green tea leaves steeped', 'green tea sencha leaves', 'black tea assam leaves', 'roasted coffee beans',
+        'dark roasted coffee espresso beans', 'wildflower honey jar', 'raw honey comb jar', 'oolong tea leaves',
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.path = Path(self.use_temporary_dir('SHOP_RECOMMENDATIONS_DIR'))
+        recommendations._loaded = None
+        self.products = [
+            make_product(f'Product {index}', '5', brand='Plain', category='Pantry', description=description)
+            for index, description in enumerate(self.DESCRIPTIONS)
+        ]
+
+    def similar(self, product, **params):
+        return self.client.get(f'/api/shop/products/{product.id}/similar/', params)
+
+    def assert_neighbours_are_exact(self):
+        """Every stored list is the brute-force top-k over the stored vectors."""
+        from scipy import sparse
+
+        ids = np.load(self.path / 'ids.npy')
+        neighbours = np.load(self.path / 'neighbours.npy')
+        matrix = sparse.load_npz(self.path / 'tfidf.npz').tocsr()
+        expected, _ = recommendations._top_k_rows(matrix, np.arange(len(ids)), ids, neighbours.shape[1], 4)
+        np.testing.assert_array_equal(neighbours, expected)
+
+    def test_not_built_yet(self):
+        response = self.similar(self.products[0])
+        self.assertEqual(response.status_code, 503)
+
+    def test_results_rank_the_closest_products_first(self):
+        recommendations.build_similar_products()
+        response = self.similar(self.products[3])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['id'], self.products[4].id)
+        ids = [row['id'] for row in self.similar(self.products[0], limit=3).json()]
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(ids[0], self.products[1].id)
+        self.assertNotIn(self.products[0].id, ids)
+        self.assertEqual(self.client.get('/api/shop/products/999999/similar/').status_code, 404)
+        self.assertEqual(self.similar(self.products[0], limit='x').status_code, 400)
+
+    def test_incremental_rebuild(self):
+        self.assertEqual(recommendations.build_similar_products(top_k=3)['mode'], 'full')
+        self.assertEqual(recommendations.build_similar_products(top_k=3)['mode'], 'unchanged')
+        changed = self.products[5]
+        changed.description = 'roasted coffee beans ground'
+        changed.save()
+        summary = recommendations.build_similar_products(top_k=3)
+        self.assertEqual((summary['mode'], summary['changed'], summary['removed']), ('incremental', 1, 0))
+        self.assert_neighbours_are_exact()
+        self.assertIn(changed.id, [row['id'] for row in self.similar(self.products[3]).json()])
+        self.assertEqual(self.similar(changed).json()[0]['id'], self.products[3].id)
+
+        self.products[4].delete()
+        summary = recommendations.build_similar_products(top_k=3)
+        self.assertEqual((summary['mode'], summary['removed']), ('incremental', 1))
+        self.assert_neighbours_are_exact()
+        self.assertNotIn(self.products[4].id, [row['id'] for row in self.similar(self.products[3]).json()])
+
+    def test_build_after_an_empty_catalog(self):
+        Product.objects.all().delete()
+        self.assertEqual(recommendations.build_similar_products()['products'], 0)
+        make_product('Tea', '5', brand='Plain', category='Pantry', description='green tea leaves')
+        summary = recommendations.build_similar_products()
+        self.assertEqual((summary['mode'], summary['products']), ('full', 1))
+
+    def test_unreadable_rebuild_keeps_the_loaded_model(self):
+        recommendations.build_similar_products()
+        model = recommendations.get_similar_products()
+        self.assertIsNotNone(model)
+        (self.path / 'ids.npy').write_bytes(b'not an array')
+        self.assertIs(recommendations.get_similar_products(), model)
+        self.assertEqual(self.similar(self.products[3]).status_code, 200)
+
+        recommendations._loaded = None
+        self.assertIsNone(recommendations.get_similar_products())
+        self.assertEqual(self.similar(self.products[3]).status_code, 503)
+
+
+class FastSerializerTests(CatalogTestCase):
+    """The fast path renders the bytes ``ProductSerializer`` + ``JSONRenderer`` would."""
+
+    def setUp(self):
+        super().setUp()
+        make_product(
+            'Café “crème” ☕ 日本', '12.5', market_price='19.99', rating=4.25, sub_category='Hot',
+            description='line\u2028separator\u2029paragraph \x7f </script> "quoted" \\ tab\t', type='Ground',
+        )
+        make_product('Plain', '0.10', rating=None, market_price='0.10')
+        make_product('Thirds', '12345678.90', market_price='99999999.99', rating=1 / 3)
+        make_product('Whole', '7', market_price='7', rating=0.0)
+        self.tiny = make_product('Tiny', '1', rating=1e-5)
+        self.huge = make_product('Huge', '1', rating=1e20)
+
+    def slow(self, queryset, fields=None):
+        return JSONRenderer().render(ProductSerializer(queryset, many=True, fields=fields).data)
+
+    def fast(self, queryset, fields=None):
+        plan = fast_serializers.get_product_plan(fields)
+        return fast_serializers.fast_json_response(plan, list(queryset.values(*plan.columns))).content
+
+    def test_rows_render_identically(self):
+        for product in Product.objects.order_by('id'):
+            for fields in (None, ('id', 'rating', 'discount'), ('description', 'sale_price')):
+                with self.subTest(product=product.product, fields=fields):
+                    queryset = Product.objects.filter(id=product.id)
+                    self.assertEqual(self.fast(queryset, fields), self.slow(queryset, fields))
+
+    def test_generated_discount(self):
+        values = Product.objects.order_by('id').values_list('discount', flat=True)
+        self.assertEqual(list(values)[:4], [37.47, 0.0, 87.65, 0.0])
+
+    def test_listing_renders_identically(self):
+        response = self.client.get('/api/shop/products/', {'sort': 'price_asc'})
+        self.assertEqual(response.content, self.slow(Product.objects.order_by('sale_price', 'id')))
+
+    def test_out_of_range_floats_take_the_slow_path(self):
+        queryset = Product.objects.filter(id__in=[self.tiny.id, self.huge.id]).order_by('id')
+        plan = fast_serializers.get_product_plan(None)
+        with self.assertRaises(fast_serializers.SlowPathRequired):
+            plan.convert_many(queryset.values(*plan.columns))
+        with mock.patch.object(fast_serializers, 'render_json') as render_json:
+            content = self.fast(queryset)
+        render_json.assert_not_called()
+        self.assertEqual(content, self.slow(queryset))
+        self.assertIn(b'"rating":1e-05', content)
+        self.assertIn(b'"rating":1e+20', content)
+
+
+class CartSummaryTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice')
+        # (sale price, market price, quantity): cents that are inexact in
+        # binary floating point, a sale price above the market price, and
+        # a total near the serializer's 14 digits.
+        self.lines = [('0.10', '0.20', 3), ('19.99', '9.99', 2), ('1234567.89', '1234567.99', 7)]
+        for index, (sale, market, quantity) in enumerate(self.lines):
+            product = make_product(f'Product {index}', sale, market_price=market)
+            CartItem.objects.create(user=self.alice, product=product, quantity=quantity)
+        for index in range(7):
+            product = make_product(f'Cents {index}', '0.07', market_price='0.10')
+            CartItem.objects.create(user=self.alice, product=product, quantity=index + 1)
+        bob = User.objects.create_user('bob')
+        CartItem.objects.create(user=bob, product=make_product('Elsewhere', '5'), quantity=9)
+
+    def summary(self, user):
+        response = self.client.get('/api/shop/cart/summary/', HTTP_AUTHORIZATION=bearer(user))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_totals(self):
+        body = self.summary(self.alice)
+        self.assertEqual(
+            [(line['quantity'], line['line_total'], line['line_savings']) for line in body['lines'][:3]],
+            [(3, '0.30', '0.30'), (2, '39.98', '0.00'), (7, '8641975.23', '0.70')],
+        )
+        self.assertEqual(body['lines'][4]['line_total'], '0.14')
+        self.assertEqual(
+            (body['item_count'], body['subtotal'], body['savings']),
+            (12 + 28, '8642017.47', '1.84'),
+        )
+
+    def test_queryset_totals_are_exact_decimals(self):
+        with self.assertNumQueries(1):
+            rows = list(views.cart_summary_queryset(self.alice.pk))
+        self.assertEqual(len(rows), 10)
+        for row in rows:
+            for key in ('line_total', 'line_savings', 'subtotal', 'savings'):
+                with self.subTest(product=row['name'], key=key):
+                    self.assertIsInstance(row[key], Decimal)
+                    self.assertEqual(row[key], row[key].quantize(Decimal('0.01')))
+        self.assertEqual({(row['subtotal'], row['savings']) for row in rows}, {(Decimal('8642017.47'), Decimal('1.84'))})
+        self.assertEqual(sum(row['line_total'] for row in rows), rows[0]['subtotal'])
+
+    def test_empty_cart(self):
+        empty = User.objects.create_user('carol')
+        self.assertEqual(self.summary(empty), {'item_count': 0, 'subtotal': '0.00', 'savings': '0.00', 'lines': []})
+
+    def test_requires_authentication(self):
+        self.assertEqual(self.client.get('/api/shop/cart/summary/').status_code, 401)
+
+
+@override_settings(SHOP_EXPORT_CHUNK_SIZE=2)
+class ExportTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice')
+        self.start = datetime(2024, 3, 1, 12, tzinfo=UTC)
+        # Modified (hours after start): ties at +2, and ids out of time order.
+        offsets = [5, 2, 0, 2, 9, 2]
+        self.products = []
+        for index, hours in enumerate(offsets):
+            product = make_product(f'Product {index}', '5', sub_category=None if index % 2 else 'Loose')
+            Product.objects.filter(id=product.id).update(last_modified=self.start + timedelta(hours=hours))
+            self.products.append(product)
+
+    def export(self, encoding='', **params):
+        response = self.client.get(
+            '/api/shop/export/', params, HTTP_AUTHORIZATION=bearer(self.user), HTTP_ACCEPT_ENCODING=encoding,
+        )
+        if response.status_code != 200:
+            return response, None
+        body = b''.join(response.streaming_content)
+        if response.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return response, body.decode()
+
+    def ndjson(self, **params):
+        response, body = self.export(**params)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertTrue(body.endswith('\n'))
+        return [json.loads(line) for line in body.splitlines()]
+
+    def expected(self, since=None):
+        """Ids in ``(last_modified, id)`` order, modified at or after ``since``."""
+        products = Product.objects.order_by('last_modified', 'id')
+        if since is not None:
+            products = products.filter(last_modified__gte=since)
+        return list(products.values_list('id', flat=True))
+
+    def test_full_export(self):
+        rows = self.ndjson()
+        self.assertEqual([row['id'] for row in rows], [p.id for p in self.products])
+        self.assertEqual(rows[2]['last_modified'], '2024-03-01T12:00:00Z')
+        self.assertEqual(rows[0]['sale_price'], '5.00')
+        self.assertIsNone(rows[1]['sub_category'])
+        self.assertFalse(set(rows[0]) & {'category_lower', 'brand_lower', 'trending'})
+
+    def test_since(self):
+        cases = {
+            '2024-03-01T14:00:00Z': self.start + timedelta(hours=2),
+            '2024-03-01T15:00:00+01:00': self.start + timedelta(hours=2),
+            # An unescaped '+' arrives as a space.
+            '2024-03-01T17:00:00 01:00': self.start + timedelta(hours=4),
+            '2024-03-01T14:00:00': self.start + timedelta(hours=2),
+            '2024-03-01': self.start - timedelta(hours=12),
+        }
+        for since, instant in cases.items():
+            with self.subTest(since=since):
+                rows = self.ndjson(since=since)
+                self.assertEqual([row['id'] for row in rows], self.expected(instant))
+                keys = [(row['last_modified'], row['id']) for row in rows]
+                self.assertEqual(keys, sorted(keys))
+        ids = [row['id'] for row in self.ndjson(since='2024-03-01T14:00:00Z')]
+        self.assertEqual(ids, [self.products[1].id, self.products[3].id, self.products[5].id,
+                               self.products[0].id, self.products[4].id])
+        self.assertEqual(self.export(since='2024-03-02')[1], '')
+
+    def test_csv(self):
+        for params, headers in (({'format': 'csv'}, {}), ({}, {'HTTP_ACCEPT': 'text/csv'})):
+            with self.subTest(params=params, headers=headers):
+                response = self.client.get(
+                    '/api/shop/export/', params, HTTP_AUTHORIZATION=bearer(self.user), **headers,
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+                rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+                self.assertEqual([int(row['id']) for row in rows], [p.id for p in self.products])
+                self.assertEqual((rows[0]['sub_category'], rows[1]['sub_category']), ('Loose', ''))
+                self.assertEqual(rows[4]['last_modified'], '2024-03-01T21:00:00Z')
+        response, body = self.export(format='csv', since='2024-03-01T14:00:00Z')
+        ids = [int(row['id']) for row in csv.DictReader(io.StringIO(body))]
+        self.assertEqual(ids, self.expected(self.start + timedelta(hours=2)))
+
+    def test_csv_formulas_are_escaped(self):
+        for index, text in enumerate(('=HYPERLINK("http://x")', '+1', '-2', '@SUM(A1)')):
+            make_product(text, '5', description=f'plain {index}')
+        rows = list(csv.DictReader(io.StringIO(self.export(format='csv')[1])))[-4:]
+        self.assertEqual(
+            [row['product'] for row in rows], ['\'=HYPERLINK("http://x")', "'+1", "'-2", "'@SUM(A1)"],
+        )
+        self.assertEqual(rows[0]['description'], 'plain 0')
+        # JSON consumers get the text as stored.
+        self.assertEqual(self.ndjson()[-1]['product'], '@SUM(A1)')
+
+    def test_gzip(self):
+        for fmt in ('ndjson', 'csv'):
+            with self.subTest(format=fmt):
+                plain, expected = self.export(format=fmt)
+                compressed, body = self.export('gzip, deflate', format=fmt)
+                self.assertNotIn('Content-Encoding', plain)
+                self.assertEqual(compressed['Content-Encoding'], 'gzip')
+                self.assertIn('Accept-Encoding', compressed['Vary'])
+                self.assertEqual(body, expected)
+
+    def test_invalid_parameters(self):
+        for params in ({'since': 'yesterday'}, {'since': '2024-13-01'}, {'since': '2024-03-01T25:00'},
+                       {'format': 'xml'}):
+            with self.subTest(params=params):
+                response, _ = self.export(**params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+    def test_requires_authentication(self):
+        self.assertEqual(self.client.get('/api/shop/export/').status_code, 401)
+
+
+@override_settings(SHOP_TRENDING_HALF_LIFE=3600, SHOP_TRENDING_WEIGHTS={'view': 1.0, 'cart': 5.0})
+class TrendingTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = [make_product(f'Product {index}', '5') for index in range(6)]
+        self.t0 = popularity.EPOCH + 10 * 3600
+
+    def trending(self, product):
+        return Product.objects.values_list('trending', flat=True).get(id=product.id)
+
+    def test_flushes_add_up_in_log2_space(self):
+        product = self.products[0]
+        self.assertEqual(popularity.write_counts({product.id: 3.0}, self.t0), 1)
+        popularity.write_counts({product.id: 5.0}, self.t0)
+        self.assertAlmostEqual(self.trending(product), popularity.score_at(8.0, self.t0))
+        self.assertAlmostEqual(popularity.current_score(self.trending(product), self.t0), 8.0)
+        # An hour (one half-life) later the old total counts half.
+        popularity.write_counts({product.id: 1.0}, self.t0 + 3600)
+        self.assertAlmostEqual(popularity.current_score(self.trending(product), self.t0 + 3600), 5.0)
+        self.assertAlmostEqual(popularity.current_score(self.trending(product), self.t0 + 7200), 2.5)
+        self.assertEqual(popularity.write_counts({product.id: 0.0}), 0)
+        self.assertIsNone(self.trending(self.products[1]))
+
+    def test_order_follows_the_decayed_score(self):
+        old, recent, steady = self.products[:3]
+        popularity.write_counts({old.id: 7.0, steady.id: 2.0}, self.t0)
+        popularity.write_counts({recent.id: 2.0, steady.id: 1.0}, self.t0 + 2 * 3600)
+        # At t0 + 2h: old 7/4, recent 2, steady 2/4 + 1.
+        ordered = Product.objects.filter(trending__isnull=False).order_by('-trending')
+        self.assertEqual(list(ordered.values_list('id', flat=True)), [recent.id, old.id, steady.id])
+
+    def test_listing_puts_unseen_products_last(self):
+        first, second, third = self.products[3], self.products[1], self.products[4]
+        popularity.write_counts({first.id: 9.0, second.id: 4.0, third.id: 4.0}, self.t0)
+        unseen = sorted((p.id for p in self.products if p not in (first, second, third)), reverse=True)
+        # Ties on the score break on id, descending like the score.
+        expected = [first.id, third.id, second.id, *unseen]
+        forward, last = self.walk('/api/shop/products/?sort=trending&page_size=2', 'next')
+        self.assertEqual(forward, [expected[:2], expected[2:4], expected[4:]])
+        # The later pages start from a NULL score.
+        cursor = parse_qs(urlsplit(links(last)['prev']).query)['cursor'][0]
+        self.assertEqual(decode_cursor(cursor, 'trending'), (None, expected[4], False))
+        backward, first_page = self.walk(links(last)['prev'], 'prev')
+        self.assertEqual(backward, forward[-2::-1])
+        self.assertNotIn('prev', links(first_page))
+
+    def test_listing_is_not_cached(self):
+        first, second = self.products[:2]
+        popularity.write_counts({first.id: 2.0}, self.t0)
+        self.assertEqual(self.client.get('/api/shop/products/?sort=trending').json()[0]['id'], first.id)
+        # Flushes do not bump the catalog version.
+        popularity.write_counts({second.id: 5.0}, self.t0)
+        response = self.client.get('/api/shop/products/?sort=trending')
+        self.assertEqual(response.json()[0]['id'], second.id)
+        self.assertFalse(response.has_header('ETag'))
+
+    @override_settings(SHOP_TRENDING=True)
+    def test_views_and_cart_adds_are_counted(self):
+        counter = popularity.PopularityCounter()
+        user = User.objects.create_user('alice')
+        product = self.products[2]
+        with mock.patch.object(popularity, '_counter', counter), mock.patch.object(counter, '_start'):
+            self.client.get(f'/api/shop/products/{product.id}/')
+            self.client.get(f'/api/shop/products/{product.id}/')
+            self.client.get('/api/shop/products/999999/')
+            self.client.post('/api/shop/cart/add/', {'product_id': product.id}, content_type='application/json',
+                             HTTP_AUTHORIZATION=bearer(user))
+            self.assertEqual(counter._counts, {product.id: 7.0})
+            self.assertEqual(counter.flush(), 1)
+        self.assertAlmostEqual(popularity.current_score(self.trending(product)), 7.0, places=3)
+        self.assertEqual(counter.flush(), 0)
+
+
+class PrefixIndexTests(TestCase):
+    def test_best_scored_matches_first(self):
+        items = [{'text': text} for text in ('tea', 'teapot', 'team', 'tealight', 'ten', 'coffee')]
+        scores = [1.0, 5.0, 3.0, 5.0, 9.0, 7.0]
+        index = suggest.PrefixIndex([(item['text'], score, item) for item, score in zip(items, scores)])
+        # Equal scores come out in key order.
+        self.assertEqual(index.top('tea', 10), [items[3], items[1], items[2], items[0]])
+        self.assertEqual(index.top('tea', 2), [items[3], items[1]])
+        self.assertEqual(index.top('te', 1), [items[4]])
+        self.assertEqual(index.top('teab', 10), [])
+        self.assertEqual(index.top('', 10)[0], items[4])
+        self.assertEqual(suggest.PrefixIndex([]).top('tea', 10), [])
+
+    def test_items_keyed_more_than_once_are_listed_once(self):
+        green, black = {'text': 'Green Tea Leaf'}, {'text': 'Black Tea'}
+        entries = [(key, 4.0, green) for key in suggest.word_keys(green['text'])]
+        entries += [(key, 2.0, black) for key in suggest.word_keys(black['text'])]
+        index = suggest.PrefixIndex(entries)
+        self.assertEqual(index.top('t', 10), [green, black])
+        self.assertEqual(index.top('l', 10), [green])
+        self.assertEqual(index.top('green tea', 10), [green])
+
+
+class SuggestTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(setattr, suggest, '_index', suggest._index)
+        suggest._index = None
+        make_product('Green Tea', '5', brand='Leafy', rating=4.0)
+        make_product('green  TEA', '6', brand='Leafy', rating=4.5)
+        self.jasmine = make_product('Jasmine Green Tea', '5', brand='Teahouse', rating=3.0)
+        make_product('Teapot', '20', brand='Leafy', category='Teaware', rating=None)
+        make_product('Honey', '5', brand='Bees', category='Pantry', rating=5.0)
+
+    def suggest(self, q, **params):
+        response = self.client.get('/api/shop/suggest/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_prefixes_match_word_starts(self):
+        body = self.suggest('  TE')
+        # Names differing only in case and spacing are one suggestion,
+        # linking to the best rated product.
+        best_green = Product.objects.get(product='green  TEA')
+        self.assertEqual(body['products'], [
+            {'id': best_green.id, 'text': 'Green Tea'},
+            {'id': self.jasmine.id, 'text': 'Jasmine Green Tea'},
+            {'id': Product.objects.get(product='Teapot').id, 'text': 'Teapot'},
+        ])
+        self.assertEqual(body['brands'], [{'text': 'Teahouse'}])
+        self.assertEqual(body['categories'], [{'text': 'Tea'}, {'text': 'Teaware'}])
+        self.assertEqual(self.suggest('green t')['products'][0]['id'], best_green.id)
+        self.assertEqual(self.suggest('')['products'], [])
+
+    def test_limit(self):
+        self.assertEqual(len(self.suggest('t', limit=2)['products']), 2)
+        self.assertEqual(len(self.suggest('t', limit=0)['products']), 1)
+        self.assertEqual(len(self.suggest('t', limit=99)['products']), 3)
+        response = self.client.get('/api/shop/suggest/', {'q': 't', 'limit': 'many'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_catalog_changes_refresh_in_the_background(self):
+        self.assertEqual(self.suggest('hon')['products'][0]['text'], 'Honey')
+        with self.captureOnCommitCallbacks(execute=True):
+            make_product('Honeycomb', '9', rating=5.0)
+        versioning._remember(None, 0.0)
+        with mock.patch.object(suggest.threading, 'Thread') as thread:
+            # The stale index answers while the new one is built.
+            self.assertEqual(len(self.suggest('hon')['products']), 1)
+            self.assertEqual(len(self.suggest('hon')['products']), 1)
+        thread.assert_called_once()
+        with mock.patch.object(suggest.connections, 'close_all'):
+            thread.call_args.kwargs['target'](*thread.call_args.kwargs['args'])
+        self.assertEqual([item['text'] for item in self.suggest('hon')['products']], ['Honey', 'Honeycomb'])
+
+
+class BoughtTogetherTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = Path(self.use_temporary_dir('SHOP_BOUGHT_TOGETHER_DIR')) / 'counts.npz'
+        self.products = [make_product(f'Product {index}', '5') for index in range(6)]
+        self.users = [User.objects.create_user(f'user{index}') for index in range(5)]
+        self.carts = {0: [0, 1, 2], 1: [0, 1], 2: [0, 1, 3], 3: [2, 3], 4: [4]}
+        for user, products in self.carts.items():
+            self.add(user, *products)
+
+    def add(self, user, *products):
+        for index in products:
+            CartItem.objects.create(user=self.users[user], product=self.products[index])
+
+    def lists(self):
+        lists = defaultdict(list)
+        for row in BoughtTogether.objects.order_by('product_id', 'rank'):
+            lists[row.product_id].append((row.partner_id, row.count, round(row.score, 6)))
+        return dict(lists)
+
+    def expected(self, top_k, min_count):
+        """The lists recounted from the current carts, by brute force."""
+        carts = defaultdict(set)
+        for user_id, product_id in CartItem.objects.values_list('user_id', 'product_id'):
+            carts[user_id].add(product_id)
+        held = Counter(pk for cart in carts.values() for pk in cart)
+        lists = {}
+        for product_id in held:
+            together = Counter(pk for cart in carts.values() if product_id in cart for pk in cart - {product_id})
+            partners = sorted(
+                (-count / math.sqrt(held[product_id] * held[pk]), -count, pk)
+                for pk, count in together.items() if count >= min_count
+            )[:top_k]
+            if partners:
+                lists[product_id] = [(pk, -count, round(-score, 6)) for score, count, pk in partners]
+        return lists
+
+    def test_build(self):
+        summary = bought_together.build_bought_together(top_k=2, min_count=1)
+        self.assertEqual((summary['mode'], summary['cart_items']), ('full', 11))
+        self.assertEqual(self.lists(), self.expected(2, 1))
+        first, second = (p.id for p in self.products[:2])
+        self.assertEqual(self.lists()[first][0], (second, 3, 1.0))
+
+        bought_together.build_bought_together(top_k=20, min_count=2)
+        self.assertEqual(self.lists(), self.expected(20, 2))
+        self.assertNotIn(self.products[4].id, self.lists())
+
+    def test_incremental_build(self):
+        bought_together.build_bought_together(top_k=3, min_count=1)
+        self.assertEqual(bought_together.build_bought_together(top_k=3, min_count=1)['mode'], 'unchanged')
+        self.add(4, 2, 3)
+        self.add(1, 3)
+        self.products[5].delete()
+        summary = bought_together.build_bought_together(top_k=3, min_count=1)
+        self.assertEqual((summary['mode'], summary['cart_items']), ('incremental', 3))
+        self.assertEqual(self.lists(), self.expected(3, 1))
+        with np.load(self.path) as state:
+            self.assertEqual(int(state['watermark']), CartItem.objects.latest('id').id)
+        self.assertEqual(bought_together.build_bought_together(top_k=3, min_count=1)['mode'], 'unchanged')
+        # Other options rewrite every list from the stored counts.
+        self.assertEqual(bought_together.build_bought_together(top_k=1, min_count=2)['mode'], 'incremental')
+        self.assertEqual(self.lists(), self.expected(1, 2))
+
+    def test_removed_items_are_recounted(self):
+        bought_together.build_bought_together(top_k=3, min_count=1)
+        # Removed and added again under a new id: still counted once.
+        CartItem.objects.get(user=self.users[0], product=self.products[1]).delete()
+        self.add(0, 1)
+        CartItem.objects.get(user=self.users[2], product=self.products[3]).delete()
+        summary = bought_together.build_bought_together(top_k=3, min_count=1)
+        self.assertEqual((summary['mode'], summary['cart_items']), ('full', 10))
+        self.assertEqual(self.lists(), self.expected(3, 1))
+        self.add(2, 4)
+        summary = bought_together.build_bought_together(top_k=3, min_count=1)
+        self.assertEqual((summary['mode'], summary['cart_items']), ('incremental', 1))
+        self.assertEqual(self.lists(), self.expected(3, 1))
+
+    def test_endpoint(self):
+        bought_together.build_bought_together(top_k=20, min_count=1)
+        url = f'/api/shop/products/{self.products[3].id}/bought-together/'
+        ids = [row['id'] for row in self.client.get(url).json()]
+        self.assertEqual(ids, [pk for pk, _, _ in self.expected(20, 1)[self.products[3].id]])
+        body = self.client.get(url, {'limit': 1, 'fields': 'card'}).json()
+        self.assertEqual(len(body), 1)
+        self.assertEqual(set(body[0]), set(PRODUCT_PROJECTIONS['card']))
+        self.assertEqual(self.client.get(f'/api/shop/products/{self.products[5].id}/bought-together/').json(), [])
+        self.assertEqual(self.client.get('/api/shop/products/999999/bought-together/').status_code, 404)
+        self.assertEqual(self.client.get(url, {'limit': 'x'}).status_code, 400)
+
+
+class FieldSelectionTests(CatalogTestCase):
+    INTERNAL = ('category_lower', 'brand_lower', 'last_modified', 'trending')
+
+    def setUp(self):
+        super().setUp()
+        self.product = make_product('Green Tea', '5', market_price='8', description='Loose leaf')
+        popularity.write_counts({self.product.id: 1.0})
+
+    def keys(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        return list((body[0] if isinstance(body, list) else body))
+
+    def test_parse(self):
+        self.assertIsNone(parse_product_fields(''))
+        self.assertIsNone(parse_product_fields(' , '))
+        self.assertIsNone(parse_product_fields('all'))
+        self.assertEqual(parse_product_fields('card'), PRODUCT_PROJECTIONS['card'])
+        # Declaration order, duplicates dropped.
+        self.assertEqual(parse_product_fields(' rating,id , rating'), ('id', 'rating'))
+        for value in ('id,colour', *self.INTERNAL, 'id,trending'):
+            with self.subTest(value=value), self.assertRaises(InvalidFields):
+                parse_product_fields(value)
+
+    def test_serializer_returns_the_requested_fields(self):
+        full = ProductSerializer(self.product).data
+        self.assertFalse(set(full) & set(self.INTERNAL))
+        for fields in (('id',), ('id', 'sale_price', 'discount'), PRODUCT_PROJECTIONS['card']):
+            with self.subTest(fields=fields):
+                data = ProductSerializer(self.product, fields=fields).data
+                self.assertEqual(list(data), list(fields))
+                self.assertEqual(dict(data), {name: full[name] for name in fields})
+
+    def test_endpoints(self):
+        self.assertEqual(self.keys('/api/shop/products/'), list(product_field_names()))
+        for url, query in (('/api/shop/products/', {}), ('/api/shop/search/', {'q': 'tea'})):
+            with self.subTest(url=url):
+                self.assertEqual(self.keys(url, fields='product,id', **query), ['id', 'product'])
+                self.assertEqual(self.keys(url, fields='card', **query), list(PRODUCT_PROJECTIONS['card']))
+                # Unrequested columns are not read either.
+                for alias in caches:
+                    caches[alias].clear()
+                with CaptureQueriesContext(connection) as queries:
+                    self.keys(url, fields='card', **query)
+                selected = [q['sql'].split(' FROM ')[0] for q in queries if '"shop_product"' in q['sql']]
+                self.assertTrue(selected)
+                self.assertFalse([columns for columns in selected if '"description"' in columns])
+                for fields in self.INTERNAL:
+                    response = self.client.get(url, {'fields': fields, **query})
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn(fields, response.json()['error'])
+
+    @override_settings(SHOP_PRODUCT_LIST_FIELDS='card')
+    def test_listing_default(self):
+        self.assertEqual(self.keys('/api/shop/products/'), list(PRODUCT_PROJECTIONS['card']))
+        self.assertEqual(self.keys('/api/shop/products/', fields='all'), list(product_field_names()))
+        # Only listings default to the projection.
+        self.assertEqual(self.keys(f'/api/shop/products/{self.product.id}/'), list(product_field_names()))
+
+    def test_cart_products(self):
+        user = User.objects.create_user('alice')
+        response = self.client.post(
+            '/api/shop/cart/add/?fields=id,sale_price', {'product_id': self.product.id},
+            content_type='application/json', HTTP_AUTHORIZATION=bearer(user),
+        )
+        self.assertEqual(response.json()[0]['product'], {'id': self.product.id, 'sale_price': '5.00'})
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.CatalogReplicaRouter()
+
+    def with_replica(self):
+        databases = {'default': {}, routers.REPLICA: {}}
+        return mock.patch.object(routers, 'settings', mock.Mock(DATABASES=databases))
+
+    def test_catalog_reads_go_to_the_replica(self):
+        catalog = (Product, CatalogVersion, FacetCount, FacetedProduct, BoughtTogether)
+        with self.with_replica():
+            for model in catalog:
+                self.assertEqual(self.router.db_for_read(model), 'replica')
+            for model in (CartItem, CatalogJob, User):
+                self.assertIsNone(self.router.db_for_read(model))
+            self.assertEqual(Product.objects.all().db, 'replica')
+            self.assertEqual(CartItem.objects.filter(product__brand='Acme').db, 'default')
+        # Without a replica alias everything stays on the default database.
+        for model in catalog:
+            self.assertIsNone(self.router.db_for_read(model))
+        self.assertEqual(Product.objects.all().db, 'default')
+
+    def test_writes_go_to_the_default_database(self):
+        product = Product(id=1)
+        product._state.db = 'replica'
+        with self.with_replica():
+            self.assertEqual(router.db_for_write(Product, instance=product), 'default')
+            self.assertEqual(router.db_for_write(FacetCount), 'default')
+            self.assertIsNone(self.router.db_for_write(CartItem))
+
+    def test_relations_and_migrations(self):
+        cart, product = CartItem(), Product()
+        cart._state.db, product._state.db = 'default', 'replica'
+        self.assertTrue(self.router.allow_relation(cart, product))
+        product._state.db = 'archive'
+        self.assertIsNone(self.router.allow_relation(cart, product))
+        self.assertFalse(self.router.allow_migrate('replica', 'shop', 'product'))
+        self.assertIsNone(self.router.allow_migrate('default', 'shop', 'product'))
+
+
+class ListingIndexTests(CatalogTestCase):
+    FILTERS = ({}, {'category': 'TEA'}, {'brand': 'acme'}, {'category': 'tea', 'brand': 'Leafy'})
+
+    def setUp(self):
+        super().setUp()
+        specs = [
+            ('Tea', 'Acme', '5', 4.5), ('TEA', 'Leafy', '3', None), ('tea', 'ACME', '3', 4.5),
+            ('Food', 'Acme', '9', 2.0), ('Tea', 'leafy', '1', None), ('Food', 'Bees', '3', 3.0),
+            ('Tea', 'Acme', '7', 4.5), ('Tea', 'Leafy', '3', 1.0),
+        ]
+        for index, (category, brand, price, rating) in enumerate(specs):
+            make_product(f'Product {index}', price, brand=brand, category=category, rating=rating)
+
+    def expected(self, sort, filters):
+        field, descending, _ = views.PRODUCT_SORTS[sort]
+        products = [
+            p for p in Product.objects.all()
+            if all(getattr(p, name).lower() == value.lower() for name, value in filters.items())
+        ]
+        valued = sorted((p for p in products if getattr(p, field) is not None),
+                        key=lambda p: (getattr(p, field), p.id), reverse=descending)
+        unvalued = sorted((p for p in products if getattr(p, field) is None), key=lambda p: p.id, reverse=descending)
+        return [p.id for p in valued + unvalued]
+
+    def test_lower_columns_follow_writes(self):
+        product = make_product('Sencha', '5', brand='ACME Co', category='Loose TEA')
+        product.refresh_from_db()
+        self.assertEqual((product.category_lower, product.brand_lower), ('loose tea', 'acme co'))
+        Product.objects.filter(id=product.id).update(brand='Leafy LTD')
+        product.refresh_from_db()
+        self.assertEqual(product.brand_lower, 'leafy ltd')
+        Product.objects.bulk_create([
+            Product(product='Bulk', brand='BULK', category='Dry GOODS', market_price=1, sale_price=1),
+        ])
+        self.assertEqual(Product.objects.values_list('category_lower', 'brand_lower').get(product='Bulk'),
+                         ('dry goods', 'bulk'))
+
+    def test_filters_and_sorts(self):
+        for sort in views.PRODUCT_SORTS:
+            for filters in self.FILTERS:
+                with self.subTest(sort=sort, filters=filters):
+                    query = urlencode({'sort': sort, 'page_size': 3, **filters})
+                    pages, _ = self.walk(f'/api/shop/products/?{query}', 'next')
+                    self.assertEqual(sum(pages, []), self.expected(sort, filters))
+
+    @skipUnless(connection.vendor == 'sqlite', 'query plans are checked on SQLite')
+    def test_listing_queries_use_the_indexes(self):
+        for sort in views.PRODUCT_SORTS:
+            for filters in self.FILTERS:
+                with self.subTest(sort=sort, filters=filters):
+                    for alias in caches:
+                        caches[alias].clear()
+                    with CaptureQueriesContext(connection) as queries:
+                        self.client.get('/api/shop/products/', {'sort': sort, **filters})
+                    listings = [
+                        q['sql'] for q in queries if 'FROM "shop_product"' in q['sql'] and 'ORDER BY' in q['sql']
+                    ]
+                    self.assertTrue(listings)
+                    for sql in listings:
+                        with connection.cursor() as cursor:
+                            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                            plan = ' | '.join(row[-1] for row in cursor.fetchall())
+                        self.assertNotIn('TEMP B-TREE', plan)
+                        if sort or filters:
+                            self.assertRegex(plan, r'USING (COVERING )?INDEX shop_prod_')
+                        else:
+                            # In id (rowid) order.
+                            self.assertEqual(plan, 'SCAN shop_product')
@@ -0,0 +1,75 @@
+"""Catalog version: a counter bumped after every committed Product write."""
+import threading
+import time
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import F
+
+from .models import CatalogVersion
+
+_lock = threading.Lock()
+_cached_version = None
+_cached_at = 0.0
+
+
+def _ttl():
+    return getattr(settings, 'SHOP_CATALOG_VERSION_TTL', 1.0)
+
+
+def _memoised(now):
+    if _cached_version is not None and now - _cached_at < _ttl():
+        return _cached_version
+    return None
+
+
+def _remember(version, now):
+    global _cached_version, _cached_at
+    with _lock:
+        _cached_version = version or 0
+        _cached_at = now
+    return _cached_version
+
+
+def _version_query():
+    return CatalogVersion.objects.filter(pk=CatalogVersion.SINGLETON_ID).values_list('version', flat=True)
+
+
+def get_catalog_version():
+    now = time.monotonic()
+    version = _memoised(now)
+    if version is None:
+        version = _remember(_version_query().first(), now)
+    return version
+
+
+def read_catalog_version(using=None):
+    """The current version straight from the database, bypassing the memo."""
+    return _version_query().using(using).first() or 0
+
+
+async def aget_catalog_version():
+    now = time.monotonic()
+    version = _memoised(now)
+    if version is None:
+        version = _remember(await _version_query().afirst(), now)
+    return version
+
+
+def _bump(using):
+    global _cached_version, _cached_at
+    updated = CatalogVersion.objects.using(using).filter(pk=CatalogVersion.SINGLETON_ID).update(
+        version=F('version') + 1,
+    )
+    if not updated:
+        CatalogVersion.objects.using(using).get_or_create(pk=CatalogVersion.SINGLETON_ID, defaults={'version': 1})
+    # Forget the memoised value so this process sees its own write at once.
+    with _lock:
+        _cached_version = None
+        _cached_at = 0.0
+
+
+def bump_catalog_version(using=None):
+    """Bump the version once the current transaction commits."""
+    using = using or router.db_for_write(CatalogVersion)
+    transaction.on_commit(lambda: _bump(using), using=using)
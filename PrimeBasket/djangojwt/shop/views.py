@@ -1,90 +1,611 @@
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, content_negotiation_class, parser_classes, permission_classes
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from .models import Product, CartItem
-from .serializers import ProductSerializer, CartItemSerializer
-import pandas as pd
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum, Value, Window
+from django.db.models.functions import Greatest, Lower, Round
+from myapp.permissions import IsStaffUser
+from .models import CatalogJob, Product, CartItem
+from .serializers import InvalidFields, ProductSerializer, CartItemSerializer, CartSummarySerializer, CatalogJobSerializer, parse_product_fields
+from .search import get_search_backend
+from .suggest import load_suggest_index
+from .cache import cache_catalog_response
+from .export import InvalidExport, export_params, export_response, gzip_stream, stream_export
+from .facets import get_facets
+from . import jobs
+from .fast_serializers import can_use_fast_path, fast_json_response, get_product_plan
+from .pagination import InvalidCursor, build_page, decode_cursor, get_page_size, paginate_queryset
+from .popularity import counts_product_views, record_cart_add
+from .versioning import get_catalog_version
 
+# sort parameter -> (column, descending, nullable). Every listing is
+# ordered by (column, id) and backed by a (filters, column, id) index on
+# Product, which is what keyset pagination walks.
+PRODUCT_SORTS = {
+    '': ('id', False, False),
+    'price_asc': ('sale_price', False, False),
+    'price_desc': ('sale_price', True, False),
+    'rating_desc': ('rating', True, True),
+    'trending': ('trending', True, True),
+}
+# Sorts whose column changes without a catalog version bump (see
+# shop.popularity), which neither the catalog snapshot nor the response
+# cache therefore holds.
+VOLATILE_SORTS = ('trending',)
+
+def product_fields(request, listing=False):
+    """
+    ProductSerializer fields selected by ``?fields=``. Listing endpoints
+    fall back to ``SHOP_PRODUCT_LIST_FIELDS`` (a projection name).
+    """
+    default = getattr(settings, 'SHOP_PRODUCT_LIST_FIELDS', 'all') if listing else None
+    return parse_product_fields(request.GET.get('fields', default))
+
+def fields_params(request, listing=False):
+    try:
+        return product_fields(request, listing)
+    except InvalidFields:
+        # Answered with a 400, which is never cached.
+        return request.GET.get('fields')
+
+def filter_key(value):
+    """
+    ``value`` lower-cased as far as Python can match the database's LOWER(),
+    which computed category_lower/brand_lower: every database lower-cases
+    ASCII alike, but SQLite leaves other letters alone. Other values are
+    kept as given; lookups wrap keys in Lower() to finish the job.
+    """
+    return value.lower() if value.isascii() else value
+
+def filter_params(request):
+    """The ``category``/``brand`` filter keys (see filter_key), '' when not filtering."""
+    category = request.GET.get('category', '')
+    brand = request.GET.get('brand', '')
+    return {
+        'category': '' if category.lower() == 'all categories' else filter_key(category),
+        'brand': '' if brand.lower() == 'all brands' else filter_key(brand),
+    }
+
+def product_list_params(request):
+    sort = request.GET.get('sort', '')
+    if sort in VOLATILE_SORTS:
+        return None
+    return {
+        **filter_params(request),
+        'sort': sort if sort in PRODUCT_SORTS else '',
+        'cursor': request.GET.get('cursor', ''),
+        'page_size': get_page_size(request),
+        'fields': fields_params(request, listing=True),
+    }
+
+def search_params(request):
+    return {
+        'q': ' '.join(request.GET.get('q', '').lower().split()),
+        'cursor': request.GET.get('cursor', ''),
+        'page_size': get_page_size(request),
+        'fields': fields_params(request, listing=True),
+    }
+
+def filter_products(request):
+    """Products matching the ``category``/``brand`` filters of ``request``."""
+    category = request.GET.get('category', '')
+    brand = request.GET.get('brand', '')
+
+    products = Product.objects.all()
+    # Lower() on both sides keeps the comparison consistent with how the
+    # database computed category_lower/brand_lower.
+    if category and category.lower() != 'all categories':
+        products = products.filter(category_lower=Lower(Value(category)))
+    if brand and brand.lower() != 'all brands':
+        products = products.filter(brand_lower=Lower(Value(brand)))
+    return products
+
+def search_position(cursor):
+    """Decode a search cursor into ``(position, after)``."""
+    if not cursor:
+        return None, True
+    try:
+        score, pk, after = decode_cursor(cursor, 'search')
+        return (float(score), pk), after
+    except (TypeError, ValueError) as exc:
+        raise InvalidCursor('Invalid cursor') from exc
+
+def snapshot_slice(request, catalog_version, ordering, field, cursor, page_size):
+    """
+    The listing page located in the catalog snapshot (SHOP_SNAPSHOT_READS),
+    or None when the ORM has to answer: no snapshot, a stale one, or a
+    cursor from an older catalog.
+    """
+    # Imported here so numpy is only loaded by nodes serving snapshot reads.
+    from .snapshot import get_catalog_snapshot
+
+    snapshot = get_catalog_snapshot(catalog_version)
+    if snapshot is None:
+        return None
+    return snapshot.locate(ordering, field, cursor=cursor, page_size=page_size, **filter_params(request))
+
+@cache_catalog_response('products', product_list_params)
 @api_view(['GET'])
 def get_products(request):
-    category = request.GET.get('category', '').lower()
-    brand = request.GET.get('brand', '').lower()
     sort = request.GET.get('sort', '')
+    if sort not in PRODUCT_SORTS:
+        sort = ''
+    products = filter_products(request)
 
-    products = Product.objects.all()
-    if category and category != 'all categories':
-        products = products.filter(category__iexact=category)
-    if brand and brand != 'all brands':
-        products = products.filter(brand__iexact=brand)
-    if sort == 'price_asc':
-        products = products.order_by('sale_price')
-    elif sort == 'price_desc':
-        products = products.order_by('-sale_price')
-    elif sort == 'rating_desc':
-        products = products.order_by('-rating')
-
-    serializer = ProductSerializer(products[:50], many=True)
-    return Response(serializer.data)
+    try:
+        fields = product_fields(request, listing=True)
+    except InvalidFields as exc:
+        return Response({'error': str(exc)}, status=400)
+
+    field, descending, nullable = PRODUCT_SORTS[sort]
+    plan = get_product_plan(fields)
+    # Only the selected columns are read, plus the (sort value, id) pair
+    # the cursors are built from.
+    columns = list(dict.fromkeys((*plan.columns, 'id', field)))
+    fast = can_use_fast_path(request)
+    products = products.values(*columns) if fast else products.only(*columns)
+    ordering = sort or 'id'
+    cursor = request.GET.get('cursor')
+    page_size = get_page_size(request)
+
+    try:
+        page = None
+        if getattr(settings, 'SHOP_SNAPSHOT_READS', False):
+            located = snapshot_slice(request, get_catalog_version(), ordering, field, cursor, page_size)
+            if located is not None:
+                page = located.build_page(products.filter(id__in=located.ids), page_size, ordering, field)
+        if page is None:
+            page = paginate_queryset(products, ordering, field, descending, nullable, cursor=cursor, page_size=page_size)
+    except InvalidCursor as exc:
+        return Response({'error': str(exc)}, status=400)
 
+    if fast:
+        return fast_json_response(plan, page.rows, page.link_headers(request))
+    serializer = ProductSerializer(page.rows, many=True, fields=fields)
+    return Response(serializer.data, headers=page.link_headers(request))
+
+@cache_catalog_response('search', search_params)
 @api_view(['GET'])
 def search_products(request):
-    query = request.GET.get('q', '').lower()
-    if not query:
+    query = request.GET.get('q', '')
+    try:
+        fields = product_fields(request, listing=True)
+    except InvalidFields as exc:
+        return Response({'error': str(exc)}, status=400)
+    if not query.strip():
         return Response([])
-    
-    products = Product.objects.filter(
-        product__icontains=query) | Product.objects.filter(
-        brand__icontains=query) | Product.objects.filter(
-        category__icontains=query) | Product.objects.filter(
-        description__icontains=query)
-    
-    serializer = ProductSerializer(products[:50], many=True)
+
+    try:
+        position, after = search_position(request.GET.get('cursor'))
+    except InvalidCursor:
+        return Response({'error': 'Invalid cursor'}, status=400)
+
+    page_size = get_page_size(request)
+    hits = get_search_backend().search_page(query, page_size + 1, position, after)
+    page = build_page(hits, page_size, 'search', lambda hit: (hit[1], hit[0]), position, after)
+
+    product_ids = [pk for pk, _ in page.rows]
+    plan = get_product_plan(fields)
+    columns = list(dict.fromkeys((*plan.columns, 'id')))
+    if can_use_fast_path(request):
+        rows = {row['id']: row for row in Product.objects.filter(id__in=product_ids).values(*columns)}
+        ranked = [rows[pk] for pk in product_ids if pk in rows]
+        return fast_json_response(plan, ranked, page.link_headers(request))
+
+    products = Product.objects.only(*columns).in_bulk(product_ids)
+    ranked = [products[pk] for pk in product_ids if pk in products]
+
+    serializer = ProductSerializer(ranked, many=True, fields=fields)
+    return Response(serializer.data, headers=page.link_headers(request))
+
+@counts_product_views
+@cache_catalog_response('product', lambda request, product_id: {'id': product_id})
+@api_view(['GET'])
+def get_product(request, product_id):
+    product = Product.objects.filter(id=product_id).first()
+    if not product:
+        return Response({'error': 'Product not found'}, status=404)
+
+    serializer = ProductSerializer(product)
+    return Response(serializer.data)
+
+@cache_catalog_response('facets', filter_params)
+@api_view(['GET'])
+def product_facets(request):
+    return Response(get_facets(**filter_params(request)))
+
+def parse_suggest_limit(request):
+    """``limit`` of /api/shop/suggest/ (default 8, at most 20); None if invalid."""
+    try:
+        return min(max(int(request.GET.get('limit', 8)), 1), 20)
+    except ValueError:
+        return None
+
+@api_view(['GET'])
+def suggest(request):
+    limit = parse_suggest_limit(request)
+    if limit is None:
+        return Response({'error': 'limit must be an integer'}, status=400)
+    index = load_suggest_index(get_catalog_version())
+    return Response(index.suggest(request.GET.get('q', ''), limit))
+
+@api_view(['GET'])
+def similar_products(request, product_id):
+    # Imported here so numpy is only loaded by workers that serve
+    # recommendations, not by everything that resolves shop.urls.
+    from .recommendations import get_similar_products
+
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=400)
+
+    model = get_similar_products()
+    if model is None:
+        return Response({'error': 'Recommendations are not available yet'}, status=503)
+
+    neighbours = model.similar(product_id, limit=limit)
+    if not neighbours and not Product.objects.filter(id=product_id).exists():
+        return Response({'error': 'Product not found'}, status=404)
+
+    neighbour_ids = [pk for pk, _ in neighbours]
+    products = Product.objects.in_bulk(neighbour_ids)
+    ranked = [products[pk] for pk in neighbour_ids if pk in products]
+
+    serializer = ProductSerializer(ranked, many=True)
+    return Response(serializer.data)
+
+def parse_bought_together_limit(request):
+    """``limit`` of the bought-together endpoint (default 10, at most 50); None if invalid."""
+    try:
+        return min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        return None
+
+def bought_together_queryset(product_id):
+    """
+    Products most often carted with ``product_id``, best first: one lookup
+    on the (product, rank) index of BoughtTogether joined to Product.
+    """
+    return Product.objects.filter(bought_with__product_id=product_id).order_by('bought_with__rank')
+
+@api_view(['GET'])
+def bought_together_products(request, product_id):
+    limit = parse_bought_together_limit(request)
+    if limit is None:
+        return Response({'error': 'limit must be an integer'}, status=400)
+    try:
+        fields = product_fields(request)
+    except InvalidFields as exc:
+        return Response({'error': str(exc)}, status=400)
+
+    plan = get_product_plan(fields)
+    products = bought_together_queryset(product_id)
+    fast = can_use_fast_path(request)
+    if fast:
+        products = list(products.values(*plan.columns)[:limit])
+    else:
+        products = list(products.only(*plan.columns)[:limit])
+    if not products and not Product.objects.filter(id=product_id).exists():
+        return Response({'error': 'Product not found'}, status=404)
+
+    if fast:
+        return fast_json_response(plan, products)
+    serializer = ProductSerializer(products, many=True, fields=fields)
+    return Response(serializer.data)
+
+def parse_positive_int(value):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+class InvalidCartOperations(ValueError):
+    pass
+
+CART_OPERATIONS = ('add', 'remove', 'set')
+
+def parse_cart_operations(data):
+    """
+    The ``operations`` of a cart batch as ``(op, product_id, quantity)``
+    tuples. Raises InvalidCartOperations describing every invalid entry.
+    """
+    operations = data.get('operations')
+    max_operations = getattr(settings, 'SHOP_CART_BATCH_MAX', 100)
+    if not isinstance(operations, list) or not operations:
+        raise InvalidCartOperations('operations must be a non-empty list')
+    if len(operations) > max_operations:
+        raise InvalidCartOperations(f'At most {max_operations} operations per batch')
+
+    parsed, errors = [], []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            errors.append(f'operations[{index}]: must be an object')
+            continue
+        op = operation.get('op')
+        product_id = parse_positive_int(operation.get('product_id'))
+        quantity = parse_positive_int(operation.get('quantity', 1 if op == 'add' else None))
+        if op not in CART_OPERATIONS:
+            errors.append(f'operations[{index}]: op must be one of {", ".join(CART_OPERATIONS)}')
+        elif not product_id:
+            errors.append(f'operations[{index}]: Product ID is required')
+        elif op != 'remove' and not quantity:
+            errors.append(f'operations[{index}]: quantity must be a positive integer')
+        else:
+            parsed.append((op, product_id, quantity))
+    if errors:
+        raise InvalidCartOperations('; '.join(errors))
+    return parsed
+
+def record_cart_adds(operations):
+    for op, product_id, quantity in operations:
+        if op == 'add':
+            record_cart_add(product_id, quantity)
+
+def _apply_cart_operations(user_id, operations):
+    product_ids = {product_id for _, product_id, _ in operations}
+    with transaction.atomic():
+        items = {
+            item.product_id: item
+            for item in CartItem.objects.select_for_update()
+            .filter(user_id=user_id, product_id__in=product_ids).only('id', 'product_id', 'quantity')
+        }
+        # Fold the operations in order into the final quantity per product
+        # (None: not in the cart), then write only the difference.
+        quantities = {product_id: item.quantity for product_id, item in items.items()}
+        for op, product_id, quantity in operations:
+            if op == 'add':
+                quantities[product_id] = (quantities.get(product_id) or 0) + quantity
+            elif op == 'set':
+                quantities[product_id] = quantity
+            else:
+                quantities[product_id] = None
+
+        to_create, to_update, to_delete = [], [], []
+        for product_id, quantity in quantities.items():
+            item = items.get(product_id)
+            if item is None:
+                if quantity:
+                    to_create.append(CartItem(user_id=user_id, product_id=product_id, quantity=quantity))
+            elif quantity is None:
+                to_delete.append(item.pk)
+            elif quantity != item.quantity:
+                item.quantity = quantity
+                to_update.append(item)
+
+        if to_delete:
+            CartItem.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            CartItem.objects.bulk_update(to_update, ['quantity'])
+        if to_create:
+            CartItem.objects.bulk_create(to_create)
+
+def apply_cart_operations(user_id, operations):
+    """
+    Apply parsed cart ``operations`` for ``user_id`` in one transaction.
+    Returns the ids of added or set products that do not exist, in which
+    case nothing is applied.
+    """
+    wanted = {product_id for op, product_id, _ in operations if op != 'remove'}
+    missing = sorted(wanted - Product.objects.only('id').in_bulk(wanted).keys())
+    if missing:
+        return missing
+    try:
+        _apply_cart_operations(user_id, operations)
+    except IntegrityError:
+        # A concurrent request inserted one of the products first; the
+        # second pass sees its row and updates it instead.
+        _apply_cart_operations(user_id, operations)
+    return []
+
+def cart_items(user, fields=None):
+    # One query for the whole cart, bounded by this user's cart size.
+    items = CartItem.objects.filter(user_id=user.pk).select_related('product').order_by('id')
+    if fields is not None:
+        columns = get_product_plan(fields).columns
+        items = items.only('id', 'quantity', 'product', *(f'product__{column}' for column in columns))
+    return items
+
+def cart_response(user, fields=None):
+    serializer = CartItemSerializer(cart_items(user, fields), many=True, product_fields=fields)
     return Response(serializer.data)
 
+def cart_summary_queryset(user_id):
+    """
+    One row per cart line with its totals, and the cart totals repeated on
+    every row as window sums, so the whole summary is one query. Money is
+    computed in the database as decimals; SQLite has no decimal type and
+    computes in floating point, so amounts are rounded back to cents.
+    """
+    money = DecimalField(max_digits=14, decimal_places=2)
+    line_total = Round(ExpressionWrapper(F('quantity') * F('product__sale_price'), output_field=money), 2)
+    # A sale price above the market price saves nothing rather than a
+    # negative amount, as with Product.discount.
+    line_savings = Round(ExpressionWrapper(
+        F('quantity') * Greatest(F('product__market_price') - F('product__sale_price'), Value(0), output_field=money),
+        output_field=money,
+    ), 2)
+    return (
+        CartItem.objects.filter(user_id=user_id)
+        .annotate(
+            name=F('product__product'),
+            unit_price=F('product__sale_price'),
+            market_price=F('product__market_price'),
+            discount=F('product__discount'),
+            line_total=line_total,
+            line_savings=line_savings,
+        )
+        .annotate(
+            item_count=Window(Sum('quantity')),
+            subtotal=Round(Window(Sum('line_total')), 2),
+            savings=Round(Window(Sum('line_savings')), 2),
+        )
+        .order_by('id')
+        .values(
+            'product_id', 'name', 'quantity', 'unit_price', 'market_price', 'discount', 'line_total',
+            'line_savings', 'item_count', 'subtotal', 'savings',
+        )
+    )
+
+def cart_summary_data(rows):
+    """CartSummarySerializer input from the rows of ``cart_summary_queryset``."""
+    totals = rows[0] if rows else {'item_count': 0, 'subtotal': 0, 'savings': 0}
+    return {
+        'item_count': totals['item_count'],
+        'subtotal': totals['subtotal'],
+        'savings': totals['savings'],
+        'lines': rows,
+    }
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def cart_summary(request):
+    rows = list(cart_summary_queryset(request.user.pk))
+    return Response(CartSummarySerializer(cart_summary_data(rows)).data)
+
 @api_view(['POST'])
+@permission_classes([IsAuthenticated])
 def add_to_cart(request):
-    product_id = request.data.get('product_id')
+    try:
+        fields = product_fields(request)
+    except InvalidFields as exc:
+        return Response({'error': str(exc)}, status=400)
+    product_id = parse_positive_int(request.data.get('product_id'))
     if not product_id:
         return Response({'error': 'Product ID is required'}, status=400)
-    
-    product = Product.objects.filter(id=product_id).first()
-    if not product:
-        return Response({'error': 'Product not found'}, status=404)
-    
-    cart_item, created = CartItem.objects.get_or_create(product=product)
-    if not created:
-        cart_item.quantity += 1
-        cart_item.save()
-    
-    serializer = CartItemSerializer(CartItem.objects.all(), many=True)
-    return Response(serializer.data)
+
+    items = CartItem.objects.filter(user_id=request.user.pk, product_id=product_id)
+    # Increment in SQL so concurrent adds cannot lose an update; only the
+    # first add of a product needs the existence check and the insert.
+    if not items.update(quantity=F('quantity') + 1):
+        if not Product.objects.filter(id=product_id).exists():
+            return Response({'error': 'Product not found'}, status=404)
+        try:
+            with transaction.atomic():
+                CartItem.objects.create(user_id=request.user.pk, product_id=product_id)
+        except IntegrityError:
+            # Another request inserted the row first.
+            items.update(quantity=F('quantity') + 1)
+
+    record_cart_add(product_id)
+    return cart_response(request.user, fields)
 
 @api_view(['POST'])
+@permission_classes([IsAuthenticated])
 def remove_from_cart(request):
-    product_id = request.data.get('product_id')
+    try:
+        fields = product_fields(request)
+    except InvalidFields as exc:
+        return Response({'error': str(exc)}, status=400)
+    product_id = parse_positive_int(request.data.get('product_id'))
     if not product_id:
         return Response({'error': 'Product ID is required'}, status=400)
-    
-    CartItem.objects.filter(product_id=product_id).delete()
-    
-    serializer = CartItemSerializer(CartItem.objects.all(), many=True)
-    return Response(serializer.data)
+
+    CartItem.objects.filter(user_id=request.user.pk, product_id=product_id).delete()
+
+    return cart_response(request.user, fields)
 
 @api_view(['POST'])
+@permission_classes([IsAuthenticated])
 def update_cart_quantity(request):
-    product_id = request.data.get('product_id')
-    quantity = request.data.get('quantity')
+    try:
+        fields = product_fields(request)
+    except InvalidFields as exc:
+        return Response({'error': str(exc)}, status=400)
+    product_id = parse_positive_int(request.data.get('product_id'))
+    quantity = parse_positive_int(request.data.get('quantity'))
     if not product_id or not quantity:
         return Response({'error': 'Product ID and quantity are required'}, status=400)
-    
-    cart_item = CartItem.objects.filter(product_id=product_id).first()
-    if not cart_item:
+
+    updated = CartItem.objects.filter(user_id=request.user.pk, product_id=product_id).update(quantity=quantity)
+    if not updated:
         return Response({'error': 'Product not found in cart'}, status=404)
-    
-    cart_item.quantity = quantity
-    cart_item.save()
-    
-    serializer = CartItemSerializer(CartItem.objects.all(), many=True)
-    return Response(serializer.data)
\ No newline at end of file
+
+    return cart_response(request.user, fields)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_update_cart(request):
+    try:
+        fields = product_fields(request)
+        operations = parse_cart_operations(request.data)
+    except (InvalidFields, InvalidCartOperations) as exc:
+        return Response({'error': str(exc)}, status=400)
+
+    missing = apply_cart_operations(request.user.pk, operations)
+    if missing:
+        return Response({'error': 'Product not found', 'product_ids': missing}, status=404)
+
+    record_cart_adds(operations)
+    return cart_response(request.user, fields)
+
+class ExportNegotiation(DefaultContentNegotiation):
+    """Always JSON for errors: ``?format=`` names the export format, not a renderer."""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@content_negotiation_class(ExportNegotiation)
+def export_catalog(request):
+    try:
+        fmt, since = export_params(request)
+    except InvalidExport as exc:
+        return Response({'error': str(exc)}, status=400)
+    return export_response(request, fmt, stream_export(fmt, since), gzip_stream)
+
+def job_response(job, status=200):
+    response = Response(CatalogJobSerializer(job).data, status=status)
+    response['Location'] = f'/api/shop/catalog/jobs/{job.pk}/'
+    return response
+
+def parse_flag(value, default):
+    if value in (None, ''):
+        return default
+    return str(value).lower() not in ('0', 'false', 'no', 'off')
+
+@api_view(['POST'])
+@permission_classes([IsStaffUser])
+@parser_classes([MultiPartParser])
+def import_catalog(request):
+    limit = jobs.get_import_max_bytes()
+    too_large = Response({'error': f'The upload is larger than {limit} bytes'}, status=413)
+    # Checked before the body is read, so an oversized upload is not
+    # spooled to disk first; chunked uploads are checked once parsed.
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    if limit is not None and content_length > limit:
+        return too_large
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({'error': 'A CSV file is required in the "file" field'}, status=400)
+    if limit is not None and upload.size > limit:
+        return too_large
+    options = {'upsert': parse_flag(request.data.get('upsert'), True)}
+    job = jobs.enqueue_import(upload, options, user_id=request.user.pk)
+    return job_response(job, status=202)
+
+@api_view(['POST'])
+@permission_classes([IsStaffUser])
+@parser_classes([JSONParser, FormParser])
+def catalog_jobs(request):
+    kind = request.data.get('kind')
+    if kind not in jobs.REBUILDS:
+        return Response({'error': f'kind must be one of: {", ".join(jobs.REBUILDS)}'}, status=400)
+    job = jobs.enqueue(kind, {'full': parse_flag(request.data.get('full'), False)}, user_id=request.user.pk)
+    return job_response(job, status=202)
+
+@api_view(['GET'])
+@permission_classes([IsStaffUser])
+def catalog_job(request, job_id):
+    job = CatalogJob.objects.filter(id=job_id).first()
+    if job is None:
+        return Response({'error': 'Job not found'}, status=404)
+    return job_response(job)